@@ -0,0 +1,214 @@
+# author: sawyer-shi
+
+"""Local MinIO-style stand-in for S3-compatible object storage.
+
+Implements the calls the result sink makes: PUT object, multipart upload
+(create, upload part, complete, abort), plus GET/HEAD object. It checks the
+access key of each signed request and that ``x-amz-content-sha256`` matches
+the body; signatures themselves are not verified. Run it standalone with
+``python -m bench.object_store --port 9000``.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+STATS_ROUTE = "/__stats"
+
+
+class ObjectStore:
+    def __init__(self, access_key: str) -> None:
+        self.access_key = access_key
+        self._lock = threading.Lock()
+        self.objects: dict[str, tuple[int, str]] = {}
+        # Only part sizes and digests are kept, so large uploads do not pile up in memory.
+        self._uploads: dict[str, dict[int, tuple[int, str]]] = {}
+        self.stats: dict[str, int] = {
+            "put_object": 0,
+            "multipart_started": 0,
+            "parts": 0,
+            "multipart_completed": 0,
+            "multipart_aborted": 0,
+            "largest_request_bytes": 0,
+            "rejected": 0,
+        }
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def observe_request(self, size: int) -> None:
+        with self._lock:
+            self.stats["largest_request_bytes"] = max(self.stats["largest_request_bytes"], size)
+
+    def store(self, path: str, size: int, etag: str) -> str:
+        with self._lock:
+            self.objects[path] = (size, etag)
+        return etag
+
+    def start_upload(self) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return upload_id
+
+    def add_part(self, upload_id: str, number: int, data: bytes) -> Optional[str]:
+        with self._lock:
+            parts = self._uploads.get(upload_id)
+            if parts is None:
+                return None
+            parts[number] = (len(data), hashlib.md5(data).hexdigest())
+        return parts[number][1]
+
+    def complete(self, upload_id: str, path: str) -> Optional[str]:
+        with self._lock:
+            parts = self._uploads.pop(upload_id, None)
+        if parts is None:
+            return None
+        ordered = [parts[number] for number in sorted(parts)]
+        digest = hashlib.md5(b"".join(bytes.fromhex(etag) for _, etag in ordered)).hexdigest()
+        return self.store(path, sum(size for size, _ in ordered), f"{digest}-{len(parts)}")
+
+    def abort(self, upload_id: str) -> bool:
+        with self._lock:
+            return self._uploads.pop(upload_id, None) is not None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ObjectStoreStub/1.0"
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, kept-alive connections stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    @property
+    def store(self) -> ObjectStore:
+        return self.server.store  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[dict[str, str]] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, code: str) -> None:
+        self.store.count("rejected")
+        self._send(status, f"<Error><Code>{code}</Code></Error>".encode("utf-8"), {"Content-Type": "application/xml"})
+
+    def _read(self) -> Optional[bytes]:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.store.observe_request(len(body))
+        credential = (self.headers.get("Authorization") or "").partition("Credential=")[2].split("/", 1)[0]
+        if credential != self.store.access_key:
+            self._error(403, "InvalidAccessKeyId")
+            return None
+        if self.headers.get("x-amz-content-sha256") != hashlib.sha256(body).hexdigest():
+            self._error(400, "XAmzContentSHA256Mismatch")
+            return None
+        return body
+
+    def _target(self) -> tuple[str, dict[str, list[str]]]:
+        parts = urlsplit(self.path)
+        return unquote(parts.path), parse_qs(parts.query, keep_blank_values=True)
+
+    def do_GET(self) -> None:
+        path, _ = self._target()
+        if path == STATS_ROUTE:
+            self._send(200, json.dumps(self.store.stats).encode("utf-8"), {"Content-Type": "application/json"})
+            return
+        entry = self.store.objects.get(path)
+        if entry is None:
+            self._error(404, "NoSuchKey")
+            return
+        self._send(200, b"", {"ETag": f'"{entry[1]}"', "x-object-size": str(entry[0])})
+
+    do_HEAD = do_GET
+
+    def do_PUT(self) -> None:
+        path, query = self._target()
+        body = self._read()
+        if body is None:
+            return
+        if "uploadId" in query:
+            etag = self.store.add_part(query["uploadId"][0], int(query["partNumber"][0]), body)
+            if etag is None:
+                self._error(404, "NoSuchUpload")
+                return
+            self.store.count("parts")
+        else:
+            etag = self.store.store(path, len(body), hashlib.md5(body).hexdigest())
+            self.store.count("put_object")
+        self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self) -> None:
+        path, query = self._target()
+        if self._read() is None:
+            return
+        if "uploads" in query:
+            upload_id = self.store.start_upload()
+            self.store.count("multipart_started")
+            body = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+        elif "uploadId" in query:
+            etag = self.store.complete(query["uploadId"][0], path)
+            if etag is None:
+                self._error(404, "NoSuchUpload")
+                return
+            self.store.count("multipart_completed")
+            body = f'<CompleteMultipartUploadResult><ETag>"{etag}"</ETag></CompleteMultipartUploadResult>'
+        else:
+            self._error(400, "InvalidRequest")
+            return
+        self._send(200, body.encode("utf-8"), {"Content-Type": "application/xml"})
+
+    def do_DELETE(self) -> None:
+        _, query = self._target()
+        if self._read() is None:
+            return
+        if "uploadId" in query and self.store.abort(query["uploadId"][0]):
+            self.store.count("multipart_aborted")
+        self._send(204)
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+def create_server(access_key: str, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    server = _Server((host, port), _Handler)
+    server.daemon_threads = True
+    server.store = ObjectStore(access_key)  # type: ignore[attr-defined]
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local S3-compatible object store stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--access-key", default="bench-s3-access-key")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.access_key, args.host, args.port)
+    logger.info("Object store listening on http://%s:%d", args.host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
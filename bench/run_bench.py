@@ -0,0 +1,463 @@
+# author: sawyer-shi
+
+"""End-to-end benchmark that drives every tool's ``_invoke`` against the simulator.
+
+Usage (from the repository root)::
+
+    python -m bench.run_bench --iterations 50 --concurrency 4 --latency lognormal:40:0.6
+
+The simulator runs in a child process so its CPU and memory stay out of the
+numbers. Peak RSS is the process high-water mark after each tool has run, so
+it only ever grows across the report.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from bench.simulator import STATS_ROUTE, add_config_arguments
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS = {"access_key": "bench-access-key", "secret_key": "bench-secret-key-0123456789abcdef0123"}
+S3_ACCESS_KEY = "bench-s3-access-key"
+
+
+# Simulator origin the synthetic files claim to be hosted on (``--media-urls``).
+MEDIA_BASE_URL: Optional[str] = None
+
+
+class SyntheticFile:
+    """Minimal stand-in for a Dify file object; like Dify's, ``blob`` is only loaded when read."""
+
+    def __init__(self, size: int, name: str = "reference.png", url: Optional[str] = None) -> None:
+        self.size = size
+        self.filename = name
+        self.mime_type = "image/png"
+        self.url = url
+
+    @property
+    def blob(self) -> bytes:
+        return b"\x89PNG\r\n\x1a\n" + os.urandom(max(self.size - 8, 0))
+
+
+def _image(size: int) -> SyntheticFile:
+    url = f"{MEDIA_BASE_URL}/media/ref-{os.urandom(4).hex()}.png" if MEDIA_BASE_URL else None
+    return SyntheticFile(size, url=url)
+
+
+# Ids returned by a create tool, made once per run so query scenarios have something real to look up.
+_seeded_ids: dict[str, str] = {}
+
+PIPELINE_STAGES = json.dumps(
+    [
+        {"tool": "omni_image", "params": {"prompt": "A lighthouse on a cliff at dawn"}},
+        {"tool": "image_2_video", "params": {"model_name": "kling-v2-6", "prompt": "Waves crash below"}},
+    ]
+)
+
+
+def _seeded_id(args: argparse.Namespace, module_name: str, class_name: str, parameters: dict[str, Any], key: str) -> str:
+    """``key`` from the JSON result of one ``module_name`` invocation, cached for the run."""
+    if module_name not in _seeded_ids:
+        tool = _load_tool(module_name, class_name, _credentials(args))
+        for message in tool._invoke(parameters):
+            json_object = getattr(message.message, "json_object", None)
+            if isinstance(json_object, dict) and json_object.get(key):
+                _seeded_ids[module_name] = json_object[key]
+        if module_name not in _seeded_ids:
+            raise RuntimeError(f"{module_name} returned no {key} to seed the query scenario")
+    return _seeded_ids[module_name]
+
+
+SCENARIOS: dict[str, tuple[str, Callable[[argparse.Namespace], dict[str, Any]]]] = {
+    "text_2_video_create": (
+        "Text2VideoCreateTool",
+        lambda args: {"prompt": "A corgi surfing at sunset", "model_name": "kling-v2-6", "duration": "5"},
+    ),
+    "text_2_video_query": ("Text2VideoQueryTool", lambda args: {"task_id": "bench", "download_video": "true"}),
+    "image_2_video_create": (
+        "Image2VideoCreateTool",
+        lambda args: {"image": _image(args.reference_bytes), "prompt": "Slow zoom in", "model_name": "kling-v2-6"},
+    ),
+    "image_2_video_query": ("Image2VideoQueryTool", lambda args: {"task_id": "bench", "download_video": "true"}),
+    "omni_video_create": (
+        "OmniVideoCreateTool",
+        lambda args: {
+            "prompt": "<<<image_1>>> walks through a neon city",
+            "image_list": [_image(args.reference_bytes) for _ in range(4)],
+        },
+    ),
+    "omni_video_query": ("OmniVideoQueryTool", lambda args: {"task_id": "bench", "download_video": "true"}),
+    "omni_image_create": (
+        "OmniImageCreateTool",
+        lambda args: {
+            "prompt": "Merge <<<image_1>>> to <<<image_9>>> into one poster",
+            "image_list": [_image(args.reference_bytes) for _ in range(9)],
+        },
+    ),
+    "omni_image_query": ("OmniImageQueryTool", lambda args: {"task_id": "bench", "download_image": "true"}),
+    "image_generation_create": (
+        "ImageGenerationCreateTool",
+        lambda args: {"prompt": "A watercolor fox", "image": _image(args.reference_bytes), "n": 1},
+    ),
+    "image_generation_query": (
+        "ImageGenerationQueryTool",
+        lambda args: {"task_id": "bench", "download_image": "true"},
+    ),
+    "element_create": (
+        "ElementCreateTool",
+        lambda args: {
+            "element_name": "hero",
+            "element_description": "Main character",
+            "reference_type": "image_refer",
+            "element_frontal_image": _image(args.reference_bytes),
+            "element_refer_images": [_image(args.reference_bytes) for _ in range(3)],
+        },
+    ),
+    "element_query": ("ElementQueryTool", lambda args: {"task_id": "bench"}),
+    "element_delete": ("ElementDeleteTool", lambda args: {"element_id": "880000000000000001"}),
+    "element_batch_create": (
+        "ElementBatchCreateTool",
+        lambda args: {
+            "elements": json.dumps(
+                [
+                    {
+                        "element_name": f"hero-{idx}",
+                        "element_description": "Main character",
+                        "reference_type": "image_refer",
+                        "element_frontal_image": f"file:{idx}",
+                        "element_refer_images": [f"file:{idx}"],
+                    }
+                    for idx in range(4)
+                ]
+            ),
+            "element_images": [_image(args.reference_bytes) for _ in range(4)],
+        },
+    ),
+    "storyboard_create": (
+        "StoryboardCreateTool",
+        lambda args: {
+            "shots": json.dumps(
+                [{"prompt": f"Shot {idx}: a lighthouse keeper at dawn", "duration": 5} for idx in range(1, 6)]
+                + [{"prompt": "Shot 6: the storm rolls in", "duration": 15}]
+            ),
+            "model_name": "kling-v2-6",
+        },
+    ),
+    "element_batch_delete": (
+        "ElementBatchDeleteTool",
+        lambda args: {"element_ids": ",".join(str(880000000000000001 + idx) for idx in range(4))},
+    ),
+    "element_lookup": ("ElementLookupTool", lambda args: {"element_name": "hero"}),
+    "storyboard_query": (
+        "StoryboardQueryTool",
+        lambda args: {
+            "job_id": _seeded_id(
+                args,
+                "storyboard_create",
+                "StoryboardCreateTool",
+                {"shots": json.dumps([{"prompt": "A lighthouse keeper at dawn", "duration": 5}] * 3)},
+                "job_id",
+            )
+        },
+    ),
+    "pipeline_create": ("PipelineCreateTool", lambda args: {"stages": PIPELINE_STAGES}),
+    "pipeline_query": (
+        "PipelineQueryTool",
+        lambda args: {
+            "pipeline_id": _seeded_id(
+                args, "pipeline_create", "PipelineCreateTool", {"stages": PIPELINE_STAGES}, "pipeline_id"
+            )
+        },
+    ),
+    "submission_queue_query": ("SubmissionQueueQueryTool", lambda args: {}),
+}
+
+# Settings a scenario needs regardless of the bench-wide flags: lookups only read the element registry.
+SCENARIO_ENV: dict[str, dict[str, str]] = {"element_lookup": {"KLING_ELEMENT_REGISTRY": "1"}}
+
+
+@dataclass
+class ToolResult:
+    tool: str
+    iterations: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    throughput_rps: float
+    messages_per_call: float
+    peak_rss_mib: float
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mib() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and KiB elsewhere.
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_simulator(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "bench.simulator",
+        "--port", str(port),
+        "--latency", args.latency,
+        "--download-latency", args.download_latency,
+        "--rate-429", str(args.rate_429),
+        "--rate-5xx", str(args.rate_5xx),
+        "--video-bytes", str(args.video_bytes),
+        "--image-bytes", str(args.image_bytes),
+        "--pending-polls", str(args.pending_polls),
+        "--processing-ms", str(args.processing_ms),
+        "--key-concurrency", str(args.key_concurrency),
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    return _spawn(command, port, "Simulator")
+
+
+def start_object_store() -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    command = [sys.executable, "-m", "bench.object_store", "--port", str(port), "--access-key", S3_ACCESS_KEY]
+    return _spawn(command, port, "Object store")
+
+
+def _spawn(command: list[str], port: int, name: str) -> tuple[subprocess.Popen, str]:
+    process = subprocess.Popen(command, cwd=ROOT_DIR, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{name} did not start within 10s")
+
+
+def fetch_stats(base_url: str) -> dict[str, Any]:
+    """Counters of the simulator at ``base_url``; empty when it cannot be reached."""
+    try:
+        with urllib.request.urlopen(base_url + STATS_ROUTE, timeout=5) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def _credentials(args: argparse.Namespace) -> dict[str, Any]:
+    """Bench credentials, with ``--key-pool`` - 1 synthetic extra key pairs and the ``--s3`` bucket."""
+    credentials = dict(CREDENTIALS)
+    extra = [f"bench-pool-key-{i}:bench-pool-secret-{i}-0123456789abcdef" for i in range(1, max(args.key_pool, 1))]
+    if extra:
+        credentials["key_pool"] = ",".join(extra)
+    if args.s3_url:
+        credentials.update(
+            s3_endpoint=f"{args.s3_url}/bench-results", s3_access_key=S3_ACCESS_KEY, s3_secret_key="bench-s3-secret"
+        )
+    return credentials
+
+
+def _load_tool(module_name: str, class_name: str, credentials: Optional[dict[str, Any]] = None):
+    module = importlib.import_module(f"tools.{module_name}")
+    return getattr(module, class_name).from_credentials(credentials or CREDENTIALS)
+
+
+def _invoke_once(tool, parameters: dict[str, Any]) -> tuple[float, int, bool]:
+    started = time.perf_counter()
+    count = 0
+    failed = False
+    for message in tool._invoke(parameters):
+        count += 1
+        text = getattr(message.message, "text", "")
+        if isinstance(text, str) and text.startswith("❌"):
+            failed = True
+        json_object = getattr(message.message, "json_object", None)
+        if isinstance(json_object, dict) and json_object.get("success") is False:
+            failed = True
+    return time.perf_counter() - started, count, failed
+
+
+def run_tool(name: str, args: argparse.Namespace) -> ToolResult:
+    overrides = SCENARIO_ENV.get(name, {})
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        return _run_scenario(name, args)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _run_scenario(name: str, args: argparse.Namespace) -> ToolResult:
+    class_name, build_parameters = SCENARIOS[name]
+    tool = _load_tool(name, class_name, _credentials(args))
+    parameter_sets = [build_parameters(args) for _ in range(args.iterations)]
+    for parameters in parameter_sets:
+        parameters["output_mode"] = args.output_mode
+        if args.s3_url and name.endswith("_query"):
+            parameters["result_sink"] = "s3"
+
+    for parameters in parameter_sets[: args.warmup]:
+        _invoke_once(tool, parameters)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(lambda parameters: _invoke_once(tool, parameters), parameter_sets))
+    elapsed = time.perf_counter() - started
+
+    latencies = [duration * 1000 for duration, _, _ in outcomes]
+    return ToolResult(
+        tool=name,
+        iterations=len(outcomes),
+        errors=sum(1 for _, _, failed in outcomes if failed),
+        p50_ms=round(_percentile(latencies, 50), 2),
+        p99_ms=round(_percentile(latencies, 99), 2),
+        mean_ms=round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        throughput_rps=round(len(outcomes) / elapsed, 2) if elapsed else 0.0,
+        messages_per_call=round(statistics.fmean(count for _, count, _ in outcomes), 1) if outcomes else 0.0,
+        peak_rss_mib=round(_peak_rss_mib(), 1),
+    )
+
+
+def print_report(results: list[ToolResult]) -> None:
+    header = f"{'tool':<26}{'n':>6}{'err':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'msgs':>7}{'rss MiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result.tool:<26}{result.iterations:>6}{result.errors:>6}{result.p50_ms:>10.2f}"
+            f"{result.p99_ms:>10.2f}{result.throughput_rps:>10.2f}{result.messages_per_call:>7.1f}"
+            f"{result.peak_rss_mib:>10.1f}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> list[ToolResult]:
+    parser = argparse.ArgumentParser(description="Benchmark every Kling tool against the local simulator")
+    parser.add_argument("--tools", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output-mode", default="verbose", choices=["verbose", "compact", "compact_log"])
+    parser.add_argument("--reference-bytes", type=int, default=512 * 1024, help="Size of each synthetic input image")
+    parser.add_argument("--base-url", default=None, help="Use an already running simulator instead of spawning one")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--metrics", action="store_true", help="Print the plugin's Prometheus metrics afterwards")
+    parser.add_argument(
+        "--element-registry",
+        action="store_true",
+        help="Keep the local element registry on (repeated element queries are then served locally)",
+    )
+    parser.add_argument(
+        "--singleflight",
+        action="store_true",
+        help="Keep create de-duplication on (identical bench payloads then share one task)",
+    )
+    parser.add_argument(
+        "--task-poller",
+        action="store_true",
+        help="Turn the background task poller on (queries of polled tasks are then served locally)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Send Kling API calls through the pooled httpx client (HTTP/2 where the server offers it)",
+    )
+    parser.add_argument(
+        "--s3",
+        action="store_true",
+        help="Stream query results to a local S3 stand-in instead of returning them as blobs",
+    )
+    parser.add_argument(
+        "--media-urls",
+        action="store_true",
+        help="Give the synthetic input files hosted URLs so they are passed by URL instead of base64",
+    )
+    parser.add_argument(
+        "--key-pool", type=int, default=1, help="Number of key pairs to spread creates over (1 = primary only)"
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        process, base_url = start_simulator(args)
+    store_process = None
+    args.s3_url = None
+    if args.s3:
+        store_process, args.s3_url = start_object_store()
+    # The tools read the base URL at import time, so set it before loading them.
+    os.environ["KLING_API_BASE_URL"] = base_url
+    if not args.singleflight:
+        os.environ["KLING_SINGLEFLIGHT"] = "0"
+    if not args.element_registry:
+        os.environ["KLING_ELEMENT_REGISTRY"] = "0"
+    os.environ["KLING_TASK_POLLER"] = "1" if args.task_poller else "0"
+    if args.http2:
+        os.environ["KLING_HTTP2"] = "1"
+    # Pipelines, queue jobs and key pins go to a throwaway database unless one is configured.
+    if not (os.environ.get("KLING_STATE_DB") or os.environ.get("KLING_QUEUE_DB")):
+        os.environ["KLING_STATE_DB"] = os.path.join(tempfile.mkdtemp(prefix="kling-bench-"), "state.db")
+    if args.media_urls:
+        global MEDIA_BASE_URL
+        MEDIA_BASE_URL = base_url
+        # The simulator is on loopback, which the default "auto" policy never hands to Kling.
+        os.environ["KLING_MEDIA_POLICY"] = "*=url"
+
+    server_stats: dict[str, Any] = {}
+    try:
+        results = [run_tool(name, args) for name in args.tools]
+        server_stats = fetch_stats(base_url)
+    finally:
+        for child in (process, store_process):
+            if child:
+                child.terminate()
+                child.wait(timeout=5)
+
+    print_report(results)
+    if server_stats:
+        print(
+            f"\nsimulator: {server_stats.get('requests', 0)} requests over "
+            f"{server_stats.get('connections', 0)} connections"
+        )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump([asdict(result) for result in results], handle, indent=2)
+    if args.metrics:
+        from tools.metrics import render_prometheus
+
+        print(render_prometheus())
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+# author: sawyer-shi
+
+"""Local stand-in for the Kling API.
+
+Serves every endpoint the tools call (create, query, element create/query and
+delete) plus synthetic media downloads, with configurable latency and 429/5xx
+injection. Run it standalone with ``python -m bench.simulator --port 8790`` and
+point the plugin at it through ``KLING_API_BASE_URL=http://127.0.0.1:8790``.
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CREATE_ROUTES = {
+    "/v1/videos/text2video": "video",
+    "/v1/videos/image2video": "video",
+    "/v1/videos/omni-video": "video",
+    "/v1/images/omni-image": "image",
+    "/v1/images/generations": "image",
+    "/v1/general/advanced-custom-elements": "element",
+}
+DELETE_ROUTE = "/v1/general/delete-elements"
+MEDIA_PREFIX = "/media/"
+STATS_ROUTE = "/__stats"
+
+_QUERY_PATTERN = re.compile(
+    r"^(?P<route>" + "|".join(re.escape(route) for route in CREATE_ROUTES) + r")/(?P<task_id>[^/?]+)$"
+)
+_MEDIA_HEADERS = {
+    "mp4": ("video/mp4", b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"),
+    "png": ("image/png", b"\x89PNG\r\n\x1a\n"),
+}
+_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class LatencyModel:
+    """Latency distribution in milliseconds.
+
+    Specs look like ``fixed:20``, ``uniform:10:80`` or ``lognormal:40:0.6``
+    (median and sigma).
+    """
+
+    kind: str = "fixed"
+    params: tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, rest = spec.partition(":")
+        params = tuple(float(part) for part in rest.split(":") if part) or (0.0,)
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        return cls(kind=kind, params=params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            low, high = self.params
+            value = rng.uniform(low, high)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = median * rng.lognormvariate(0.0, sigma)
+        else:
+            value = self.params[0]
+        return max(value, 0.0) / 1000.0
+
+
+@dataclass
+class SimulatorConfig:
+    api_latency: LatencyModel = field(default_factory=LatencyModel)
+    download_latency: LatencyModel = field(default_factory=LatencyModel)
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    video_bytes: int = 2 * 1024 * 1024
+    image_bytes: int = 256 * 1024
+    pending_polls: int = 0
+    processing_ms: int = 0
+    key_concurrency: int = 0
+    seed: Optional[int] = None
+
+
+class KlingSimulator:
+    """Thread-safe task store and response factory behind the HTTP handler."""
+
+    def __init__(self, config: SimulatorConfig) -> None:
+        self.config = config
+        self.base_url = ""
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._tasks: dict[tuple[str, str], dict[str, Any]] = {}
+        self._external_ids: dict[tuple[str, str], str] = {}
+        self._element_ids = itertools.count(880000000000000001)
+        self._filler = random.Random(0).randbytes(_CHUNK_SIZE)
+        self.stats: dict[str, int] = {
+            "requests": 0,
+            "connections": 0,
+            "creates": 0,
+            "queries": 0,
+            "deletes": 0,
+            "downloads": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "injected_429": 0,
+            "injected_5xx": 0,
+            "key_limited_429": 0,
+        }
+        self._in_flight: dict[str, int] = {}
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def api_delay(self) -> float:
+        with self._lock:
+            return self.config.api_latency.sample(self._rng)
+
+    def download_delay(self) -> float:
+        with self._lock:
+            return self.config.download_latency.sample(self._rng)
+
+    def injected_error(self) -> Optional[int]:
+        with self._lock:
+            roll = self._rng.random()
+            if roll < self.config.rate_429:
+                self.stats["injected_429"] += 1
+                return 429
+            if roll < self.config.rate_429 + self.config.rate_5xx:
+                self.stats["injected_5xx"] += 1
+                return self._rng.choice((500, 502, 503))
+        return None
+
+    def enter_account(self, account: str) -> bool:
+        """Claim a create slot for ``account``; False when its concurrency limit is reached."""
+        with self._lock:
+            in_flight = self._in_flight.get(account, 0)
+            if self.config.key_concurrency and in_flight >= self.config.key_concurrency:
+                self.stats["key_limited_429"] += 1
+                return False
+            self._in_flight[account] = in_flight + 1
+            self.stats[f"creates_by_{account}"] = self.stats.get(f"creates_by_{account}", 0) + 1
+            return True
+
+    def leave_account(self, account: str) -> None:
+        with self._lock:
+            self._in_flight[account] = max(self._in_flight.get(account, 1) - 1, 0)
+
+    def create_task(self, route: str, payload: dict[str, Any]) -> dict[str, Any]:
+        now = int(time.time() * 1000)
+        task = {
+            "task_id": uuid.uuid4().hex,
+            "route": route,
+            "kind": CREATE_ROUTES[route],
+            "payload": {key: value for key, value in payload.items() if isinstance(value, (str, int, float, bool))},
+            "created_at": now,
+            "polls": 0,
+        }
+        with self._lock:
+            self._tasks[(route, task["task_id"])] = task
+            external_task_id = payload.get("external_task_id")
+            if external_task_id:
+                self._external_ids[(route, str(external_task_id))] = task["task_id"]
+            self.stats["creates"] += 1
+        return {
+            "task_id": task["task_id"],
+            "task_status": "submitted",
+            "task_info": {"external_task_id": payload.get("external_task_id")},
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def query_task(self, route: str, task_id: str) -> dict[str, Any]:
+        with self._lock:
+            task_id = self._external_ids.get((route, task_id), task_id)
+            task = self._tasks.get((route, task_id))
+            if task is None:
+                # Unknown ids are answered as finished tasks so query tools can
+                # be benchmarked without a preceding create.
+                task = {
+                    "task_id": task_id,
+                    "route": route,
+                    "kind": CREATE_ROUTES[route],
+                    "payload": {},
+                    "created_at": int(time.time() * 1000),
+                    "polls": self.config.pending_polls,
+                }
+                self._tasks[(route, task_id)] = task
+            task["polls"] += 1
+            polls = task["polls"]
+            self.stats["queries"] += 1
+
+        now = int(time.time() * 1000)
+        data: dict[str, Any] = {
+            "task_id": task["task_id"],
+            "task_status": "succeed",
+            "task_status_msg": "",
+            "created_at": task["created_at"],
+            "updated_at": now,
+        }
+        if polls <= self.config.pending_polls or now - task["created_at"] < self.config.processing_ms:
+            data["task_status"] = "processing"
+            return data
+        data["task_result"] = self._task_result(task)
+        return data
+
+    def _task_result(self, task: dict[str, Any]) -> dict[str, Any]:
+        kind = task["kind"]
+        task_id = task["task_id"]
+        if kind == "video":
+            return {
+                "videos": [
+                    {
+                        "id": f"{task_id}-0",
+                        "url": f"{self.base_url}{MEDIA_PREFIX}{task_id}-0.mp4",
+                        "duration": str(task["payload"].get("duration", "5")),
+                    }
+                ]
+            }
+        if kind == "image":
+            count = int(task["payload"].get("n", 1) or 1)
+            images = [
+                {"index": idx, "url": f"{self.base_url}{MEDIA_PREFIX}{task_id}-{idx}.png"}
+                for idx in range(count)
+            ]
+            result: dict[str, Any] = {"images": images}
+            if task["payload"].get("result_type") == "series":
+                result = {"series_images": images}
+            return result
+        with self._lock:
+            element_id = next(self._element_ids)
+        return {
+            "elements": [
+                {
+                    "element_id": element_id,
+                    "element_name": task["payload"].get("element_name", "simulated"),
+                    "element_description": task["payload"].get("element_description", ""),
+                    "reference_type": task["payload"].get("reference_type", "image_refer"),
+                    "owned_by": "creator",
+                    "status": "succeed",
+                }
+            ]
+        }
+
+    def media(self, name: str) -> tuple[str, bytes, int]:
+        extension = name.rsplit(".", 1)[-1]
+        mime_type, header = _MEDIA_HEADERS.get(extension, ("application/octet-stream", b""))
+        size = self.config.video_bytes if extension == "mp4" else self.config.image_bytes
+        return mime_type, header, max(size, len(header))
+
+    def iter_media(self, header: bytes, size: int):
+        yield header
+        remaining = size - len(header)
+        while remaining > 0:
+            chunk = self._filler[: min(remaining, _CHUNK_SIZE)]
+            remaining -= len(chunk)
+            yield chunk
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "KlingSimulator/1.0"
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, kept-alive connections stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    @property
+    def simulator(self) -> KlingSimulator:
+        return self.server.simulator  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def setup(self) -> None:
+        super().setup()
+        self.simulator.count("connections")
+
+    def do_GET(self) -> None:
+        simulator = self.simulator
+        simulator.count("requests")
+        path = self.path.split("?", 1)[0]
+
+        if path == STATS_ROUTE:
+            self._send_json(200, dict(simulator.stats))
+            return
+
+        if path.startswith(MEDIA_PREFIX):
+            time.sleep(simulator.download_delay())
+            mime_type, header, size = simulator.media(path[len(MEDIA_PREFIX):])
+            self.send_response(200)
+            self.send_header("Content-Type", mime_type)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            for chunk in simulator.iter_media(header, size):
+                self.wfile.write(chunk)
+            simulator.count("downloads")
+            simulator.count("bytes_out", size)
+            return
+
+        if path in CREATE_ROUTES:
+            # Task list, as used to validate extra key pairs without creating tasks.
+            if self._admit():
+                self._send_json(200, self._envelope([]))
+            return
+
+        match = _QUERY_PATTERN.match(path)
+        if not match:
+            self._send_json(404, {"code": 1203, "message": f"Unknown path {path}"})
+            return
+        if not self._admit():
+            return
+        data = simulator.query_task(match.group("route"), match.group("task_id"))
+        self._send_json(200, self._envelope(data))
+
+    def do_HEAD(self) -> None:
+        # Connection warm-up probes; answered like an unknown path but without a body.
+        self.simulator.count("head_requests")
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        simulator = self.simulator
+        simulator.count("requests")
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        simulator.count("bytes_in", len(body))
+
+        if path not in CREATE_ROUTES and path != DELETE_ROUTE:
+            self._send_json(404, {"code": 1203, "message": f"Unknown path {path}"})
+            return
+        account = self._account()
+        if path in CREATE_ROUTES and not simulator.enter_account(account):
+            self._send_json(429, {"code": 1303, "message": "Parallel task limit exceeded (simulated)"})
+            return
+        try:
+            self._create_or_delete(path, body)
+        finally:
+            if path in CREATE_ROUTES:
+                simulator.leave_account(account)
+
+    def _account(self) -> str:
+        """The ``iss`` claim of the bearer token, read without verifying the signature."""
+        token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+        try:
+            segment = token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+            return str(claims.get("iss") or "anonymous")
+        except (IndexError, ValueError):
+            return "anonymous"
+
+    def _create_or_delete(self, path: str, body: bytes) -> None:
+        simulator = self.simulator
+        if not self._admit():
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"code": 1201, "message": "Invalid JSON body"})
+            return
+
+        if path == DELETE_ROUTE:
+            if not payload.get("element_id"):
+                self._send_json(400, {"code": 1201, "message": "element_id is required"})
+                return
+            simulator.count("deletes")
+            self._send_json(200, self._envelope({"task_id": uuid.uuid4().hex, "task_status": "succeed"}))
+            return
+
+        if path != "/v1/general/advanced-custom-elements" and not (
+            payload.get("model_name") or payload.get("prompt")
+        ):
+            self._send_json(400, {"code": 1201, "message": "model_name or prompt is required"})
+            return
+        self._send_json(200, self._envelope(simulator.create_task(path, payload)))
+
+    def _admit(self) -> bool:
+        """Apply auth, latency and error injection shared by API routes."""
+        simulator = self.simulator
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            self._send_json(401, {"code": 1000, "message": "Authorization header is missing"})
+            return False
+        time.sleep(simulator.api_delay())
+        status = simulator.injected_error()
+        if status == 429:
+            self._send_json(429, {"code": 1302, "message": "Rate limit exceeded (simulated)"})
+            return False
+        if status:
+            self._send_text(status, "Upstream error (simulated)")
+            return False
+        return True
+
+    @staticmethod
+    def _envelope(data: Any) -> dict[str, Any]:
+        return {"code": 0, "message": "SUCCEED", "request_id": uuid.uuid4().hex, "data": data}
+
+    def _send_json(self, status: int, body: dict[str, Any]) -> None:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self._send_raw(status, raw, "application/json")
+
+    def _send_text(self, status: int, text: str) -> None:
+        self._send_raw(status, text.encode("utf-8"), "text/plain; charset=utf-8")
+
+    def _send_raw(self, status: int, raw: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+        self.simulator.count("bytes_out", len(raw))
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops SYNs under bench concurrency and adds 1s retransmits.
+    request_queue_size = 128
+
+
+def create_server(config: SimulatorConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    server = _Server((host, port), _Handler)
+    server.daemon_threads = True
+    simulator = KlingSimulator(config)
+    simulator.base_url = f"http://{host}:{server.server_address[1]}"
+    server.simulator = simulator  # type: ignore[attr-defined]
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="fixed:20", help="API latency spec, e.g. lognormal:40:0.6")
+    parser.add_argument("--download-latency", default="fixed:5", help="Media download latency spec")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of API calls answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of API calls answered with 5xx")
+    parser.add_argument("--video-bytes", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--image-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--pending-polls", type=int, default=0, help="Queries answered 'processing' first")
+    parser.add_argument(
+        "--processing-ms", type=int, default=0, help="Tasks are answered 'processing' until this old"
+    )
+    parser.add_argument(
+        "--key-concurrency", type=int, default=0, help="Concurrent creates allowed per access key (0 = unlimited)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> SimulatorConfig:
+    return SimulatorConfig(
+        api_latency=LatencyModel.parse(args.latency),
+        download_latency=LatencyModel.parse(args.download_latency),
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        video_bytes=args.video_bytes,
+        image_bytes=args.image_bytes,
+        pending_polls=args.pending_polls,
+        processing_ms=args.processing_ms,
+        key_concurrency=args.key_concurrency,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Kling API simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(config_from_args(args), args.host, args.port)
+    logger.info("Kling simulator listening on %s", server.simulator.base_url)  # type: ignore[attr-defined]
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
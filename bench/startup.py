@@ -0,0 +1,99 @@
+# author: sawyer-shi
+
+"""Cold-start benchmark: import time, plugin construction and first-invoke latency.
+
+Each run happens in a fresh interpreter so module caches start empty::
+
+    python -m bench.startup --runs 10 --tool omni_image_create
+
+Reported phases are ``import dify_plugin`` (the SDK floor), building the
+``Plugin`` in ``main.py`` (which loads the provider and all tool modules),
+the first ``_invoke`` against the simulator and a second, warm ``_invoke``.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Optional
+
+from bench.run_bench import ROOT_DIR, SCENARIOS, start_simulator
+from bench.simulator import add_config_arguments
+
+MARKER = "KLING_STARTUP "
+
+_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import dify_plugin
+t1 = time.perf_counter()
+import main
+t2 = time.perf_counter()
+sys.argv = ["startup"]
+from bench.run_bench import SCENARIOS, _invoke_once, _load_tool
+import argparse
+args = argparse.Namespace(reference_bytes={reference_bytes})
+class_name, build = SCENARIOS[{tool!r}]
+tool = _load_tool({tool!r}, class_name)
+first, _, _ = _invoke_once(tool, build(args))
+second, _, _ = _invoke_once(tool, build(args))
+modules = len(sys.modules)
+print({marker!r} + json.dumps({{
+    "import_sdk_ms": (t1 - t0) * 1000,
+    "build_plugin_ms": (t2 - t1) * 1000,
+    "first_invoke_ms": first * 1000,
+    "second_invoke_ms": second * 1000,
+    "modules_loaded": modules,
+}}), flush=True)
+"""
+
+
+def _run_child(tool: str, base_url: str, reference_bytes: int) -> dict[str, float]:
+    env = dict(os.environ, KLING_API_BASE_URL=base_url)
+    code = _CHILD.format(tool=tool, reference_bytes=reference_bytes, marker=MARKER)
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError(f"Startup run failed:\n{completed.stderr[-2000:]}")
+
+
+def main(argv: Optional[list[str]] = None) -> dict[str, float]:
+    parser = argparse.ArgumentParser(description="Measure plugin cold start and first-invoke time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tool", default="text_2_video_create", choices=list(SCENARIOS))
+    parser.add_argument("--reference-bytes", type=int, default=512 * 1024)
+    parser.add_argument("--base-url", default=None, help="Use an already running simulator instead of spawning one")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        process, base_url = start_simulator(args)
+    try:
+        runs = [_run_child(args.tool, base_url, args.reference_bytes) for _ in range(args.runs)]
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=5)
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 2) for key in runs[0]}
+    print(f"{'phase':<20}{'median':>12}")
+    print("-" * 32)
+    for key, value in summary.items():
+        print(f"{key:<20}{value:>12.2f}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# author: sawyer-shi
+
+from collections.abc import Mapping
+
+from dify_plugin import Endpoint
+from werkzeug import Request, Response
+
+from tools.metrics import render_prometheus
+
+
+class MetricsEndpoint(Endpoint):
+    def _invoke(self, r: Request, values: Mapping, settings: Mapping) -> Response:
+        """Expose plugin request metrics in Prometheus text format."""
+        token = settings.get("metrics_token")
+        if token and r.headers.get("Authorization") != f"Bearer {token}":
+            return Response("Unauthorized", status=401, content_type="text/plain")
+        return Response(
+            render_prometheus(),
+            status=200,
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
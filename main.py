@@ -2,7 +2,13 @@
 
 from dify_plugin import Plugin, DifyPluginEnv
 
-plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
+from tools.deadline import MAX_REQUEST_TIMEOUT
+from tools.submission_queue import resume_pending
+from tools.warmup import schedule_warmup
+
+plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=MAX_REQUEST_TIMEOUT))
 
 if __name__ == '__main__':
+    schedule_warmup()
+    resume_pending()
     plugin.run()
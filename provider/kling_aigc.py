@@ -1,11 +1,31 @@
 # author: sawyer-shi
 
+import importlib
+import os
+import time
 from typing import Any
 
 import requests
 from dify_plugin import ToolProvider
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
 
+API_BASE_URL = os.environ.get("KLING_API_BASE_URL", "https://api-beijing.klingai.com").rstrip("/")
+
+_jwt_module = None
+
+
+def _load_jwt():
+    """Import PyJWT on first use and keep it for later calls."""
+    global _jwt_module
+    if _jwt_module is None:
+        try:
+            _jwt_module = importlib.import_module("jwt")
+        except ImportError as exc:
+            raise ToolProviderCredentialValidationError(
+                "PyJWT is required. Please install dependencies."
+            ) from exc
+    return _jwt_module
+
 
 class KlingAigcProvider(ToolProvider):
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
@@ -22,6 +42,9 @@ class KlingAigcProvider(ToolProvider):
                 raise ToolProviderCredentialValidationError("Failed to generate API token")
 
             self._test_kling_connection(api_token)
+            self._validate_key_pool(credentials)
+            self._validate_object_storage(credentials)
+            self._schedule_warmup()
         except ToolProviderCredentialValidationError:
             raise
         except Exception as e:
@@ -29,18 +52,38 @@ class KlingAigcProvider(ToolProvider):
                 f"Credential validation failed: {str(e)}"
             )
 
-    @staticmethod
-    def _encode_jwt_token(access_key: str, secret_key: str) -> str:
-        import time
+    def _validate_key_pool(self, credentials: dict[str, Any]) -> None:
+        from tools.key_pool import parse_key_pool
 
-        import importlib
+        try:
+            pairs = parse_key_pool(credentials)
+        except ValueError as exc:
+            raise ToolProviderCredentialValidationError(f"Invalid key pool: {exc}")
+        for index, pair in enumerate(pairs[1:], start=1):
+            try:
+                self._test_read_access(self._encode_jwt_token(pair.access_key, pair.secret_key))
+            except ToolProviderCredentialValidationError as exc:
+                raise ToolProviderCredentialValidationError(f"Key pool entry {index}: {exc}")
+
+    def _validate_object_storage(self, credentials: dict[str, Any]) -> None:
+        if not any(credentials.get(name) for name in ("s3_endpoint", "s3_access_key", "s3_secret_key")):
+            return
+        from tools.object_sink import s3_target
 
         try:
-            jwt = importlib.import_module("jwt")
-        except ImportError as exc:
-            raise ToolProviderCredentialValidationError(
-                "PyJWT is required. Please install dependencies."
-            ) from exc
+            s3_target(credentials)
+        except ValueError as exc:
+            raise ToolProviderCredentialValidationError(f"Invalid object storage settings: {exc}")
+
+    @staticmethod
+    def _schedule_warmup() -> None:
+        from tools.warmup import schedule_warmup
+
+        schedule_warmup()
+
+    @staticmethod
+    def _encode_jwt_token(access_key: str, secret_key: str) -> str:
+        jwt = _load_jwt()
 
         headers = {
             "alg": "HS256",
@@ -54,7 +97,7 @@ class KlingAigcProvider(ToolProvider):
         return jwt.encode(payload, secret_key, headers=headers)
 
     def _test_kling_connection(self, api_token: str) -> None:
-        url = "https://api-beijing.klingai.com/v1/videos/text2video"
+        url = f"{API_BASE_URL}/v1/videos/text2video"
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_token}",
@@ -101,6 +144,35 @@ class KlingAigcProvider(ToolProvider):
                 )
 
 
+    def _test_read_access(self, api_token: str) -> None:
+        """Check a key with a one-item task list request, which creates nothing and costs nothing."""
+        url = f"{API_BASE_URL}/v1/videos/text2video"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_token}",
+        }
+        try:
+            response = requests.get(url, headers=headers, params={"pageNum": 1, "pageSize": 1}, timeout=10)
+        except requests.RequestException as req_err:
+            raise ToolProviderCredentialValidationError(
+                f"Unable to reach Kling AI service: {req_err}"
+            )
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        message = data.get("message") or response.text
+        # 1000-1004 are Kling's authentication failures; a 429 still means the key was accepted.
+        if response.status_code in (401, 403) or data.get("code") in (1000, 1001, 1002, 1003, 1004):
+            raise ToolProviderCredentialValidationError(
+                f"Kling AI authentication failed: {message}"
+            )
+        if response.status_code not in (200, 429):
+            raise ToolProviderCredentialValidationError(
+                f"Kling AI API error {response.status_code}: {message}"
+            )
+
     @staticmethod
     def get_api_token(credentials: dict[str, Any]) -> str:
         access_key = credentials.get("access_key")
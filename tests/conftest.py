@@ -0,0 +1,64 @@
+# author: sawyer-shi
+
+import os
+import sys
+import tempfile
+from typing import Any
+
+import pytest
+
+from bench.run_bench import CREDENTIALS, _free_port, _spawn
+
+_processes: list[Any] = []
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Start the local Kling simulator before any tool module is imported (they read the base URL then)."""
+    port = _free_port()
+    process, base_url = _spawn([sys.executable, "-m", "bench.simulator", "--port", str(port)], port, "Simulator")
+    _processes.append(process)
+    os.environ["KLING_API_BASE_URL"] = base_url
+    os.environ["KLING_STATE_KEY"] = "test-state-key"
+    os.environ["KLING_TASK_POLLER"] = "0"
+    os.environ.setdefault("KLING_STATE_DB", os.path.join(tempfile.mkdtemp(prefix="kling-tests-"), "state.db"))
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    for process in _processes:
+        process.kill()
+        process.wait()
+
+
+@pytest.fixture(autouse=True)
+def state_db(tmp_path, monkeypatch) -> str:
+    """A fresh local database per test."""
+    path = str(tmp_path / "state.db")
+    monkeypatch.setenv("KLING_STATE_DB", path)
+    return path
+
+
+@pytest.fixture
+def base_url() -> str:
+    return os.environ["KLING_API_BASE_URL"]
+
+
+@pytest.fixture
+def account_a() -> dict[str, Any]:
+    return dict(CREDENTIALS)
+
+
+@pytest.fixture
+def account_b() -> dict[str, Any]:
+    return {"access_key": "other-access-key", "secret_key": "other-secret-key-0123456789abcdef0123"}
+
+
+class StubTool:
+    """The part of a Dify tool the shared helpers use: ``runtime.credentials``."""
+
+    def __init__(self, credentials: dict[str, Any]) -> None:
+        self.runtime = type("Runtime", (), {"credentials": credentials})()
+
+
+@pytest.fixture
+def tool_a(account_a) -> StubTool:
+    return StubTool(account_a)
@@ -0,0 +1,73 @@
+# author: sawyer-shi
+
+import pytest
+import requests
+
+from tools.adaptive_limit import CONGESTED, NEUTRAL, OK, AdaptiveLimiter, adaptive_slot, get_limiter
+
+
+def _limiter(initial: float = 4, maximum: float = 64) -> AdaptiveLimiter:
+    return AdaptiveLimiter("text2video", "create", "account", initial, maximum)
+
+
+def test_success_raises_the_limit_by_one_per_round():
+    limiter = _limiter()
+    for _ in range(4):
+        limiter.release(limiter.acquire(), OK)
+
+    assert limiter.limit == pytest.approx(5, abs=0.1)
+
+
+def test_congestion_halves_the_limit_once_per_burst():
+    limiter = _limiter(initial=8)
+    burst = [limiter.acquire() for _ in range(3)]
+    for started in burst:
+        limiter.release(started, CONGESTED)
+
+    assert limiter.limit == 4
+    limiter.release(limiter.acquire(), CONGESTED)
+    assert limiter.limit == 2
+
+
+def test_limit_stays_within_bounds():
+    limiter = _limiter(initial=1, maximum=2)
+    for _ in range(10):
+        limiter.release(limiter.acquire(), CONGESTED)
+    assert limiter.limit == 1
+    for _ in range(20):
+        limiter.release(limiter.acquire(), OK)
+    assert limiter.limit == 2
+
+
+def test_neutral_outcome_leaves_the_limit_alone():
+    limiter = _limiter()
+    limiter.release(limiter.acquire(), NEUTRAL)
+
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    ("status", "change"),
+    [(200, 1), (201, 1), (400, 0), (404, 0), (500, 0), (429, -1)],
+)
+def test_only_2xx_counts_as_success(status, change):
+    account = f"status-{status}"
+    before = get_limiter("text2video", "create", account).limit
+
+    with adaptive_slot("text2video", "create", account) as slot:
+        slot.status = status
+
+    after = get_limiter("text2video", "create", account).limit
+    assert (after > before) - (after < before) == change
+
+
+def test_timeout_counts_as_congestion():
+    account = "status-timeout"
+    before = get_limiter("text2video", "create", account).limit
+
+    with pytest.raises(requests.exceptions.Timeout):
+        with adaptive_slot("text2video", "create", account):
+            raise requests.exceptions.Timeout()
+
+    assert get_limiter("text2video", "create", account).limit == before / 2
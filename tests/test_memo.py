@@ -0,0 +1,65 @@
+# author: sawyer-shi
+
+import pytest
+
+from tools import memo
+from tools.memo import load_memo, record_task_outcome, save_memo
+from tools.task_poller import TASK_CACHE, publish_task
+
+ENDPOINT = "text2video"
+KEY = "memo_test_entry"
+
+
+@pytest.fixture(autouse=True)
+def memo_dir(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("KLING_MEMO_DIR", str(tmp_path / "memo"))
+    TASK_CACHE.clear()
+
+
+def _created(task_id: str) -> dict:
+    return {"code": 0, "data": {"task_id": task_id, "task_status": "submitted"}}
+
+
+def _forget_process_state() -> None:
+    """Drop what only this process knows, as another process or a restart would see it."""
+    with memo._task_memos_lock:
+        memo._task_memos.clear()
+
+
+def test_failure_recorded_elsewhere_invalidates_the_memo(tool_a):
+    save_memo(tool_a, KEY, _created("task-1"))
+    _forget_process_state()
+
+    record_task_outcome(tool_a, "task-1", "failed", None)
+
+    assert load_memo(tool_a, KEY, ENDPOINT) is None
+
+
+def test_known_failure_drops_the_memo_on_a_hit(tool_a, account_a):
+    save_memo(tool_a, KEY, _created("task-2"))
+    failed = {"code": 0, "data": {"task_id": "task-2", "task_status": "failed"}}
+    publish_task(account_a, ENDPOINT, "v1/videos/text2video", "task-2", failed)
+
+    assert load_memo(tool_a, KEY, ENDPOINT) is None
+    # The entry is gone for good, not just skipped once.
+    TASK_CACHE.clear()
+    assert load_memo(tool_a, KEY, ENDPOINT) is None
+
+
+def test_success_is_stored_in_the_durable_entry(tool_a):
+    save_memo(tool_a, KEY, _created("task-3"))
+    _forget_process_state()
+    result = {"videos": [{"url": "https://cdn.example.com/task-3.mp4"}]}
+
+    record_task_outcome(tool_a, "task-3", "succeed", result)
+
+    memoized = load_memo(tool_a, KEY, ENDPOINT)
+    assert memoized["data"]["task_id"] == "task-3"
+    assert memoized["data"]["task_status"] == "succeed"
+    assert memoized["data"]["task_result"] == result
+
+
+def test_unfinished_memo_is_served(tool_a):
+    save_memo(tool_a, KEY, _created("task-4"))
+
+    assert load_memo(tool_a, KEY, ENDPOINT)["data"]["task_id"] == "task-4"
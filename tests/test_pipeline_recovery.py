@@ -0,0 +1,97 @@
+# author: sawyer-shi
+
+import copy
+import sqlite3
+import time
+
+import pytest
+
+from bench.run_bench import fetch_stats
+from tools import pipeline
+from tools.pipeline import STAGE_SUBMIT_SECONDS, create_pipeline, parse_stages, recover_stages
+
+STAGES = [
+    {"tool": "image_generation", "params": {"model_name": "kling-v1", "prompt": "a lighthouse at dusk"}},
+    {"tool": "image_2_video", "params": {"model_name": "kling-v1", "prompt": "waves roll in"}},
+]
+
+
+@pytest.fixture
+def running(tool_a, monkeypatch):
+    """A two-stage pipeline whose first stage is submitted; the background worker is kept out."""
+    monkeypatch.setattr(pipeline.WORKER, "put", lambda work: None)
+    created = create_pipeline(tool_a, parse_stages(copy.deepcopy(STAGES)))
+    assert created["stages"][0]["status"] == "submitted"
+    return created["pipeline_id"]
+
+
+def _restart() -> None:
+    """Forget everything this process holds, as a restart would."""
+    with pipeline._lock:
+        pipeline._pipelines.clear()
+        pipeline._credentials.clear()
+
+
+def _rewrite(pipeline_id: str, change) -> None:
+    data = pipeline._load(pipeline_id)
+    change(data)
+    pipeline._save(data)
+    _restart()
+
+
+def test_pending_stage_after_a_succeeded_one_is_submitted(running, base_url):
+    # Crash between saving stage 1 as succeeded and queueing stage 2.
+    def finish_first(data):
+        data["stages"][0].update(status="succeed", result_urls=["https://cdn.example.com/first.png"])
+
+    _rewrite(running, finish_first)
+    creates = fetch_stats(base_url)["creates"]
+
+    recover_stages(running)
+
+    second = pipeline._load(running)["stages"][1]
+    assert second["status"] == "submitted"
+    assert second["task_id"]
+    assert fetch_stats(base_url)["creates"] == creates + 1
+
+
+def test_stale_submitting_stage_is_found_by_external_task_id(running, base_url):
+    # Crash after the create request reached Kling but before the response was saved.
+    def stall_first(data):
+        stalled_at = time.time() - STAGE_SUBMIT_SECONDS - 1
+        data["stages"][0].update(status="submitting", task_id=None, submitting_at=stalled_at)
+
+    _rewrite(running, stall_first)
+    creates = fetch_stats(base_url)["creates"]
+
+    recover_stages(running)
+
+    first = pipeline._load(running)["stages"][0]
+    assert first["status"] == "submitted"
+    assert first["task_id"]
+    assert fetch_stats(base_url)["creates"] == creates
+
+
+def test_recent_submitting_stage_is_left_alone(running):
+    def submitting_now(data):
+        data["stages"][0].update(status="submitting", task_id=None, submitting_at=time.time())
+
+    _rewrite(running, submitting_now)
+
+    recover_stages(running)
+
+    assert pipeline._load(running)["stages"][0]["status"] == "submitting"
+
+
+def test_credentials_are_sealed_and_dropped_when_finished(running, state_db, account_a):
+    def read():
+        with sqlite3.connect(state_db) as conn:
+            return conn.execute("SELECT credentials FROM pipelines WHERE pipeline_id = ?", (running,)).fetchone()[0]
+
+    assert account_a["secret_key"] not in read()
+
+    def finish(data):
+        data["status"] = "succeed"
+
+    _rewrite(running, finish)
+    assert read() == ""
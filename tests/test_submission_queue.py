@@ -0,0 +1,76 @@
+# author: sawyer-shi
+
+import json
+import sqlite3
+import time
+
+from tools.local_db import SEAL_PREFIX, LocalDb
+from tools.submission_queue import FAILED, QUEUED, SUBMITTED, SubmissionQueue, get_queue, resume_pending
+
+PAYLOAD = {"model_name": "kling-v1", "prompt": "a cat on a skateboard"}
+
+
+def _raw_credentials(path: str, job_id: str):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT credentials FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+
+def test_credentials_are_sealed_at_rest(state_db, account_a):
+    queue = SubmissionQueue(LocalDb(state_db))
+    job = queue.enqueue(account_a["access_key"], "text2video", "v1/videos/text2video", PAYLOAD, account_a)
+
+    stored = _raw_credentials(state_db, job["job_id"])
+    assert stored.startswith(SEAL_PREFIX)
+    assert account_a["secret_key"] not in stored
+
+
+def test_restart_claims_jobs_left_by_an_earlier_process(state_db, account_a):
+    scope = account_a["access_key"]
+    job = SubmissionQueue(LocalDb(state_db)).enqueue(scope, "text2video", "v1/videos/text2video", PAYLOAD, account_a)
+
+    restarted = SubmissionQueue(LocalDb(state_db))
+    assert restarted.pending_scopes() == [scope]
+    claimed = restarted.claim(scope)
+    assert claimed["job_id"] == job["job_id"]
+    assert claimed["credentials"] == account_a
+    assert claimed["payload"] == PAYLOAD
+
+    restarted.mark_submitted(job["job_id"], "task-1", {"code": 0, "data": {"task_id": "task-1"}})
+    assert restarted.get(job["job_id"])["status"] == SUBMITTED
+    assert _raw_credentials(state_db, job["job_id"]) is None
+    assert restarted.pending_scopes() == []
+
+
+def test_legacy_plaintext_credentials_are_sealed_on_open(state_db, account_a):
+    queue = SubmissionQueue(LocalDb(state_db))
+    job = queue.enqueue(account_a["access_key"], "text2video", "v1/videos/text2video", PAYLOAD, account_a)
+    with sqlite3.connect(state_db) as conn:
+        conn.execute("UPDATE jobs SET credentials = ? WHERE job_id = ?", (json.dumps(account_a), job["job_id"]))
+
+    SubmissionQueue(LocalDb(state_db))
+    assert _raw_credentials(state_db, job["job_id"]).startswith(SEAL_PREFIX)
+
+
+def test_job_sealed_under_another_key_fails_instead_of_blocking(state_db, account_a, monkeypatch):
+    scope = account_a["access_key"]
+    job = SubmissionQueue(LocalDb(state_db)).enqueue(scope, "text2video", "v1/videos/text2video", PAYLOAD, account_a)
+
+    monkeypatch.setenv("KLING_STATE_KEY", "rotated-state-key")
+    restarted = SubmissionQueue(LocalDb(state_db))
+    assert restarted.claim(scope) is None
+    assert restarted.get(job["job_id"])["status"] == FAILED
+
+
+def test_resume_pending_submits_jobs_without_a_tool_call(account_a):
+    queue = get_queue()
+    job = queue.enqueue(account_a["access_key"], "text2video", "v1/videos/text2video", PAYLOAD, account_a)
+    assert queue.get(job["job_id"])["status"] == QUEUED
+
+    resume_pending()
+    deadline = time.monotonic() + 15
+    while queue.get(job["job_id"])["status"] != SUBMITTED and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    finished = queue.get(job["job_id"])
+    assert finished["status"] == SUBMITTED
+    assert finished["task_id"]
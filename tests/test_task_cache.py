@@ -0,0 +1,50 @@
+# author: sawyer-shi
+
+from tools.task_poller import TASK_CACHE, cached_task, publish_task
+
+ENDPOINT = "text2video"
+API_PATH = "v1/videos/text2video"
+
+
+def _response(task_id: str, status: str) -> dict:
+    return {
+        "code": 0,
+        "data": {
+            "task_id": task_id,
+            "task_status": status,
+            "task_result": {"videos": [{"url": f"https://cdn.example.com/{task_id}.mp4"}]},
+        },
+    }
+
+
+def test_finished_task_is_served_only_to_its_account(account_a, account_b):
+    TASK_CACHE.clear()
+    publish_task(account_a, ENDPOINT, API_PATH, "task-1", _response("task-1", "succeed"))
+
+    assert cached_task(account_a, ENDPOINT, "task-1")["data"]["task_status"] == "succeed"
+    assert cached_task(account_b, ENDPOINT, "task-1") is None
+
+
+def test_external_task_id_alias_is_scoped_by_account(account_a, account_b):
+    TASK_CACHE.clear()
+    # Queried by external_task_id: the response carries the Kling task id.
+    publish_task(account_a, ENDPOINT, API_PATH, "job-1", _response("task-2", "succeed"))
+
+    assert cached_task(account_a, ENDPOINT, "job-1")["data"]["task_id"] == "task-2"
+    assert cached_task(account_a, ENDPOINT, "task-2") is not None
+    assert cached_task(account_b, ENDPOINT, "job-1") is None
+    assert cached_task(account_b, ENDPOINT, "task-2") is None
+
+
+def test_unfinished_task_is_not_served_without_the_poller(account_a):
+    TASK_CACHE.clear()
+    publish_task(account_a, ENDPOINT, API_PATH, "task-3", _response("task-3", "processing"))
+
+    assert cached_task(account_a, ENDPOINT, "task-3") is None
+
+
+def test_failed_responses_are_not_cached(account_a):
+    TASK_CACHE.clear()
+    publish_task(account_a, ENDPOINT, API_PATH, "task-4", {"code": 1201, "message": "not found"})
+
+    assert cached_task(account_a, ENDPOINT, "task-4") is None
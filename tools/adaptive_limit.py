@@ -0,0 +1,170 @@
+# author: sawyer-shi
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import requests
+
+from tools.deadline import DeadlineExceeded, step_timeout
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_ENV = "KLING_ADAPTIVE_CONCURRENCY"
+ADAPTIVE_INITIAL_ENV = "KLING_ADAPTIVE_INITIAL"
+ADAPTIVE_MAX_ENV = "KLING_ADAPTIVE_MAX"
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MAX_LIMIT = 64
+MIN_LIMIT = 1.0
+BACKOFF_FACTOR = 0.5
+# Successes slower than this multiple of the usual latency hold the limit instead of raising it.
+LATENCY_FACTOR = 3.0
+LATENCY_SMOOTHING = 0.1
+
+OK = "ok"
+CONGESTED = "congested"
+NEUTRAL = "neutral"
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(float(os.environ.get(name, default)), MIN_LIMIT)
+    except ValueError:
+        return default
+
+
+def adaptive_enabled() -> bool:
+    return os.environ.get(ADAPTIVE_ENV, "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests for one endpoint family.
+
+    Each success raises the limit by ``1 / limit`` (about one per round of
+    requests); a 429 or a timeout halves it. Only requests started after the
+    last cut can cut again, so one burst of 429s counts as a single event.
+    """
+
+    def __init__(self, endpoint: str, phase: str, account: str, initial: float, maximum: float) -> None:
+        self.endpoint = endpoint
+        self.phase = phase
+        self.account = account
+        self.name = f"{endpoint}:{phase}:{account}" if account else f"{endpoint}:{phase}"
+        self.maximum = max(maximum, MIN_LIMIT)
+        self.limit = min(max(initial, MIN_LIMIT), self.maximum)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._baseline: Optional[float] = None
+        self._last_cut = 0.0
+
+    def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to hand back to ``release``.
+
+        Raises ``DeadlineExceeded`` when the invocation's deadline passes while waiting.
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait(step_timeout(None, self.name))
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, outcome: str) -> None:
+        now = time.monotonic()
+        cut = False
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == CONGESTED:
+                if started >= self._last_cut:
+                    self.limit = max(self.limit * BACKOFF_FACTOR, MIN_LIMIT)
+                    self._last_cut = now
+                    cut = True
+            elif outcome == OK:
+                latency = now - started
+                slow = self._baseline is not None and latency > self._baseline * LATENCY_FACTOR
+                self._baseline = (
+                    latency
+                    if self._baseline is None
+                    else self._baseline + (latency - self._baseline) * LATENCY_SMOOTHING
+                )
+                if not slow:
+                    self.limit = min(self.limit + 1.0 / self.limit, self.maximum)
+            limit = self.limit
+            self._condition.notify_all()
+
+        REGISTRY.set_gauge(
+            "kling_adaptive_limit",
+            round(limit, 2),
+            "Adaptive concurrency limit per endpoint family and account.",
+            {"endpoint": self.endpoint, "phase": self.phase, "account": self.account},
+        )
+        if cut:
+            REGISTRY.count_event("concurrency_cut", self.endpoint)
+            logger.info("Adaptive limit for %s cut to %.1f", self.name, limit)
+
+
+class _Slot:
+    __slots__ = ("status",)
+
+    def __init__(self) -> None:
+        self.status: Optional[int] = None
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint: str, phase: str, account: str = "") -> AdaptiveLimiter:
+    """The limiter shared by every request of an endpoint family (endpoint and phase) of one account.
+
+    Kling rate-limits each account separately, so one account's 429s never
+    cut another's limit.
+    """
+    name = f"{endpoint}:{phase}:{account}" if account else f"{endpoint}:{phase}"
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = AdaptiveLimiter(
+                    endpoint,
+                    phase,
+                    account,
+                    _env_number(ADAPTIVE_INITIAL_ENV, DEFAULT_INITIAL_LIMIT),
+                    _env_number(ADAPTIVE_MAX_ENV, DEFAULT_MAX_LIMIT),
+                )
+    return limiter
+
+
+@contextmanager
+def adaptive_slot(endpoint: str, phase: str, account: str = "") -> Iterator[_Slot]:
+    """Hold a slot of the family's limiter around one request of ``account``.
+
+    Set ``slot.status`` to the HTTP status once the response is in. Only 2xx
+    responses count as successes; 429s and timeouts raised inside the block
+    count as congestion, and everything else leaves the limit alone.
+    """
+    slot = _Slot()
+    if not adaptive_enabled():
+        yield slot
+        return
+
+    limiter = get_limiter(endpoint, phase, account)
+    started = limiter.acquire()
+    outcome = NEUTRAL
+    try:
+        yield slot
+        if slot.status == 429:
+            outcome = CONGESTED
+        elif slot.status is not None and 200 <= slot.status < 300:
+            outcome = OK
+    except DeadlineExceeded:
+        raise
+    except requests.exceptions.Timeout:
+        outcome = CONGESTED
+        raise
+    finally:
+        limiter.release(started, outcome)
@@ -0,0 +1,63 @@
+# author: sawyer-shi
+
+import contextvars
+import threading
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 10
+
+
+def clamp_concurrency(value: Any, default: int = DEFAULT_CONCURRENCY, limit: int = MAX_CONCURRENCY) -> int:
+    try:
+        return min(max(int(float(value)), 1), limit)
+    except (TypeError, ValueError):
+        return default
+
+
+def map_bounded(fn: Callable[[T], R], items: Iterable[T], max_workers: int) -> list[R]:
+    """Apply ``fn`` to ``items`` on at most ``max_workers`` threads, keeping input order.
+
+    Workers run in a copy of the caller's context so tracing spans nest under
+    the invocation. The first exception stops further items from starting and
+    is re-raised once running calls finish.
+
+    Plain threads are used instead of ``concurrent.futures``: its module-level
+    lock predates gevent's monkey patching and can deadlock nested pools.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    results: list[Optional[R]] = [None] * len(items)
+    errors: list[BaseException] = []
+    indexes = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def worker(context: contextvars.Context) -> None:
+        while True:
+            with lock:
+                index = None if errors else next(indexes, None)
+            if index is None:
+                return
+            try:
+                results[index] = context.run(fn, items[index])
+            except BaseException as exc:
+                with lock:
+                    errors.append(exc)
+                return
+
+    threads = [
+        threading.Thread(target=worker, args=(contextvars.copy_context(),), daemon=True)
+        for _ in range(min(max_workers, len(items)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results  # type: ignore[return-value]
@@ -0,0 +1,109 @@
+# author: sawyer-shi
+
+import contextvars
+import functools
+import logging
+import os
+import time
+from collections.abc import Generator, Iterator
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+import requests
+
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Dify drops an invocation after this many seconds (main.py passes it to the SDK).
+MAX_REQUEST_TIMEOUT = 120
+INVOKE_BUDGET_ENV = "KLING_INVOKE_BUDGET"
+# Left for yielding what was gathered once the budget runs out.
+FINISH_MARGIN_SECONDS = 5.0
+# Steps are not started with less time than this; they would only fail late.
+MIN_STEP_SECONDS = 0.5
+
+_current: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar("kling_deadline", default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The invocation's time budget ran out; tools handle it like any request timeout."""
+
+
+class Deadline:
+    """Absolute end of one tool invocation; every network step gets what is left of it."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def timeout(self, requested: Optional[float], step: str = "") -> float:
+        """``requested`` capped to the remaining budget; raises ``DeadlineExceeded`` when it is used up."""
+        remaining = self.remaining()
+        if remaining < MIN_STEP_SECONDS:
+            REGISTRY.count_event("deadline_exceeded", step or "unknown")
+            raise DeadlineExceeded(f"调用时间预算 {self.seconds:.0f}s 已用尽")
+        return remaining if requested is None else min(requested, remaining)
+
+
+def invoke_budget() -> float:
+    try:
+        return max(float(os.environ.get(INVOKE_BUDGET_ENV, MAX_REQUEST_TIMEOUT - FINISH_MARGIN_SECONDS)), 1.0)
+    except ValueError:
+        return MAX_REQUEST_TIMEOUT - FINISH_MARGIN_SECONDS
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def step_timeout(requested: Optional[float], step: str = "") -> Optional[float]:
+    """Timeout for one network step: ``requested`` capped by the current invocation's deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return requested
+    return deadline.timeout(requested, step)
+
+
+def check_deadline(step: str = "") -> None:
+    """Raise ``DeadlineExceeded`` when the current invocation has no time left."""
+    step_timeout(None, step)
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Deadline]:
+    """Bound the enclosed steps by ``seconds``, for background work that has no invocation deadline."""
+    deadline = Deadline(seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def deadline_invoke(func: Callable[..., Generator]) -> Callable[..., Generator]:
+    """Run a tool's ``_invoke`` generator under a fresh ``KLING_INVOKE_BUDGET`` deadline.
+
+    The deadline lives in a private context, so it covers the generator body
+    (and threads it starts through ``map_bounded``) but never the caller.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, tool_parameters: dict[str, Any]) -> Generator:
+        context = contextvars.copy_context()
+        context.run(_current.set, Deadline(invoke_budget()))
+        generator = context.run(func, self, tool_parameters)
+        try:
+            while True:
+                try:
+                    message = context.run(next, generator)
+                except StopIteration:
+                    return
+                yield message
+        finally:
+            context.run(generator.close)
+
+    return wrapper
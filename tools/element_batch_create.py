@@ -0,0 +1,183 @@
+# author: sawyer-shi
+
+import json
+import logging
+from collections.abc import Generator
+from typing import Any, Optional
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.concurrency import DEFAULT_CONCURRENCY, clamp_concurrency, map_bounded
+from tools.deadline import deadline_invoke
+from tools.element_payload import ELEMENT_MEDIA_FIELDS, build_element_payload
+from tools.element_registry import record_created
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, get_api_token, parse_json_param
+from tools.validation import validate_tool_parameters
+
+logger = logging.getLogger(__name__)
+
+
+def _bind_file(value: Any, files: list[Any]) -> Any:
+    """Swap a ``file:<n>`` reference or an uploaded file's name for the file object."""
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if text.startswith("file:") and text[5:].isdigit():
+        index = int(text[5:])
+        if index >= len(files):
+            raise ValueError(f"❌ 引用的图片 {text} 不存在，共上传 {len(files)} 张")
+        return files[index]
+    for item in files:
+        if getattr(item, "filename", None) == text:
+            return item
+    return value
+
+
+def _bind_files(spec: dict[str, Any], files: list[Any]) -> dict[str, Any]:
+    bound = dict(spec)
+    for field in ELEMENT_MEDIA_FIELDS:
+        value = bound.get(field)
+        if isinstance(value, list):
+            bound[field] = [_bind_file(item, files) for item in value]
+        elif value is not None:
+            bound[field] = _bind_file(value, files)
+    return bound
+
+
+class ElementBatchCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Create several custom elements with bounded concurrency."""
+        logger.info("Starting element batch create task")
+
+        try:
+            api_token = get_api_token(self.runtime)
+        except Exception as exc:
+            msg = f"❌ 凭证获取失败: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return
+
+        errors = validate_tool_parameters("element_batch_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        specs = parse_json_param(tool_parameters.get("elements"), "elements")
+        if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+            msg = "❌ elements 需要为非空的 JSON 对象数组"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        files = list(tool_parameters.get("element_images") or [])
+        concurrency = clamp_concurrency(tool_parameters.get("max_concurrency", DEFAULT_CONCURRENCY))
+        api_url = build_api_url("v1/general/advanced-custom-elements")
+        headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json",
+        }
+        scope = self.runtime.credentials.get("access_key", "")
+
+        yield self.create_text_message(f"🚀 批量主体创建启动中，共 {len(specs)} 个，并发 {concurrency}")
+
+        def create_one(item: tuple[int, dict[str, Any]]) -> dict[str, Any]:
+            index, spec = item
+            data, error = self._submit(index, spec, files, api_url, headers, scope)
+            return {
+                "index": index,
+                "element_name": spec.get("element_name"),
+                "success": error is None,
+                "task_id": (data or {}).get("task_id"),
+                "task_status": (data or {}).get("task_status"),
+                "error": error,
+            }
+
+        outcomes = map_bounded(create_one, list(enumerate(specs)), concurrency)
+
+        succeeded = [outcome for outcome in outcomes if outcome["success"]]
+        for outcome in outcomes:
+            if outcome["success"]:
+                yield self.create_text_message(
+                    f"#{outcome['index'] + 1} ✅ {outcome['element_name']}: 任务ID {outcome['task_id']}"
+                )
+            else:
+                yield self.create_text_message(
+                    f"#{outcome['index'] + 1} ⚠️ {outcome['element_name']}: {outcome['error']}"
+                )
+        if not succeeded:
+            yield self.create_text_message("❌ 批量创建全部失败")
+        else:
+            yield self.create_text_message(
+                f"✅ 批量主体创建已提交: 成功 {len(succeeded)} 个，失败 {len(outcomes) - len(succeeded)} 个"
+            )
+            yield self.create_text_message("💡 请使用主体查询工具获取各任务结果")
+        yield self.create_json_message(
+            {
+                "total": len(outcomes),
+                "succeeded": len(succeeded),
+                "failed": len(outcomes) - len(succeeded),
+                "items": outcomes,
+            }
+        )
+
+    def _submit(
+        self,
+        index: int,
+        spec: dict[str, Any],
+        files: list[Any],
+        api_url: str,
+        headers: dict[str, str],
+        scope: str,
+    ) -> tuple[Optional[dict[str, Any]], Optional[str]]:
+        """Prepare and submit one element; returns the response data or an error message."""
+        errors = validate_tool_parameters("element_create", spec)
+        if errors:
+            return None, f"参数校验失败: {'; '.join(errors)}"
+        try:
+            payload = build_element_payload(_bind_files(spec, files))
+        except ValueError as exc:
+            return None, str(exc).removeprefix("❌").strip()
+        except Exception as exc:
+            logger.error("Failed to prepare element #%d: %s", index + 1, exc)
+            return None, f"图片处理失败: {exc}"
+
+        try:
+            response, _ = post_create(
+                api_url,
+                "custom-elements",
+                headers=headers,
+                payload=payload,
+                scope=scope,
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
+        except requests.exceptions.Timeout:
+            return None, "请求超时"
+        except requests.exceptions.RequestException as exc:
+            return None, f"请求失败: {exc}"
+
+        if response.status_code != 200:
+            logger.error("API status %s for element #%d: %s", response.status_code, index + 1, response.text[:300])
+            return None, f"API 响应状态码: {response.status_code}"
+        try:
+            resp_data = response.json()
+        except json.JSONDecodeError:
+            return None, "API 响应解析失败（非JSON）"
+        if resp_data.get("code") != 0:
+            return None, f"创建失败: {resp_data.get('message', '未知错误')}"
+
+        data = resp_data.get("data", {})
+        record_created(self, data.get("task_id"), payload)
+        return data, None
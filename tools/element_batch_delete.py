@@ -0,0 +1,164 @@
+# author: sawyer-shi
+
+import json
+import logging
+from collections.abc import Generator
+from typing import Any, Optional
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.concurrency import DEFAULT_CONCURRENCY, clamp_concurrency, map_bounded
+from tools.deadline import deadline_invoke
+from tools.element_registry import find_elements, forget_element
+from tools.http_client import post_json
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, get_api_token
+from tools.validation import validate_tool_parameters
+
+logger = logging.getLogger(__name__)
+
+
+def parse_element_ids(value: Any) -> list[str]:
+    """Element ids from a JSON array or a comma/newline separated string, de-duplicated."""
+    if isinstance(value, list):
+        items = value
+    else:
+        text = str(value or "").strip()
+        if text.startswith("["):
+            try:
+                items = json.loads(text)
+            except json.JSONDecodeError as exc:
+                raise ValueError("❌ element_ids 需要为有效的 JSON 数组或逗号分隔的ID") from exc
+        else:
+            items = text.replace("\n", ",").split(",")
+    ids: list[str] = []
+    for item in items:
+        element_id = str(item).strip()
+        if element_id and element_id not in ids:
+            ids.append(element_id)
+    return ids
+
+
+class ElementBatchDeleteTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Delete several custom elements with bounded concurrency."""
+        logger.info("Starting element batch delete task")
+
+        try:
+            api_token = get_api_token(self.runtime)
+        except Exception as exc:
+            msg = f"❌ 凭证获取失败: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return
+
+        errors = validate_tool_parameters("element_batch_delete", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        try:
+            element_ids = parse_element_ids(tool_parameters.get("element_ids"))
+        except ValueError as exc:
+            msg = str(exc)
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+        if not element_ids:
+            msg = "❌ 请输入 element_ids"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        concurrency = clamp_concurrency(tool_parameters.get("max_concurrency", DEFAULT_CONCURRENCY))
+        api_url = build_api_url("v1/general/delete-elements")
+        headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json",
+        }
+
+        yield self.create_text_message(f"🚀 批量主体删除启动中，共 {len(element_ids)} 个，并发 {concurrency}")
+
+        def delete_one(item: tuple[int, str]) -> dict[str, Any]:
+            index, reference = item
+            element_id, error = self._delete(reference, api_url, headers)
+            return {
+                "index": index,
+                "element": reference,
+                "element_id": element_id,
+                "success": error is None,
+                "error": error,
+            }
+
+        outcomes = map_bounded(delete_one, list(enumerate(element_ids)), concurrency)
+
+        succeeded = [outcome for outcome in outcomes if outcome["success"]]
+        for outcome in outcomes:
+            if outcome["success"]:
+                yield self.create_text_message(f"#{outcome['index'] + 1} ✅ {outcome['element_id']}")
+            else:
+                yield self.create_text_message(
+                    f"#{outcome['index'] + 1} ⚠️ {outcome['element']}: {outcome['error']}"
+                )
+        if not succeeded:
+            yield self.create_text_message("❌ 批量删除全部失败")
+        else:
+            yield self.create_text_message(
+                f"✅ 批量主体删除已提交: 成功 {len(succeeded)} 个，失败 {len(outcomes) - len(succeeded)} 个"
+            )
+        yield self.create_json_message(
+            {
+                "total": len(outcomes),
+                "succeeded": len(succeeded),
+                "failed": len(outcomes) - len(succeeded),
+                "items": outcomes,
+            }
+        )
+
+    def _delete(
+        self, reference: str, api_url: str, headers: dict[str, str]
+    ) -> tuple[Optional[str], Optional[str]]:
+        """Delete one element by id (or registered name); returns the id and an error message."""
+        element_id = reference
+        if not reference.isdigit():
+            matches = find_elements(self, name=reference)
+            if not matches:
+                return None, "不是有效的主体ID，本地主体索引中也未找到同名主体"
+            element_id = matches[0]["element_id"]
+
+        try:
+            response = post_json(
+                api_url,
+                "delete-elements",
+                headers=headers,
+                payload={"element_id": element_id},
+                timeout=60,
+                phase="delete",
+            )
+        except requests.exceptions.Timeout:
+            return element_id, "请求超时"
+        except requests.exceptions.RequestException as exc:
+            return element_id, f"请求失败: {exc}"
+
+        if response.status_code != 200:
+            logger.error("API status %s deleting %s: %s", response.status_code, element_id, response.text[:300])
+            return element_id, f"API 响应状态码: {response.status_code}"
+        try:
+            resp_data = response.json()
+        except json.JSONDecodeError:
+            return element_id, "API 响应解析失败（非JSON）"
+        if resp_data.get("code") != 0:
+            return element_id, f"删除失败: {resp_data.get('message', '未知错误')}"
+
+        forget_element(self, element_id)
+        return element_id, None
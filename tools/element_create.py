@@ -9,12 +9,24 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import get_api_token, parse_json_param, resolve_files_to_list, resolve_media_input
+from tools.deadline import deadline_invoke
+from tools.element_payload import build_element_payload
+from tools.element_registry import record_created
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, get_api_token
+from tools.validation import validate_tool_parameters
 
 logger = logging.getLogger(__name__)
 
 
 class ElementCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Create custom element (subject)."""
         logger.info("Starting element create task")
@@ -27,74 +39,43 @@ class ElementCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        element_name = (tool_parameters.get("element_name") or "").strip()
-        element_description = (tool_parameters.get("element_description") or "").strip()
-        reference_type = (tool_parameters.get("reference_type") or "").strip()
+        errors = validate_tool_parameters("element_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
 
-        if not element_name or not element_description or not reference_type:
-            msg = "❌ 请填写 element_name、element_description 和 reference_type"
+        try:
+            payload = build_element_payload(tool_parameters)
+        except ValueError as exc:
+            msg = str(exc)
             logger.warning(msg)
             yield self.create_text_message(msg)
             return
+        element_name = payload["element_name"]
 
-        api_url = "https://api-beijing.klingai.com/v1/general/advanced-custom-elements"
+        api_url = build_api_url("v1/general/advanced-custom-elements")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
         }
 
-        payload: dict[str, Any] = {
-            "element_name": element_name,
-            "element_description": element_description,
-            "reference_type": reference_type,
-        }
-
-        element_image_list = parse_json_param(
-            tool_parameters.get("element_image_list"), "element_image_list"
-        )
-        if element_image_list:
-            payload["element_image_list"] = element_image_list
-
-        frontal_image = resolve_media_input(tool_parameters.get("element_frontal_image"))
-        refer_images = tool_parameters.get("element_refer_images")
-        refer_image_list = (
-            resolve_files_to_list(refer_images, "image_url") if refer_images else []
-        )
-        if frontal_image or refer_image_list:
-            payload["element_image_list"] = {
-                "frontal_image": frontal_image,
-                "refer_images": refer_image_list,
-            }
-
-        element_video_list = parse_json_param(
-            tool_parameters.get("element_video_list"), "element_video_list"
-        )
-        if element_video_list:
-            payload["element_video_list"] = element_video_list
-
-        element_voice_id = tool_parameters.get("element_voice_id")
-        if element_voice_id:
-            payload["element_voice_id"] = element_voice_id
-
-        tag_list = parse_json_param(tool_parameters.get("tag_list"), "tag_list")
-        if tag_list:
-            payload["tag_list"] = tag_list
-
-        callback_url = tool_parameters.get("callback_url")
-        if callback_url:
-            payload["callback_url"] = callback_url
-
-        external_task_id = tool_parameters.get("external_task_id")
-        if external_task_id:
-            payload["external_task_id"] = external_task_id
-
         yield self.create_text_message("🚀 主体创建任务启动中...")
         yield self.create_text_message(f"🏷️ 主体名称: {element_name}")
         yield self.create_text_message("⏳ 正在连接可灵 AI API...")
 
         try:
             logger.info("Submitting element create payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response, shared = post_create(
+                api_url,
+                "custom-elements",
+                headers=headers,
+                payload=payload,
+                scope=self.runtime.credentials.get("access_key", ""),
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -106,6 +87,9 @@ class ElementCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        if shared:
+            yield self.create_text_message("♻️ 检测到相同的请求，已复用同一任务")
+
         if response.status_code != 200:
             logger.error("API status %s: %s", response.status_code, response.text[:300])
             yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
@@ -137,4 +121,5 @@ class ElementCreateTool(Tool):
         if task_status:
             yield self.create_text_message(f"📊 状态: {task_status}")
         yield self.create_text_message("💡 请使用主体查询工具获取结果")
+        record_created(self, task_id, payload)
         yield self.create_json_message(resp_data)
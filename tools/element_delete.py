@@ -9,12 +9,22 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import get_api_token
+from tools.deadline import deadline_invoke
+from tools.element_registry import forget_element
+from tools.http_client import post_json
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, get_api_token
 
 logger = logging.getLogger(__name__)
 
 
 class ElementDeleteTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Delete custom element (subject)."""
         logger.info("Starting element delete task")
@@ -34,7 +44,7 @@ class ElementDeleteTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        api_url = "https://api-beijing.klingai.com/v1/general/delete-elements"
+        api_url = build_api_url("v1/general/delete-elements")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -46,7 +56,9 @@ class ElementDeleteTool(Tool):
 
         try:
             logger.info("Submitting element delete payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response = post_json(
+                api_url, "delete-elements", headers=headers, payload=payload, timeout=60, phase="delete"
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -79,5 +91,6 @@ class ElementDeleteTool(Tool):
             yield self.create_json_message(resp_data)
             return
 
+        forget_element(self, element_id)
         yield self.create_text_message("✅ 主体删除任务已提交")
         yield self.create_json_message(resp_data)
@@ -0,0 +1,43 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.deadline import deadline_invoke
+from tools.element_registry import find_elements, registry_enabled
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.tracing import traced_invoke
+
+logger = logging.getLogger(__name__)
+
+
+class ElementLookupTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Look up custom elements in the local registry by name or tag."""
+        logger.info("Starting element lookup")
+
+        if not registry_enabled():
+            msg = "❌ 本地主体索引已禁用 (KLING_ELEMENT_REGISTRY=0)"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        element_name = (tool_parameters.get("element_name") or "").strip() or None
+        tag_id = (tool_parameters.get("tag_id") or "").strip() or None
+        elements = find_elements(self, name=element_name, tag=tag_id)
+
+        yield self.create_text_message(f"🔍 本地主体索引匹配 {len(elements)} 个主体")
+        for element in elements:
+            yield self.create_text_message(f"🧩 {element.get('element_name')}: {element.get('element_id')}")
+        if not elements:
+            yield self.create_text_message("💡 主体需先通过主体创建与主体查询工具登记到本地索引")
+        yield self.create_json_message({"elements": elements})
@@ -0,0 +1,63 @@
+# author: sawyer-shi
+
+from typing import Any
+
+from tools.utils import parse_json_param, resolve_files_to_list, resolve_media_input
+
+ELEMENT_MEDIA_FIELDS = ("element_frontal_image", "element_refer_images")
+
+
+def build_element_payload(params: dict[str, Any]) -> dict[str, Any]:
+    """Request body for ``advanced-custom-elements`` from element_create style parameters.
+
+    Raises ``ValueError`` when a required field is missing or a JSON field is invalid.
+    """
+    element_name = (params.get("element_name") or "").strip()
+    element_description = (params.get("element_description") or "").strip()
+    reference_type = (params.get("reference_type") or "").strip()
+    if not element_name or not element_description or not reference_type:
+        raise ValueError("❌ 请填写 element_name、element_description 和 reference_type")
+
+    payload: dict[str, Any] = {
+        "element_name": element_name,
+        "element_description": element_description,
+        "reference_type": reference_type,
+    }
+
+    element_image_list = parse_json_param(params.get("element_image_list"), "element_image_list")
+    if element_image_list:
+        payload["element_image_list"] = element_image_list
+
+    frontal_image = resolve_media_input(params.get("element_frontal_image"), "element_frontal_image")
+    refer_images = params.get("element_refer_images")
+    if refer_images and not isinstance(refer_images, list):
+        # A single file or URL; iterating a string would resolve it character by character.
+        refer_images = [refer_images]
+    refer_image_list = resolve_files_to_list(refer_images, "image_url", "element_refer_images") if refer_images else []
+    if frontal_image or refer_image_list:
+        payload["element_image_list"] = {
+            "frontal_image": frontal_image,
+            "refer_images": refer_image_list,
+        }
+
+    element_video_list = parse_json_param(params.get("element_video_list"), "element_video_list")
+    if element_video_list:
+        payload["element_video_list"] = element_video_list
+
+    element_voice_id = params.get("element_voice_id")
+    if element_voice_id:
+        payload["element_voice_id"] = element_voice_id
+
+    tag_list = parse_json_param(params.get("tag_list"), "tag_list")
+    if tag_list:
+        payload["tag_list"] = tag_list
+
+    callback_url = params.get("callback_url")
+    if callback_url:
+        payload["callback_url"] = callback_url
+
+    external_task_id = params.get("external_task_id")
+    if external_task_id:
+        payload["external_task_id"] = external_task_id
+
+    return payload
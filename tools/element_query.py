@@ -3,30 +3,33 @@
 import json
 import logging
 from collections.abc import Generator
-from typing import Any
+from typing import Any, Optional
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import format_timestamp, get_api_token, resolve_task_id
+from tools.deadline import deadline_invoke
+from tools.element_registry import cached_query, record_query
+from tools.http_client import get_json
+from tools.key_pool import get_task_api_token
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, format_timestamp, resolve_task_id
 
 logger = logging.getLogger(__name__)
 
 
 class ElementQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Query custom element (single)."""
         logger.info("Starting element query task")
 
-        try:
-            api_token = get_api_token(self.runtime)
-        except Exception as exc:
-            msg = f"❌ 凭证获取失败: {exc}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-
         try:
             task_id = resolve_task_id(tool_parameters)
         except ValueError as exc:
@@ -35,49 +38,23 @@ class ElementQueryTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        api_url = f"https://api-beijing.klingai.com/v1/general/advanced-custom-elements/{task_id}"
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json",
-        }
-
-        yield self.create_text_message("🔍 正在查询主体任务...")
-        yield self.create_text_message(f"📋 任务ID: {task_id}")
-
         try:
-            response = requests.get(api_url, headers=headers, timeout=60)
-        except requests.exceptions.Timeout:
-            msg = "❌ 请求超时，请稍后重试"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-        except requests.exceptions.RequestException as exc:
-            msg = f"❌ 请求失败: {exc}"
+            api_token = get_task_api_token(self, task_id)
+        except Exception as exc:
+            msg = f"❌ 凭证获取失败: {exc}"
             logger.error(msg)
             yield self.create_text_message(msg)
             return
 
-        if response.status_code != 200:
-            logger.error("API status %s: %s", response.status_code, response.text[:300])
-            yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
-            if response.text:
-                yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
-            return
-
-        try:
-            resp_data = json.loads(response.text, parse_int=str)
-        except json.JSONDecodeError as exc:
-            logger.error("Failed to parse JSON: %s", exc)
-            yield self.create_text_message("❌ API 响应解析失败（非JSON）")
-            return
-
-        code = resp_data.get("code")
-        if str(code) != "0":
-            msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            yield self.create_json_message(resp_data)
-            return
+        resp_data = cached_query(self, task_id)
+        from_cache = resp_data is not None
+        if from_cache:
+            yield self.create_text_message("⚡ 命中本地主体索引")
+            yield self.create_text_message(f"📋 任务ID: {task_id}")
+        else:
+            resp_data = yield from self._fetch(task_id, api_token)
+            if resp_data is None:
+                return
 
         data = resp_data.get("data", {})
         task_status = data.get("task_status")
@@ -104,6 +81,8 @@ class ElementQueryTool(Tool):
             element_source = data
 
         if isinstance(element_source, dict):
+            if not from_cache:
+                record_query(self, task_id, resp_data, element_source)
             element_id = element_source.get("element_id")
             element_name = element_source.get("element_name")
             element_description = element_source.get("element_description")
@@ -137,3 +116,50 @@ class ElementQueryTool(Tool):
                 yield self.create_text_message("ℹ️ 响应中未包含主体详细信息")
 
         yield self.create_json_message(resp_data)
+
+    def _fetch(self, task_id: str, api_token: str) -> Generator[ToolInvokeMessage, None, Optional[dict[str, Any]]]:
+        """Live GET of the element task; returns the parsed response, or None after reporting the error."""
+        api_url = build_api_url(f"v1/general/advanced-custom-elements/{task_id}")
+        headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json",
+        }
+
+        yield self.create_text_message("🔍 正在查询主体任务...")
+        yield self.create_text_message(f"📋 任务ID: {task_id}")
+
+        try:
+            response = get_json(api_url, "custom-elements", headers=headers, timeout=60)
+        except requests.exceptions.Timeout:
+            msg = "❌ 请求超时，请稍后重试"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return None
+        except requests.exceptions.RequestException as exc:
+            msg = f"❌ 请求失败: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return None
+
+        if response.status_code != 200:
+            logger.error("API status %s: %s", response.status_code, response.text[:300])
+            yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
+            if response.text:
+                yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
+            return None
+
+        try:
+            resp_data = json.loads(response.text, parse_int=str)
+        except json.JSONDecodeError as exc:
+            logger.error("Failed to parse JSON: %s", exc)
+            yield self.create_text_message("❌ API 响应解析失败（非JSON）")
+            return None
+
+        code = resp_data.get("code")
+        if str(code) != "0":
+            msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            yield self.create_json_message(resp_data)
+            return None
+        return resp_data
@@ -0,0 +1,242 @@
+# author: sawyer-shi
+
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from tools.local_store import delete_key, read_json, write_json
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ELEMENT_REGISTRY_ENV = "KLING_ELEMENT_REGISTRY"
+ELEMENT_REGISTRY_DIR_ENV = "KLING_ELEMENT_REGISTRY_DIR"
+ELEMENT_REGISTRY_TTL_ENV = "KLING_ELEMENT_REGISTRY_TTL"
+# Stored query responses answer repeated queries for this long; after that Kling is asked again.
+DEFAULT_RESPONSE_TTL_SECONDS = 300.0
+
+# Storage values read or written by this process; lookups are served from here.
+_cache: "OrderedDict[str, Any]" = OrderedDict()
+_lock = threading.Lock()
+MAX_CACHED_KEYS = 4096
+
+
+def registry_enabled() -> bool:
+    return os.environ.get(ELEMENT_REGISTRY_ENV, "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def response_ttl_seconds() -> float:
+    try:
+        return max(float(os.environ.get(ELEMENT_REGISTRY_TTL_ENV, DEFAULT_RESPONSE_TTL_SECONDS)), 0.0)
+    except ValueError:
+        return DEFAULT_RESPONSE_TTL_SECONDS
+
+
+def _directory() -> Optional[str]:
+    return os.environ.get(ELEMENT_REGISTRY_DIR_ENV) or None
+
+
+def _prefix(tool: Any) -> str:
+    access_key = str((tool.runtime.credentials or {}).get("access_key", ""))
+    return "element_registry_" + hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _name_key(tool: Any, name: Any) -> str:
+    digest = hashlib.sha256(str(name or "").strip().lower().encode("utf-8")).hexdigest()[:16]
+    return f"{_prefix(tool)}_name_{digest}"
+
+
+def _remember(key: str, value: Any) -> None:
+    with _lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_KEYS:
+            _cache.popitem(last=False)
+
+
+def _read(tool: Any, key: str, fresh: bool = False) -> Any:
+    """The stored value of ``key``; ``fresh`` skips the cache. Storage is never touched under the lock."""
+    if not fresh:
+        with _lock:
+            if key in _cache:
+                return copy.deepcopy(_cache[key])
+    try:
+        value = read_json(tool, key, _directory())
+    except Exception as exc:
+        logger.warning("Element registry unavailable, using in-memory entries: %s", exc)
+        with _lock:
+            return copy.deepcopy(_cache.get(key))
+    _remember(key, value)
+    return copy.deepcopy(value)
+
+
+def _write(tool: Any, key: str, value: Any) -> None:
+    _remember(key, copy.deepcopy(value))
+    try:
+        if value is None:
+            delete_key(tool, key, _directory())
+        else:
+            write_json(tool, key, value, _directory())
+    except Exception as exc:
+        logger.warning("Failed to persist element registry entry %s: %s", key, exc)
+
+
+def _merge_ids(tool: Any, key: str, add: Optional[str] = None, remove: Optional[str] = None) -> None:
+    """Add or remove one element id in the id list at ``key``, re-reading it first."""
+    ids = [item for item in _read(tool, key, fresh=True) or [] if item not in (add, remove)]
+    if add:
+        ids.append(add)
+    _write(tool, key, ids or None)
+
+
+def _tag_ids(tag_list: Any) -> list[str]:
+    tags = []
+    for tag in tag_list or []:
+        value = tag.get("tag_id") if isinstance(tag, dict) else tag
+        if value not in (None, ""):
+            tags.append(str(value))
+    return tags
+
+
+def record_created(tool: Any, task_id: Optional[str], payload: dict[str, Any]) -> None:
+    """Remember the name and tags of a submitted element until its query reports an id."""
+    if not task_id or not registry_enabled():
+        return
+    _write(
+        tool,
+        f"{_prefix(tool)}_task_{task_id}",
+        {
+            "element_name": payload.get("element_name"),
+            "element_description": payload.get("element_description"),
+            "reference_type": payload.get("reference_type"),
+            "tags": _tag_ids(payload.get("tag_list")),
+            "created_at": time.time(),
+        },
+    )
+
+
+def record_query(tool: Any, task_id: Optional[str], resp_data: dict[str, Any], element: Optional[dict[str, Any]]) -> None:
+    """Index the element of a succeeded query and keep the full response for ``cached_query``."""
+    data = resp_data.get("data") or {}
+    if not task_id or not registry_enabled() or data.get("task_status") != "succeed":
+        return
+    element = element or {}
+    element_id = element.get("element_id")
+    if not element_id:
+        return
+    element_id = str(element_id)
+    prefix = _prefix(tool)
+    task_key = f"{prefix}_task_{task_id}"
+    task = _read(tool, task_key) or {}
+    if task.get("element_id") != element_id or not _read(tool, f"{prefix}_element_{element_id}"):
+        record = {
+            "element_id": element_id,
+            "element_name": element.get("element_name") or task.get("element_name"),
+            "element_description": element.get("element_description") or task.get("element_description"),
+            "reference_type": element.get("reference_type") or task.get("reference_type"),
+            "tags": task.get("tags") or _tag_ids(element.get("tag_list")),
+            "task_id": str(task_id),
+            "registered_at": time.time(),
+        }
+        _write(tool, f"{prefix}_element_{element_id}", record)
+        _merge_ids(tool, _name_key(tool, record["element_name"]), add=element_id)
+        _merge_ids(tool, f"{prefix}_ids", add=element_id)
+        task["element_id"] = element_id
+    task["response"] = resp_data
+    task["queried_at"] = time.time()
+    _write(tool, task_key, task)
+
+
+def cached_query(tool: Any, task_id: Optional[str]) -> Optional[dict[str, Any]]:
+    """The stored response of a succeeded task, while it is younger than ``KLING_ELEMENT_REGISTRY_TTL``.
+
+    Only full API responses are served, and only while the element has not
+    been deleted through the plugin; anything else falls through to a live query.
+    """
+    if not task_id or not registry_enabled():
+        return None
+    prefix = _prefix(tool)
+    task = _read(tool, f"{prefix}_task_{task_id}") or {}
+    if not task.get("response") or time.time() - task.get("queried_at", 0) > response_ttl_seconds():
+        return None
+    if not task.get("element_id") or not _read(tool, f"{prefix}_element_{task['element_id']}"):
+        return None
+    REGISTRY.count_event("element_registry_hit", "custom-elements")
+    return copy.deepcopy(task["response"])
+
+
+def forget_element(tool: Any, element_id: Any) -> None:
+    if element_id in (None, "") or not registry_enabled():
+        return
+    element_id = str(element_id)
+    prefix = _prefix(tool)
+    element = _read(tool, f"{prefix}_element_{element_id}", fresh=True)
+    if not element:
+        return
+    _write(tool, f"{prefix}_element_{element_id}", None)
+    _merge_ids(tool, _name_key(tool, element.get("element_name")), remove=element_id)
+    _merge_ids(tool, f"{prefix}_ids", remove=element_id)
+    if element.get("task_id"):
+        _write(tool, f"{prefix}_task_{element['task_id']}", None)
+
+
+def find_elements(tool: Any, name: Optional[str] = None, tag: Optional[str] = None) -> list[dict[str, Any]]:
+    """Registered elements matching a name (case-insensitive) and/or tag id, newest first."""
+    wanted_name = name.strip().lower() if name else None
+    key = _name_key(tool, name) if wanted_name else f"{_prefix(tool)}_ids"
+    # Another worker process may have registered it since this one last looked.
+    ids = _read(tool, key) or _read(tool, key, fresh=True) or []
+    prefix = _prefix(tool)
+    elements = [_read(tool, f"{prefix}_element_{element_id}") for element_id in ids]
+    matches = [
+        element
+        for element in elements
+        if element
+        and (wanted_name is None or str(element.get("element_name") or "").strip().lower() == wanted_name)
+        and (not tag or tag in element.get("tags", []))
+    ]
+    return sorted(matches, key=lambda element: element.get("registered_at", 0), reverse=True)
+
+
+def _element_ref(element_id: str) -> dict[str, Any]:
+    return {"element_id": int(element_id) if element_id.isdigit() else element_id}
+
+
+def resolve_element_list(tool: Any, element_list: Any) -> Any:
+    """Replace element names and tags in ``element_list`` with registered element ids.
+
+    Entries may be ``{"element_id": ...}`` (kept as is), a bare name,
+    ``{"element_name": "..."}`` or ``{"tag_id": "..."}`` (every element with
+    that tag). Raises ``ValueError`` for names or tags that are not registered.
+    """
+    if not isinstance(element_list, list) or not registry_enabled():
+        return element_list
+
+    resolved: list[Any] = []
+    for entry in element_list:
+        if isinstance(entry, dict) and entry.get("element_id") not in (None, ""):
+            resolved.append(entry)
+            continue
+        if isinstance(entry, str):
+            name, tag = entry, None
+        elif isinstance(entry, dict):
+            name, tag = entry.get("element_name"), entry.get("tag_id")
+        else:
+            resolved.append(entry)
+            continue
+
+        matches = find_elements(tool, name=name, tag=str(tag) if tag else None) if (name or tag) else []
+        if not matches:
+            label = f"element_name={name}" if name else f"tag_id={tag}"
+            raise ValueError(f"❌ 本地主体索引中未找到主体: {label}")
+        if name:
+            if len(matches) > 1:
+                logger.info("Element name %s matches %d elements, using the newest", name, len(matches))
+            matches = matches[:1]
+        resolved.extend(_element_ref(match["element_id"]) for match in matches)
+    return resolved
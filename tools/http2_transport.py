@@ -0,0 +1,150 @@
+# author: sawyer-shi
+
+import importlib
+import logging
+import os
+import socket
+import threading
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from tools.deadline import step_timeout
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HTTP2_ENV = "KLING_HTTP2"
+HTTP2_MAX_CONNECTIONS_ENV = "KLING_HTTP2_MAX_CONNECTIONS"
+DEFAULT_MAX_CONNECTIONS = 16
+KEEPALIVE_SECONDS = 30.0
+# Safe to resend over HTTP/1.1 when the HTTP/2 connection breaks mid-request.
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE"}
+
+_client: Optional[Any] = None
+_httpx: Optional[Any] = None
+_loaded = False
+_load_lock = threading.Lock()
+# Hosts whose HTTP/2 connections failed at the protocol level; they stay on requests.
+_http1_hosts: set[str] = set()
+
+
+def http2_requested() -> bool:
+    return os.environ.get(HTTP2_ENV, "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _max_connections() -> int:
+    try:
+        return max(int(os.environ.get(HTTP2_MAX_CONNECTIONS_ENV, DEFAULT_MAX_CONNECTIONS)), 1)
+    except ValueError:
+        return DEFAULT_MAX_CONNECTIONS
+
+
+def _load_client() -> Optional[Any]:
+    """Build the shared httpx client once; ``None`` when httpx or h2 is missing."""
+    global _client, _httpx, _loaded
+    if _loaded:
+        return _client
+    with _load_lock:
+        if not _loaded:
+            try:
+                httpx = importlib.import_module("httpx")
+                importlib.import_module("h2")
+            except ImportError:
+                logger.info("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1")
+            else:
+                limit = _max_connections()
+                try:
+                    transport = httpx.HTTPTransport(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=limit,
+                            max_keepalive_connections=limit,
+                            keepalive_expiry=KEEPALIVE_SECONDS,
+                        ),
+                        # Headers and body go out as separate writes; without this Nagle delays the body.
+                        socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)],
+                    )
+                    _client = httpx.Client(transport=transport, follow_redirects=True)
+                    _httpx = httpx
+                except Exception as exc:
+                    # httpcore imports trio when it is installed, which fails under gevent's patched select.
+                    logger.warning("HTTP/2 client unavailable (%s); using HTTP/1.1", exc)
+            _loaded = True
+    return _client
+
+
+def http2_client(url: str) -> Optional[Any]:
+    """The HTTP/2 client to use for ``url``, or ``None`` to stay on ``requests``.
+
+    Hosts that negotiate HTTP/1.1 (ALPN, or plain ``http://``) still share the
+    client's pooled connections.
+    """
+    if not http2_requested() or urlsplit(url).netloc in _http1_hosts:
+        return None
+    return _load_client()
+
+
+def _to_requests_response(response: Any) -> requests.Response:
+    """Wrap an httpx response so callers keep the ``requests`` API."""
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.headers = CaseInsensitiveDict(response.headers.multi_items())
+    converted._content = response.content
+    converted.url = str(response.url)
+    converted.reason = response.reason_phrase
+    converted.encoding = response.encoding
+    converted.elapsed = response.elapsed
+    return converted
+
+
+def send(
+    client: Any,
+    method: str,
+    url: str,
+    endpoint: str,
+    phase: str,
+    timeout: float,
+    headers: Optional[dict[str, str]],
+    body: Optional[bytes],
+) -> requests.Response:
+    """Send one request over ``client``, raising ``requests`` exceptions on failure.
+
+    A protocol error moves the host to HTTP/1.1 for the rest of the process;
+    idempotent requests are resent there right away (and counted as retries),
+    on the shared ``requests`` session with what is left of the deadline.
+    """
+    httpx = _httpx
+    try:
+        response = client.request(method, url, headers=headers, content=body, timeout=timeout)
+    except httpx.TimeoutException as exc:
+        raise requests.exceptions.Timeout(str(exc)) from exc
+    except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as exc:
+        host = urlsplit(url).netloc
+        _http1_hosts.add(host)
+        REGISTRY.count_event("http2_fallback", endpoint)
+        logger.warning("HTTP/2 to %s failed (%s); falling back to HTTP/1.1", host, exc)
+        if method.upper() not in _IDEMPOTENT_METHODS:
+            raise requests.exceptions.ConnectionError(str(exc)) from exc
+        REGISTRY.count_retry(endpoint, phase)
+        from tools.http_client import shared_session
+
+        return shared_session().request(method, url, headers=headers, data=body, timeout=step_timeout(timeout, phase))
+    except httpx.TransportError as exc:
+        raise requests.exceptions.ConnectionError(str(exc)) from exc
+
+    if response.http_version == "HTTP/2":
+        REGISTRY.count_event("http2_response", endpoint)
+    return _to_requests_response(response)
+
+
+def close() -> None:
+    """Close the shared client's connections (a new client is built on next use)."""
+    global _client, _loaded
+    with _load_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _loaded = False
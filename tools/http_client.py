@@ -0,0 +1,222 @@
+# author: sawyer-shi
+
+import base64
+import binascii
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+import requests
+
+from tools.adaptive_limit import adaptive_slot
+from tools.deadline import DeadlineExceeded, check_deadline, step_timeout
+from tools.http2_transport import http2_client, send
+from tools.memory_budget import BUDGET
+from tools.metrics import REGISTRY
+from tools.tracing import inject_headers, span
+from tools.warmup import note_origin
+
+POOL_SIZE_ENV = "KLING_POOL_SIZE"
+DEFAULT_POOL_SIZE = 16
+
+# Media transfers (CDN downloads, object storage uploads) stay on requests.
+_MEDIA_PHASES = {"download", "upload"}
+# These bypass the Kling API limiter and trace headers.
+_UNLIMITED_PHASES = _MEDIA_PHASES | {"warmup"}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def shared_session() -> requests.Session:
+    """The process-wide ``requests`` session; keeps keep-alive connections per host."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                try:
+                    size = max(int(os.environ.get(POOL_SIZE_ENV, DEFAULT_POOL_SIZE)), 1)
+                except ValueError:
+                    size = DEFAULT_POOL_SIZE
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+@functools.lru_cache(maxsize=64)
+def _token_account(token: str) -> str:
+    """Short digest of the access key a Kling JWT was signed for (its ``iss`` claim)."""
+    try:
+        claims = token.split(".")[1]
+        issuer = json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4))).get("iss")
+    except (IndexError, ValueError, binascii.Error, AttributeError):
+        return ""
+    return hashlib.sha256(str(issuer).encode("utf-8")).hexdigest()[:8] if issuer else ""
+
+
+def _account(headers: Optional[dict[str, str]]) -> str:
+    authorization = (headers or {}).get("Authorization") or ""
+    return _token_account(authorization[7:]) if authorization.startswith("Bearer ") else ""
+
+
+def _request(
+    method: str,
+    url: str,
+    endpoint: str,
+    phase: str,
+    timeout: float,
+    headers: Optional[dict[str, str]],
+    body: Optional[bytes],
+) -> requests.Response:
+    if phase != "warmup":
+        note_origin(url)
+    budget = step_timeout(timeout, phase)
+    started = time.perf_counter()
+    # Kling API calls may share multiplexed HTTP/2 connections; media transfers stay on requests.
+    client = None if phase in _MEDIA_PHASES else http2_client(url)
+    try:
+        if client is not None:
+            response = send(client, method, url, endpoint, phase, budget, headers, body)
+        else:
+            response = shared_session().request(method, url, headers=headers, data=body, timeout=budget)
+    except requests.exceptions.Timeout as exc:
+        REGISTRY.count_response(endpoint, phase, "timeout")
+        if budget < timeout and not isinstance(exc, DeadlineExceeded):
+            # Cut short by the invocation deadline, not by a slow server.
+            REGISTRY.count_event("deadline_exceeded", phase)
+            raise DeadlineExceeded(f"调用时间预算已用尽: {exc}") from exc
+        raise
+    except requests.exceptions.RequestException:
+        REGISTRY.count_response(endpoint, phase, "error")
+        raise
+    finally:
+        REGISTRY.observe_latency(endpoint, phase, time.perf_counter() - started)
+    return response
+
+
+def _send(
+    method: str,
+    url: str,
+    endpoint: str,
+    phase: str,
+    timeout: float,
+    headers: Optional[dict[str, str]] = None,
+    body: Optional[bytes] = None,
+) -> requests.Response:
+    attributes = {
+        "http.method": method,
+        "http.url": url.split("?", 1)[0],
+        "kling.endpoint": endpoint,
+        "kling.phase": phase,
+    }
+    # Request bodies are already built, so they are counted without waiting; waiting would only add latency.
+    with span(f"HTTP {method}", **attributes) as current, BUDGET.reserve(len(body or b""), endpoint, wait=False):
+        if phase in _UNLIMITED_PHASES:
+            response = _request(method, url, endpoint, phase, timeout, headers, body)
+        else:
+            headers = inject_headers(headers)
+            # Kling API calls share an adaptive in-flight limit per endpoint family and account; transfers do not.
+            with adaptive_slot(endpoint, phase, _account(headers)) as slot:
+                response = _request(method, url, endpoint, phase, timeout, headers, body)
+                slot.status = response.status_code
+
+        received = len(response.content)
+        current.set_attribute("http.status_code", response.status_code)
+        current.set_attribute("kling.bytes_sent", len(body or b""))
+        current.set_attribute("kling.bytes_received", received)
+        REGISTRY.count_response(endpoint, phase, str(response.status_code))
+        REGISTRY.add_bytes(endpoint, phase, sent=len(body or b""), received=received)
+        return response
+
+
+def post_json(
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    payload: Any,
+    timeout: float = 60,
+    phase: str = "create",
+) -> requests.Response:
+    """POST a JSON payload to the Kling API and record it in the metrics registry."""
+    with span("kling.payload.serialize", **{"kling.endpoint": endpoint}) as current:
+        body = json.dumps(payload, allow_nan=False).encode("utf-8")
+        current.set_attribute("kling.bytes", len(body))
+    return _send("POST", url, endpoint, phase, timeout, headers=headers, body=body)
+
+
+def get_json(
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    timeout: float = 60,
+    phase: str = "query",
+) -> requests.Response:
+    """GET a Kling API resource and record it in the metrics registry."""
+    return _send("GET", url, endpoint, phase, timeout, headers=headers)
+
+
+def send_bytes(
+    method: str,
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    body: Optional[bytes] = None,
+    timeout: float = 300,
+    phase: str = "upload",
+) -> requests.Response:
+    """Send a raw request body (e.g. to object storage) and record it in the metrics registry."""
+    return _send(method, url, endpoint, phase, timeout, headers=headers, body=body)
+
+
+@contextmanager
+def open_media(
+    url: str, endpoint: str, chunk_size: int, timeout: float = 120
+) -> Iterator[tuple[requests.Response, Iterator[bytes]]]:
+    """Open a streamed download of a generated result file; yields the response and its chunks."""
+    note_origin(url)
+    budget = step_timeout(timeout, "download")
+    started = time.perf_counter()
+    received = 0
+    status = "error"
+
+    def chunks(response: requests.Response) -> Iterator[bytes]:
+        nonlocal received
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+            # The socket timeout only bounds each read; the deadline bounds the whole transfer.
+            check_deadline("download")
+            yield chunk
+
+    try:
+        with shared_session().get(url, stream=True, timeout=budget) as response:
+            status = str(response.status_code)
+            yield response, chunks(response)
+    except requests.exceptions.Timeout as exc:
+        status = "timeout"
+        if budget < timeout and not isinstance(exc, DeadlineExceeded):
+            REGISTRY.count_event("deadline_exceeded", "download")
+            raise DeadlineExceeded(f"调用时间预算已用尽: {exc}") from exc
+        raise
+    finally:
+        REGISTRY.observe_latency(endpoint, "download", time.perf_counter() - started)
+        REGISTRY.count_response(endpoint, "download", status)
+        REGISTRY.add_bytes(endpoint, "download", received=received)
+
+
+def iter_media(url: str, endpoint: str, chunk_size: int, timeout: float = 120) -> Iterator[bytes]:
+    """Stream a generated result file in chunks without holding it in memory.
+
+    Raises ``requests.HTTPError`` for non-200 responses.
+    """
+    with open_media(url, endpoint, chunk_size, timeout) as (response, chunks):
+        response.raise_for_status()
+        yield from chunks
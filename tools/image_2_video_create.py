@@ -9,17 +9,33 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from tools.deadline import deadline_invoke
+from tools.element_registry import resolve_element_list
+from tools.masks import prepare_dynamic_masks, prepare_static_mask, source_size
+from tools.memo import load_memo, memo_key_for, save_memo
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.submission_queue import enqueue_create, queue_requested
+from tools.task_poller import track_task
+from tools.tracing import traced_invoke
 from tools.utils import (
+    build_api_url,
     build_watermark_info,
     get_api_token,
     parse_json_param,
     resolve_media_input,
 )
+from tools.validation import validate_tool_parameters
 
 logger = logging.getLogger(__name__)
 
 
 class Image2VideoCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling image-to-video create task."""
         logger.info("Starting image-to-video create task")
@@ -32,15 +48,25 @@ class Image2VideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        image_input = resolve_media_input(tool_parameters.get("image"))
-        image_tail_input = resolve_media_input(tool_parameters.get("image_tail"))
+        errors = validate_tool_parameters("image_2_video_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        queued = queue_requested(tool_parameters)
+        # Queued jobs are sent later, after a signed file URL may have expired, so their media is always inlined.
+        policy = "inline" if queued else None
+        image_input = resolve_media_input(tool_parameters.get("image"), "image", policy)
+        image_tail_input = resolve_media_input(tool_parameters.get("image_tail"), "image_tail", policy)
         if not image_input and not image_tail_input:
             msg = "❌ 请输入首帧 image 或尾帧 image_tail"
             logger.warning(msg)
             yield self.create_text_message(msg)
             return
 
-        api_url = "https://api-beijing.klingai.com/v1/videos/image2video"
+        api_url = build_api_url("v1/videos/image2video")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -78,7 +104,12 @@ class Image2VideoCreateTool(Tool):
 
         element_list = parse_json_param(tool_parameters.get("element_list"), "element_list")
         if element_list:
-            payload["element_list"] = element_list
+            try:
+                payload["element_list"] = resolve_element_list(self, element_list)
+            except ValueError as exc:
+                logger.warning(str(exc))
+                yield self.create_text_message(str(exc))
+                return
 
         voice_list = parse_json_param(tool_parameters.get("voice_list"), "voice_list")
         if voice_list:
@@ -104,13 +135,21 @@ class Image2VideoCreateTool(Tool):
         if aspect_ratio:
             payload["aspect_ratio"] = aspect_ratio
 
-        static_mask = resolve_media_input(tool_parameters.get("static_mask"))
-        if static_mask:
-            payload["static_mask"] = static_mask
-
+        static_mask = tool_parameters.get("static_mask")
         dynamic_masks = parse_json_param(tool_parameters.get("dynamic_masks"), "dynamic_masks")
-        if dynamic_masks:
-            payload["dynamic_masks"] = dynamic_masks
+        if static_mask or dynamic_masks:
+            # Measured only when the image is already inlined; a passed-through URL stays undownloaded.
+            size = source_size(image_input or image_tail_input)
+            try:
+                if static_mask:
+                    payload["static_mask"] = prepare_static_mask(static_mask, size, policy)
+                if dynamic_masks:
+                    payload["dynamic_masks"] = prepare_dynamic_masks(dynamic_masks, size)
+            except ValueError as exc:
+                msg = f"❌ 蒙版处理失败: {exc}"
+                logger.warning(msg)
+                yield self.create_text_message(msg)
+                return
 
         watermark = build_watermark_info(tool_parameters.get("watermark"))
         if watermark:
@@ -124,6 +163,27 @@ class Image2VideoCreateTool(Tool):
         if external_task_id:
             payload["external_task_id"] = external_task_id
 
+        scope = self.runtime.credentials.get("access_key", "")
+        memo_key = memo_key_for(tool_parameters, "image2video", payload, scope)
+        memoized = load_memo(self, memo_key, "image2video")
+        if memoized:
+            yield self.create_text_message(f"♻️ 命中生成缓存，复用任务: {memoized['data'].get('task_id')}")
+            yield self.create_json_message(memoized)
+            return
+
+        if queued:
+            try:
+                job = enqueue_create(self, "image2video", "v1/videos/image2video", payload)
+            except Exception as exc:
+                msg = f"❌ 加入提交队列失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            yield self.create_text_message(f"📥 已加入提交队列，队列任务ID: {job['job_id']}")
+            yield self.create_text_message("💡 请使用提交队列查询工具获取可灵任务ID")
+            yield self.create_json_message(job)
+            return
+
         yield self.create_text_message("🚀 图生视频任务启动中...")
         yield self.create_text_message(f"🤖 模型: {model_name}")
         if prompt:
@@ -134,7 +194,15 @@ class Image2VideoCreateTool(Tool):
 
         try:
             logger.info("Submitting image2video payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response, shared = post_create(
+                api_url,
+                "image2video",
+                headers=headers,
+                payload=payload,
+                scope=scope,
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -146,6 +214,9 @@ class Image2VideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        if shared:
+            yield self.create_text_message("♻️ 检测到相同的请求，已复用同一任务")
+
         if response.status_code != 200:
             logger.error("API status %s: %s", response.status_code, response.text[:300])
             yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
@@ -177,4 +248,6 @@ class Image2VideoCreateTool(Tool):
         if task_status:
             yield self.create_text_message(f"📊 状态: {task_status}")
         yield self.create_text_message("💡 请使用图生视频查询工具获取结果")
+        save_memo(self, memo_key, resp_data)
+        track_task(self.runtime.credentials, "image2video", "v1/videos/image2video", resp_data, payload)
         yield self.create_json_message(resp_data)
@@ -9,12 +9,32 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import build_watermark_info, get_api_token, resolve_media_input
+from tools.deadline import deadline_invoke
+from tools.element_registry import resolve_element_list
+from tools.memo import load_memo, memo_key_for, save_memo
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.submission_queue import enqueue_create, queue_requested
+from tools.task_poller import track_task
+from tools.tracing import traced_invoke
+from tools.utils import (
+    build_api_url,
+    build_watermark_info,
+    get_api_token,
+    parse_json_param,
+    resolve_media_input,
+)
+from tools.validation import validate_tool_parameters
 
 logger = logging.getLogger(__name__)
 
 
 class ImageGenerationCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling image generation create task."""
         logger.info("Starting image generation create task")
@@ -27,6 +47,13 @@ class ImageGenerationCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        errors = validate_tool_parameters("image_generation_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
         prompt = (tool_parameters.get("prompt") or "").strip()
         if not prompt:
             msg = "❌ 请输入提示词"
@@ -34,7 +61,7 @@ class ImageGenerationCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        api_url = "https://api-beijing.klingai.com/v1/images/generations"
+        api_url = build_api_url("v1/images/generations")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -50,13 +77,21 @@ class ImageGenerationCreateTool(Tool):
         if negative_prompt:
             payload["negative_prompt"] = negative_prompt
 
-        image_input = resolve_media_input(tool_parameters.get("image"))
+        queued = queue_requested(tool_parameters)
+        # Queued jobs are sent later, after a signed file URL may have expired, so their media is always inlined.
+        policy = "inline" if queued else None
+        image_input = resolve_media_input(tool_parameters.get("image"), "image", policy)
         if image_input:
             payload["image"] = image_input
 
-        element_list = tool_parameters.get("element_list")
+        element_list = parse_json_param(tool_parameters.get("element_list"), "element_list")
         if element_list:
-            payload["element_list"] = element_list
+            try:
+                payload["element_list"] = resolve_element_list(self, element_list)
+            except ValueError as exc:
+                logger.warning(str(exc))
+                yield self.create_text_message(str(exc))
+                return
 
         resolution = tool_parameters.get("resolution")
         if resolution:
@@ -82,6 +117,27 @@ class ImageGenerationCreateTool(Tool):
         if external_task_id:
             payload["external_task_id"] = external_task_id
 
+        scope = self.runtime.credentials.get("access_key", "")
+        memo_key = memo_key_for(tool_parameters, "image-generations", payload, scope)
+        memoized = load_memo(self, memo_key, "image-generations")
+        if memoized:
+            yield self.create_text_message(f"♻️ 命中生成缓存，复用任务: {memoized['data'].get('task_id')}")
+            yield self.create_json_message(memoized)
+            return
+
+        if queued:
+            try:
+                job = enqueue_create(self, "image-generations", "v1/images/generations", payload)
+            except Exception as exc:
+                msg = f"❌ 加入提交队列失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            yield self.create_text_message(f"📥 已加入提交队列，队列任务ID: {job['job_id']}")
+            yield self.create_text_message("💡 请使用提交队列查询工具获取可灵任务ID")
+            yield self.create_json_message(job)
+            return
+
         yield self.create_text_message("🚀 图像生成任务启动中...")
         yield self.create_text_message(f"🤖 模型: {model_name}")
         yield self.create_text_message(
@@ -91,7 +147,15 @@ class ImageGenerationCreateTool(Tool):
 
         try:
             logger.info("Submitting image generation payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response, shared = post_create(
+                api_url,
+                "image-generations",
+                headers=headers,
+                payload=payload,
+                scope=scope,
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -103,6 +167,9 @@ class ImageGenerationCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        if shared:
+            yield self.create_text_message("♻️ 检测到相同的请求，已复用同一任务")
+
         if response.status_code != 200:
             logger.error("API status %s: %s", response.status_code, response.text[:300])
             yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
@@ -134,4 +201,6 @@ class ImageGenerationCreateTool(Tool):
         if task_status:
             yield self.create_text_message(f"📊 状态: {task_status}")
         yield self.create_text_message("💡 请使用图像生成查询工具获取结果")
+        save_memo(self, memo_key, resp_data)
+        track_task(self.runtime.credentials, "image-generations", "v1/images/generations", resp_data, payload)
         yield self.create_json_message(resp_data)
@@ -9,35 +9,56 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import format_timestamp, get_api_token, resolve_task_id
+from tools.deadline import deadline_invoke
+from tools.http_client import get_json
+from tools.key_pool import get_task_api_token
+from tools.memo import record_task_outcome
+from tools.memory_budget import deliver_download
+from tools.object_sink import result_sink
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.task_poller import cached_task, publish_task
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, format_timestamp, resolve_task_id
 
 logger = logging.getLogger(__name__)
 
 
 class ImageGenerationQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling image generation single task query."""
         logger.info("Starting image generation query task")
 
         try:
-            api_token = get_api_token(self.runtime)
+            task_id = resolve_task_id(tool_parameters)
+        except ValueError as exc:
+            msg = str(exc)
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        try:
+            api_token = get_task_api_token(self, task_id)
         except Exception as exc:
             msg = f"❌ 凭证获取失败: {exc}"
             logger.error(msg)
             yield self.create_text_message(msg)
             return
 
+        download_image = tool_parameters.get("download_image", "true") == "true"
         try:
-            task_id = resolve_task_id(tool_parameters)
+            sink = result_sink(self, tool_parameters)
         except ValueError as exc:
-            msg = str(exc)
+            msg = f"❌ {exc}"
             logger.warning(msg)
             yield self.create_text_message(msg)
             return
 
-        download_image = tool_parameters.get("download_image", "true") == "true"
-
-        api_url = f"https://api-beijing.klingai.com/v1/images/generations/{task_id}"
+        api_url = build_api_url(f"v1/images/generations/{task_id}")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -47,40 +68,47 @@ class ImageGenerationQueryTool(Tool):
         yield self.create_text_message(f"📋 任务ID: {task_id}")
         if download_image:
             yield self.create_text_message("⬇️ 图片下载已开启")
-
-        try:
-            response = requests.get(api_url, headers=headers, timeout=60)
-        except requests.exceptions.Timeout:
-            msg = "❌ 请求超时，请稍后重试"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-        except requests.exceptions.RequestException as exc:
-            msg = f"❌ 请求失败: {exc}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-
-        if response.status_code != 200:
-            logger.error("API status %s: %s", response.status_code, response.text[:300])
-            yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
-            if response.text:
-                yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
-            return
-
-        try:
-            resp_data = response.json()
-        except json.JSONDecodeError as exc:
-            logger.error("Failed to parse JSON: %s", exc)
-            yield self.create_text_message("❌ API 响应解析失败（非JSON）")
-            return
-
-        if resp_data.get("code") != 0:
-            msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            yield self.create_json_message(resp_data)
-            return
+        if sink is not None:
+            yield self.create_text_message("☁️ 结果将直接转存到对象存储")
+
+        resp_data = cached_task(self.runtime.credentials, "image-generations", task_id)
+        if resp_data is not None:
+            yield self.create_text_message("⚡ 命中本地任务缓存（后台轮询）")
+        else:
+            try:
+                response = get_json(api_url, "image-generations", headers=headers, timeout=60)
+            except requests.exceptions.Timeout:
+                msg = "❌ 请求超时，请稍后重试"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            except requests.exceptions.RequestException as exc:
+                msg = f"❌ 请求失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+
+            if response.status_code != 200:
+                logger.error("API status %s: %s", response.status_code, response.text[:300])
+                yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
+                if response.text:
+                    yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
+                return
+
+            try:
+                resp_data = response.json()
+            except json.JSONDecodeError as exc:
+                logger.error("Failed to parse JSON: %s", exc)
+                yield self.create_text_message("❌ API 响应解析失败（非JSON）")
+                return
+
+            if resp_data.get("code") != 0:
+                msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                yield self.create_json_message(resp_data)
+                return
+            publish_task(self.runtime.credentials, "image-generations", "v1/images/generations", task_id, resp_data)
 
         data = resp_data.get("data", {})
         task_status = data.get("task_status")
@@ -88,6 +116,7 @@ class ImageGenerationQueryTool(Tool):
         created_at = format_timestamp(data.get("created_at"))
         updated_at = format_timestamp(data.get("updated_at"))
         task_result = data.get("task_result", {})
+        record_task_outcome(self, task_id, task_status, task_result)
 
         yield self.create_text_message("✅ 查询成功")
         yield self.create_text_message(f"📊 状态: {task_status}")
@@ -105,22 +134,25 @@ class ImageGenerationQueryTool(Tool):
                     url = item.get("url")
                     watermark_url = item.get("watermark_url")
                     yield self.create_text_message(f"#{idx} {url}")
-                    if download_image and url:
+                    if sink is not None and url:
+                        yield from sink.upload(url, "image-generations", f"{task_id}_{idx}.png", "image/png")
+                    elif download_image and url:
                         yield self.create_text_message("⬇️ 正在下载图片...")
                         try:
-                            image_response = requests.get(url, timeout=120)
-                            if image_response.status_code == 200:
-                                yield self.create_blob_message(
-                                    blob=image_response.content,
-                                    meta={
-                                        "mime_type": "image/png",
-                                        "filename": f"{task_id}_{idx}.png",
-                                    },
-                                )
+                            status = yield from deliver_download(
+                                self,
+                                url,
+                                "image-generations",
+                                meta={
+                                    "mime_type": "image/png",
+                                    "filename": f"{task_id}_{idx}.png",
+                                },
+                            )
+                            if status == 200:
                                 yield self.create_text_message("✅ 图片下载完成")
                             else:
                                 yield self.create_text_message(
-                                    f"❌ 图片下载失败，状态码: {image_response.status_code}"
+                                    f"❌ 图片下载失败，状态码: {status}"
                                 )
                         except requests.exceptions.RequestException as exc:
                             yield self.create_text_message(f"❌ 图片下载失败: {exc}")
@@ -128,4 +160,6 @@ class ImageGenerationQueryTool(Tool):
                         yield self.create_text_message(f"水印链接: {watermark_url}")
                 yield self.create_text_message("⚠️ 生成的图片将于30天后清理，请及时转存")
 
+        if sink is not None:
+            resp_data["objects"] = sink.objects
         yield self.create_json_message(resp_data)
@@ -0,0 +1,318 @@
+# author: sawyer-shi
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from provider.kling_aigc import KlingAigcProvider
+from tools.local_db import get_db
+from tools.metrics import REGISTRY, timed
+from tools.tracing import span
+
+logger = logging.getLogger(__name__)
+
+KEY_POOL_POLICY_ENV = "KLING_KEY_POOL_POLICY"
+LEAST_LOADED = "least_loaded"
+WEIGHTED_ROUND_ROBIN = "weighted_rr"
+
+# Kling business codes returned with HTTP 429 for arrears / an empty resource pack;
+# other 429s (1302, 1303) are rate or concurrency limits and back off exponentially.
+EXHAUSTED_CODES = {1101, 1102}
+EXHAUSTED_COOLDOWN_SECONDS = 600.0
+MAX_THROTTLE_COOLDOWN_SECONDS = 60.0
+MAX_PINNED_TASKS = 10000
+# Kling keeps tasks for 30 days; older pins can never be queried again.
+PIN_RETENTION_SECONDS = 30 * 86400.0
+PIN_PRUNE_INTERVAL_SECONDS = 3600.0
+
+_PIN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_keys (
+    task_id TEXT PRIMARY KEY,
+    access_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class KeyPair:
+    access_key: str
+    secret_key: str
+    weight: int = 1
+
+
+@dataclass
+class _KeyState:
+    pair: KeyPair
+    in_flight: int = 0
+    requests: int = 0
+    throttled: int = 0
+    consecutive_throttles: int = 0
+    cooldown_until: float = 0.0
+    exhausted: bool = False
+    current_weight: int = 0
+    last_used: float = 0.0
+
+
+def _parse_entry(entry: Any) -> Optional[KeyPair]:
+    if isinstance(entry, dict):
+        access_key, secret_key = entry.get("access_key"), entry.get("secret_key")
+        weight = entry.get("weight", 1)
+    else:
+        parts = [part.strip() for part in str(entry).split(":")]
+        if len(parts) < 2:
+            raise ValueError("key_pool entries must look like access_key:secret_key[:weight]")
+        access_key, secret_key = parts[0], parts[1]
+        weight = parts[2] if len(parts) > 2 and parts[2] else 1
+    if not access_key or not secret_key:
+        return None
+    return KeyPair(str(access_key), str(secret_key), max(int(weight), 1))
+
+
+def account_scope(credentials: dict[str, Any]) -> str:
+    """Short digest of the primary access key; separates accounts in shared caches and tables."""
+    access_key = str((credentials or {}).get("access_key", ""))
+    return hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_key_pool(credentials: dict[str, Any]) -> list[KeyPair]:
+    """The primary key pair followed by the extra pairs of the ``key_pool`` credential.
+
+    ``key_pool`` is either a JSON array of ``{"access_key", "secret_key", "weight"}``
+    objects or ``access_key:secret_key[:weight]`` entries separated by commas,
+    semicolons or new lines. Raises ``ValueError`` for malformed entries.
+    """
+    pairs = []
+    if credentials.get("access_key") and credentials.get("secret_key"):
+        pairs.append(KeyPair(str(credentials["access_key"]), str(credentials["secret_key"])))
+
+    raw = str(credentials.get("key_pool") or "").strip()
+    if raw.startswith("["):
+        try:
+            entries = json.loads(raw)
+        except json.JSONDecodeError as exc:
+            raise ValueError("key_pool is not valid JSON") from exc
+    else:
+        entries = [item for item in raw.replace(";", "\n").replace(",", "\n").splitlines() if item.strip()]
+
+    seen = {pair.access_key for pair in pairs}
+    for entry in entries:
+        pair = _parse_entry(entry)
+        if pair and pair.access_key not in seen:
+            seen.add(pair.access_key)
+            pairs.append(pair)
+    return pairs
+
+
+class KeyPool:
+    """Schedules requests across key pairs and keeps per-key load and 429 state."""
+
+    def __init__(self, pairs: list[KeyPair]) -> None:
+        self._lock = threading.Lock()
+        self._states = [_KeyState(pair) for pair in pairs]
+        self._by_access_key = {state.pair.access_key: state for state in self._states}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def label(self, pair: KeyPair) -> str:
+        """The pair's position in the pool ("0" is the primary key), for logs and metric labels."""
+        state = self._by_access_key.get(pair.access_key)
+        return str(self._states.index(state)) if state is not None else "?"
+
+    def _available(self, now: float) -> list[_KeyState]:
+        ready = [state for state in self._states if state.cooldown_until <= now and not state.exhausted]
+        if ready:
+            return ready
+        # Every key is cooling down: use the one that recovers first rather than block.
+        return [min(self._states, key=lambda state: state.cooldown_until)]
+
+    def _choose(self, policy: str, now: float) -> _KeyState:
+        probe = next((state for state in self._states if state.exhausted and state.cooldown_until <= now), None)
+        if probe is not None:
+            # One request per cooldown checks whether an exhausted account has been topped up;
+            # until one succeeds the key stays out of the rotation.
+            probe.cooldown_until = now + EXHAUSTED_COOLDOWN_SECONDS
+            return probe
+        candidates = self._available(now)
+        if policy == WEIGHTED_ROUND_ROBIN:
+            # Smooth weighted round-robin, as used by nginx upstreams.
+            total = sum(state.pair.weight for state in candidates)
+            for state in candidates:
+                state.current_weight += state.pair.weight
+            chosen = max(candidates, key=lambda state: state.current_weight)
+            chosen.current_weight -= total
+            return chosen
+        return min(candidates, key=lambda state: (state.in_flight / state.pair.weight, state.last_used))
+
+    def acquire(self, access_key: Optional[str] = None, policy: str = LEAST_LOADED) -> KeyPair:
+        with self._lock:
+            now = time.monotonic()
+            state = self._by_access_key.get(access_key) if access_key else None
+            state = state or self._choose(policy, now)
+            state.in_flight += 1
+            state.requests += 1
+            state.last_used = now
+            return state.pair
+
+    def release(self, pair: KeyPair, status: Optional[int] = None, code: Optional[int] = None) -> None:
+        with self._lock:
+            state = self._by_access_key.get(pair.access_key)
+            if state is None:
+                return
+            state.in_flight = max(state.in_flight - 1, 0)
+            if status != 429:
+                if status is not None and status < 500:
+                    state.consecutive_throttles = 0
+                    if state.exhausted:
+                        state.exhausted = False
+                        state.cooldown_until = 0.0
+                return
+            state.throttled += 1
+            if code in EXHAUSTED_CODES:
+                state.exhausted = True
+                cooldown = EXHAUSTED_COOLDOWN_SECONDS
+            else:
+                state.consecutive_throttles += 1
+                cooldown = min(2.0 ** state.consecutive_throttles, MAX_THROTTLE_COOLDOWN_SECONDS)
+            state.cooldown_until = time.monotonic() + cooldown
+            index = self._states.index(state)
+        logger.warning("Key #%d got 429 (code %s), cooling down for %.0fs", index, code, cooldown)
+
+
+_pools: dict[tuple[KeyPair, ...], KeyPool] = {}
+_pools_lock = threading.Lock()
+_pinned: "OrderedDict[str, str]" = OrderedDict()
+_pinned_lock = threading.Lock()
+
+
+def get_key_pool(credentials: dict[str, Any]) -> KeyPool:
+    """The process-wide pool for these credentials, so load is tracked across invocations."""
+    pairs = tuple(parse_key_pool(credentials))
+    pool = _pools.get(pairs)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(pairs)
+            if pool is None:
+                pool = _pools[pairs] = KeyPool(list(pairs))
+    return pool
+
+
+def pool_policy() -> str:
+    policy = os.environ.get(KEY_POOL_POLICY_ENV, LEAST_LOADED).strip().lower()
+    return policy if policy in {LEAST_LOADED, WEIGHTED_ROUND_ROBIN} else LEAST_LOADED
+
+
+def sign_token(pair: KeyPair) -> str:
+    with span("kling.auth.token_sign"), timed("auth", "token_sign"):
+        return KlingAigcProvider._encode_jwt_token(pair.access_key, pair.secret_key)
+
+
+class KeyLease:
+    """One request's claim on a pool key; pins the created task to that key."""
+
+    def __init__(self, pool: KeyPool, pair: KeyPair) -> None:
+        self.pool = pool
+        self.pair = pair
+        self.token = sign_token(pair)
+        self._released = False
+
+    def release(self, status: Optional[int] = None, code: Optional[int] = None) -> None:
+        """Return the key to the pool, recording a 429 (and its business code) if any."""
+        if self._released:
+            return
+        self._released = True
+        self.pool.release(self.pair, status, code)
+        if status == 429:
+            REGISTRY.count_event("key_throttled", self.pool.label(self.pair))
+
+    def pin(self, *task_ids: Optional[str]) -> None:
+        if len(self.pool) > 1:
+            for task_id in task_ids:
+                if task_id:
+                    pin_task(str(task_id), self.pair.access_key)
+
+
+@contextmanager
+def lease_key(credentials: dict[str, Any], pooled: bool = True) -> Iterator[KeyLease]:
+    """Lease a key for one create request; ``pooled=False`` forces the primary key."""
+    pool = get_key_pool(credentials)
+    primary = None if pooled else credentials.get("access_key")
+    lease = KeyLease(pool, pool.acquire(primary, pool_policy()))
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+_last_prune = 0.0
+
+
+def _pin_db() -> Any:
+    """The pin table, with pins past Kling's retention pruned at most once an hour."""
+    global _last_prune
+    db = get_db()
+    db.ensure_schema("task_keys", _PIN_SCHEMA)
+    now = time.monotonic()
+    if not _last_prune or now - _last_prune > PIN_PRUNE_INTERVAL_SECONDS:
+        _last_prune = now
+        db.transaction([("DELETE FROM task_keys WHERE created_at < ?", (time.time() - PIN_RETENTION_SECONDS,))])
+    return db
+
+
+def pin_task(task_id: str, access_key: str) -> None:
+    """Remember which key created ``task_id``; pins live in the local database, not plugin storage."""
+    with _pinned_lock:
+        _pinned[task_id] = access_key
+        _pinned.move_to_end(task_id)
+        while len(_pinned) > MAX_PINNED_TASKS:
+            _pinned.popitem(last=False)
+    try:
+        _pin_db().transaction(
+            [
+                (
+                    "INSERT OR REPLACE INTO task_keys (task_id, access_key, created_at) VALUES (?, ?, ?)",
+                    (task_id, access_key, time.time()),
+                )
+            ]
+        )
+    except Exception as exc:
+        logger.debug("Task pin for %s kept in memory only: %s", task_id, exc)
+
+
+def pinned_access_key(task_id: Optional[str]) -> Optional[str]:
+    if not task_id:
+        return None
+    with _pinned_lock:
+        access_key = _pinned.get(task_id)
+    if access_key:
+        return access_key
+    try:
+        rows = _pin_db().query("SELECT access_key FROM task_keys WHERE task_id = ?", (task_id,))
+    except Exception as exc:
+        logger.debug("No stored key pin for %s: %s", task_id, exc)
+        return None
+    return rows[0]["access_key"] if rows else None
+
+
+def task_key_pair(credentials: dict[str, Any], task_id: Optional[str]) -> KeyPair:
+    """The key pair that created ``task_id``, else the primary pair."""
+    pairs = parse_key_pool(credentials)
+    if not pairs:
+        raise ValueError("Access Key and Secret Key are required")
+    if len(pairs) > 1:
+        access_key = pinned_access_key(task_id)
+        return next((item for item in pairs if item.access_key == access_key), pairs[0])
+    return pairs[0]
+
+
+def get_task_api_token(tool: Any, task_id: Optional[str]) -> str:
+    """Token for querying ``task_id``: the key that created it, else the primary key."""
+    return sign_token(task_key_pair(tool.runtime.credentials, task_id))
@@ -0,0 +1,160 @@
+# author: sawyer-shi
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+STATE_DB_ENV = "KLING_STATE_DB"
+# Older name of the same setting, from when the database only held the submission queue.
+LEGACY_DB_ENV = "KLING_QUEUE_DB"
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".kling_aigc", "state.db")
+# Secret for sealing stored credentials; without it a random key is kept in ``<db>.key`` (mode 0600).
+STATE_KEY_ENV = "KLING_STATE_KEY"
+SEAL_PREFIX = "v1:"
+_NONCE_BYTES = 16
+_TAG_BYTES = 32
+
+
+class SealError(ValueError):
+    """A sealed value was tampered with, sealed under another key, or is not sealed at all."""
+
+
+class LocalDb:
+    """A SQLite database (WAL) on the plugin's disk, shared by its worker processes.
+
+    Background threads keep their state here rather than in plugin storage,
+    which is only reachable through a live invocation's session.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._schemas: set[str] = set()
+        self._keys: Optional[tuple[bytes, bytes]] = None
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def ensure_schema(self, name: str, script: str) -> None:
+        """Run ``script`` (idempotent DDL) once per process for ``name``."""
+        with self._lock:
+            if name not in self._schemas:
+                self._conn.executescript(script)
+                self._schemas.add(name)
+
+    def add_column(self, table: str, column: str, definition: str) -> None:
+        """Add ``column`` to a table created by an earlier version, if it is missing."""
+        with self._lock:
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def query(self, sql: str, params: tuple[Any, ...] = ()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def immediate(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction; other processes wait (up to 30s) until it commits."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def transaction(self, statements: list[tuple[str, tuple[Any, ...]]]) -> None:
+        with self.immediate() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+    def _sealing_keys(self) -> tuple[bytes, bytes]:
+        """Encryption and MAC keys derived from ``KLING_STATE_KEY`` or the database's key file."""
+        if self._keys is None:
+            secret = os.environ.get(STATE_KEY_ENV, "").encode("utf-8") or self._key_file()
+            self._keys = (
+                hmac.new(secret, b"kling-state-encrypt", hashlib.sha256).digest(),
+                hmac.new(secret, b"kling-state-mac", hashlib.sha256).digest(),
+            )
+        return self._keys
+
+    def _key_file(self) -> bytes:
+        path = self.path + ".key"
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, "rb") as handle:
+                return handle.read()
+        key = secrets.token_bytes(32)
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(key)
+        return key
+
+    def seal(self, value: Any) -> str:
+        """``value`` as JSON, encrypted and authenticated for storage in this database.
+
+        Uses HMAC-SHA256 as a counter-mode keystream and encrypt-then-MAC, so no
+        extra dependency is needed.
+        """
+        encrypt_key, mac_key = self._sealing_keys()
+        plain = json.dumps(value).encode("utf-8")
+        nonce = secrets.token_bytes(_NONCE_BYTES)
+        cipher = bytes(a ^ b for a, b in zip(plain, _keystream(encrypt_key, nonce, len(plain))))
+        tag = hmac.new(mac_key, nonce + cipher, hashlib.sha256).digest()
+        return SEAL_PREFIX + base64.b64encode(nonce + cipher + tag).decode("ascii")
+
+    def unseal(self, text: str) -> Any:
+        """The value sealed by ``seal``; raises ``SealError`` when it cannot be verified."""
+        if not text or not text.startswith(SEAL_PREFIX):
+            raise SealError("value is not sealed")
+        encrypt_key, mac_key = self._sealing_keys()
+        try:
+            raw = base64.b64decode(text[len(SEAL_PREFIX):], validate=True)
+        except ValueError as exc:
+            raise SealError("sealed value is not valid base64") from exc
+        if len(raw) < _NONCE_BYTES + _TAG_BYTES:
+            raise SealError("sealed value is truncated")
+        nonce, cipher, tag = raw[:_NONCE_BYTES], raw[_NONCE_BYTES:-_TAG_BYTES], raw[-_TAG_BYTES:]
+        if not hmac.compare_digest(tag, hmac.new(mac_key, nonce + cipher, hashlib.sha256).digest()):
+            raise SealError("sealed value failed verification")
+        plain = bytes(a ^ b for a, b in zip(cipher, _keystream(encrypt_key, nonce, len(cipher))))
+        return json.loads(plain)
+
+
+def _keystream(key: bytes, nonce: bytes, length: int) -> bytes:
+    blocks = [
+        hmac.new(key, nonce + counter.to_bytes(8, "big"), hashlib.sha256).digest()
+        for counter in range((length + 31) // 32)
+    ]
+    return b"".join(blocks)[:length]
+
+
+_dbs: dict[str, LocalDb] = {}
+_dbs_lock = threading.Lock()
+
+
+def db_path() -> str:
+    return os.environ.get(STATE_DB_ENV) or os.environ.get(LEGACY_DB_ENV) or DEFAULT_DB_PATH
+
+
+def get_db() -> LocalDb:
+    path = db_path()
+    with _dbs_lock:
+        db = _dbs.get(path)
+        if db is None:
+            db = _dbs[path] = LocalDb(path)
+        return db
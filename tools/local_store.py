@@ -0,0 +1,47 @@
+# author: sawyer-shi
+
+import json
+import os
+from typing import Any, Optional
+
+
+def read_bytes(tool: Any, key: str, directory: Optional[str] = None) -> Optional[bytes]:
+    """Read ``key`` from ``directory`` when given, otherwise from plugin storage."""
+    if directory:
+        try:
+            with open(os.path.join(directory, key), "rb") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+    storage = tool.session.storage
+    return storage.get(key) if storage.exist(key) else None
+
+
+def write_bytes(tool: Any, key: str, value: bytes, directory: Optional[str] = None) -> None:
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key)
+        with open(f"{path}.tmp", "wb") as handle:
+            handle.write(value)
+        os.replace(f"{path}.tmp", path)
+        return
+    tool.session.storage.set(key, value)
+
+
+def delete_key(tool: Any, key: str, directory: Optional[str] = None) -> None:
+    if directory:
+        try:
+            os.remove(os.path.join(directory, key))
+        except FileNotFoundError:
+            pass
+        return
+    tool.session.storage.delete(key)
+
+
+def read_json(tool: Any, key: str, directory: Optional[str] = None) -> Optional[Any]:
+    raw = read_bytes(tool, key, directory)
+    return json.loads(raw) if raw else None
+
+
+def write_json(tool: Any, key: str, value: Any, directory: Optional[str] = None) -> None:
+    write_bytes(tool, key, json.dumps(value, ensure_ascii=False).encode("utf-8"), directory)
@@ -0,0 +1,145 @@
+# author: sawyer-shi
+
+import base64
+import binascii
+import importlib
+import io
+import logging
+import os
+from typing import Any, Optional
+
+from tools.concurrency import DEFAULT_CONCURRENCY, map_bounded
+from tools.metrics import REGISTRY
+from tools.tracing import span
+from tools.utils import resolve_media_input
+
+logger = logging.getLogger(__name__)
+
+MASK_PREPROCESS_ENV = "KLING_MASK_PREPROCESS"
+# Masks whose aspect ratio is further than this from the source image's are rejected, not stretched.
+ASPECT_TOLERANCE = 0.02
+BINARY_THRESHOLD = 128
+
+_image_module: Optional[Any] = None
+
+
+def mask_preprocessing_enabled() -> bool:
+    return os.environ.get(MASK_PREPROCESS_ENV, "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _pil() -> Optional[Any]:
+    """``PIL.Image``, imported on first use so tools without masks never load Pillow."""
+    global _image_module
+    if _image_module is None:
+        try:
+            _image_module = importlib.import_module("PIL.Image")
+        except ImportError:
+            logger.info("Pillow is not installed; masks are sent unprocessed")
+            return None
+    return _image_module
+
+
+def _media_bytes(value: Any) -> Optional[bytes]:
+    """Raw bytes of a file object, bytes or base64 string; ``None`` for URLs and anything else."""
+    if value is None:
+        return None
+    if hasattr(value, "blob"):
+        return value.blob
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if not text or text.startswith(("http://", "https://")):
+        return None
+    if text.startswith("data:"):
+        text = text.split(",", 1)[-1]
+    try:
+        return base64.b64decode(text, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def source_size(value: Any) -> Optional[tuple[int, int]]:
+    """``(width, height)`` of the source image, or ``None`` when it is a URL or unreadable.
+
+    Pass the resolved payload value: an image sent by URL is never downloaded
+    just to be measured, its masks are binarized at their own size.
+    """
+    image_module = _pil()
+    data = _media_bytes(value) if isinstance(value, (str, bytes)) else None
+    if image_module is None or data is None:
+        return None
+    try:
+        with image_module.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception as exc:
+        logger.debug("Could not read source image size: %s", exc)
+        return None
+
+
+def encode_mask(data: bytes, size: Optional[tuple[int, int]], label: str, index: Optional[int] = None) -> str:
+    """Binarize a mask to a 1-bit PNG at the source resolution; returns base64.
+
+    Transparent pixels count as unmasked when the mask has an alpha channel,
+    otherwise pixels brighter than mid-grey are masked. Raises ``ValueError``
+    when the mask cannot be decoded or its aspect ratio differs from ``size``.
+    ``label`` is the metric label (the field name); ``index`` only appears in
+    messages and logs, so the label set stays bounded.
+    """
+    name = label if index is None else f"{label}[{index}]"
+    image_module = _pil()
+    try:
+        image = image_module.open(io.BytesIO(data))
+        image.load()
+    except Exception as exc:
+        raise ValueError(f"{name} 无法解析为图片: {exc}")
+
+    if size and image.size != size:
+        width, height = image.size
+        if abs(width / height - size[0] / size[1]) > ASPECT_TOLERANCE * size[0] / size[1]:
+            raise ValueError(f"{name} 尺寸 {width}x{height} 与原图 {size[0]}x{size[1]} 的宽高比不一致")
+        image = image.resize(size, image_module.NEAREST)
+        REGISTRY.count_event("mask_resized", label)
+
+    if "A" in image.getbands() and image.getchannel("A").getextrema()[0] < 255:
+        gray = image.getchannel("A")
+    else:
+        gray = image.convert("L")
+    binary = gray.point(lambda value: 255 if value >= BINARY_THRESHOLD else 0).convert("1")
+
+    output = io.BytesIO()
+    binary.save(output, format="PNG", optimize=True)
+    encoded = output.getvalue()
+    REGISTRY.count_event("mask_preprocessed", label)
+    logger.debug("Mask %s: %d -> %d bytes", name, len(data), len(encoded))
+    return base64.b64encode(encoded).decode("utf-8")
+
+
+def prepare_static_mask(
+    value: Any, size: Optional[tuple[int, int]], policy: Optional[str] = None
+) -> Optional[str]:
+    """The ``static_mask`` payload value, preprocessed when Pillow is available."""
+    data = _media_bytes(value) if mask_preprocessing_enabled() and _pil() else None
+    if data is None:
+        return resolve_media_input(value, "static_mask", policy)
+    with span("kling.mask.encode", **{"kling.mask.field": "static_mask"}):
+        return encode_mask(data, size, "static_mask")
+
+
+def prepare_dynamic_masks(masks: Any, size: Optional[tuple[int, int]]) -> Any:
+    """``dynamic_masks`` with every inline mask preprocessed in parallel; URL masks are left as-is."""
+    if not isinstance(masks, list) or not mask_preprocessing_enabled() or _pil() is None:
+        return masks
+
+    def prepare(indexed: tuple[int, Any]) -> Any:
+        index, entry = indexed
+        if not isinstance(entry, dict):
+            return entry
+        data = _media_bytes(entry.get("mask"))
+        if data is None:
+            return entry
+        return {**entry, "mask": encode_mask(data, size, "dynamic_masks", index)}
+
+    with span("kling.mask.encode", **{"kling.mask.field": "dynamic_masks", "kling.mask.count": len(masks)}):
+        return map_bounded(prepare, list(enumerate(masks)), DEFAULT_CONCURRENCY)
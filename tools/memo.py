@@ -0,0 +1,233 @@
+# author: sawyer-shi
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from tools.local_db import get_db
+from tools.local_store import delete_key, read_json, write_json
+from tools.metrics import REGISTRY
+from tools.task_poller import cached_task
+from tools.utils import canonical_payload_hash, parse_bool
+
+logger = logging.getLogger(__name__)
+
+MEMO_ENV = "KLING_MEMO"
+MEMO_DIR_ENV = "KLING_MEMO_DIR"
+MEMO_TTL_DAYS_ENV = "KLING_MEMO_TTL_DAYS"
+# Kling deletes generated media 30 days after creation; entries never outlive it.
+RETENTION_DAYS = 30
+
+TERMINAL_STATUSES = {"succeed", "failed"}
+MAX_TRACKED_TASKS = 10000
+POINTER_PRUNE_INTERVAL_SECONDS = 3600.0
+
+_POINTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo_tasks (
+    task_id TEXT PRIMARY KEY,
+    memo_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Memo key per unfinished task seen by this process, in front of the ``memo_tasks`` table
+# in the local database, which covers tasks memoized by other processes or before a restart.
+_task_memos: "OrderedDict[str, str]" = OrderedDict()
+_task_memos_lock = threading.Lock()
+_swept_directories: set[str] = set()
+_last_prune = 0.0
+
+
+def _memo_setting() -> str:
+    return os.environ.get(MEMO_ENV, "").strip().lower()
+
+
+def memo_disabled() -> bool:
+    return _memo_setting() in {"0", "false", "no", "off"}
+
+
+def memo_requested(tool_parameters: dict[str, Any]) -> bool:
+    if memo_disabled():
+        return False
+    return _memo_setting() in {"1", "true", "yes", "on"} or parse_bool(
+        tool_parameters.get("reuse_result"), False
+    )
+
+
+def memo_ttl_seconds() -> float:
+    try:
+        days = float(os.environ.get(MEMO_TTL_DAYS_ENV, RETENTION_DAYS))
+    except ValueError:
+        days = RETENTION_DAYS
+    return min(max(days, 0.0), RETENTION_DAYS) * 86400
+
+
+def _directory() -> Optional[str]:
+    directory = os.environ.get(MEMO_DIR_ENV) or None
+    if directory and directory not in _swept_directories:
+        _swept_directories.add(directory)
+        _sweep(directory)
+    return directory
+
+
+def _sweep(directory: str) -> None:
+    """Delete expired memo files, including task pointers written by earlier versions."""
+    cutoff = time.time() - memo_ttl_seconds()
+    try:
+        names = [name for name in os.listdir(directory) if name.startswith("memo_")]
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.startswith("memo_task_") or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def memo_key_for(
+    tool_parameters: dict[str, Any], endpoint: str, payload: dict[str, Any], scope: str = ""
+) -> Optional[str]:
+    """Storage key for a create request, or ``None`` when memoization is not requested."""
+    if not memo_requested(tool_parameters):
+        return None
+    return f"memo_{canonical_payload_hash(endpoint, payload, scope)}"
+
+
+def _pointer_db() -> Any:
+    """The ``memo_tasks`` table, with pointers past the memo TTL pruned at most once an hour."""
+    global _last_prune
+    db = get_db()
+    db.ensure_schema("memo_tasks", _POINTER_SCHEMA)
+    now = time.monotonic()
+    if not _last_prune or now - _last_prune > POINTER_PRUNE_INTERVAL_SECONDS:
+        _last_prune = now
+        db.transaction([("DELETE FROM memo_tasks WHERE created_at < ?", (time.time() - memo_ttl_seconds(),))])
+    return db
+
+
+def load_memo(tool: Any, key: Optional[str], endpoint: str) -> Optional[dict[str, Any]]:
+    """Return the remembered create response for ``key``, with any known task result merged in.
+
+    An unfinished entry is checked against the task cache first; if its task
+    has failed the entry is dropped and the request goes to Kling again.
+    """
+    if not key:
+        return None
+    try:
+        entry = read_json(tool, key, _directory())
+        if not entry:
+            return None
+        if time.time() - entry.get("created_at", 0) > memo_ttl_seconds():
+            delete_key(tool, key, _directory())
+            return None
+    except Exception as exc:
+        logger.warning("Memo lookup failed for %s: %s", key, exc)
+        return None
+
+    task_id = str(entry.get("task_id") or "")
+    if not entry.get("task_status") and task_id:
+        known = (cached_task(tool.runtime.credentials, endpoint, task_id) or {}).get("data") or {}
+        if known.get("task_status") in TERMINAL_STATUSES:
+            entry = _apply_outcome(tool, key, entry, known["task_status"], known.get("task_result"))
+        else:
+            # Served while unfinished: let this process record the outcome too.
+            _track(task_id, key)
+    if entry is None or entry.get("task_status") == "failed":
+        REGISTRY.count_event("memo_failed_dropped", endpoint)
+        return None
+    response = copy.deepcopy(entry["response"])
+    data = response.setdefault("data", {})
+    if entry.get("task_status"):
+        data["task_status"] = entry["task_status"]
+    if entry.get("task_result"):
+        data["task_result"] = entry["task_result"]
+    REGISTRY.count_event("memo_hit", endpoint)
+    return response
+
+
+def save_memo(tool: Any, key: Optional[str], resp_data: dict[str, Any]) -> None:
+    """Remember an accepted create response so identical requests reuse its task."""
+    task_id = (resp_data.get("data") or {}).get("task_id")
+    if not key or not task_id:
+        return
+    entry = {"task_id": task_id, "created_at": time.time(), "response": resp_data}
+    try:
+        write_json(tool, key, entry, _directory())
+    except Exception as exc:
+        logger.warning("Failed to save memo %s: %s", key, exc)
+        return
+    _track(str(task_id), key)
+    try:
+        _pointer_db().transaction(
+            [
+                (
+                    "INSERT OR REPLACE INTO memo_tasks (task_id, memo_key, created_at) VALUES (?, ?, ?)",
+                    (str(task_id), key, time.time()),
+                )
+            ]
+        )
+    except Exception as exc:
+        logger.debug("Memo pointer for task %s kept in memory only: %s", task_id, exc)
+
+
+def _track(task_id: str, key: str) -> None:
+    with _task_memos_lock:
+        _task_memos[task_id] = key
+        _task_memos.move_to_end(task_id)
+        while len(_task_memos) > MAX_TRACKED_TASKS:
+            _task_memos.popitem(last=False)
+
+
+def _memo_key_of(task_id: str) -> Optional[str]:
+    """The memo key of an unfinished memoized task, removing its pointer; ``None`` for other tasks."""
+    with _task_memos_lock:
+        key = _task_memos.pop(task_id, None)
+    try:
+        db = _pointer_db()
+        if key is None:
+            rows = db.query("SELECT memo_key FROM memo_tasks WHERE task_id = ?", (task_id,))
+            key = rows[0]["memo_key"] if rows else None
+        if key is not None:
+            db.transaction([("DELETE FROM memo_tasks WHERE task_id = ?", (task_id,))])
+    except Exception as exc:
+        logger.debug("Memo pointer lookup failed for task %s: %s", task_id, exc)
+    return key
+
+
+def _apply_outcome(
+    tool: Any, key: str, entry: dict[str, Any], task_status: str, task_result: Any
+) -> Optional[dict[str, Any]]:
+    """Store a finished task's outcome in its memo entry; a failed task's entry is deleted (returns ``None``)."""
+    if task_status == "failed":
+        delete_key(tool, key, _directory())
+        return None
+    if entry.get("task_status") != task_status:
+        entry = {**entry, "task_status": task_status, "task_result": task_result}
+        write_json(tool, key, entry, _directory())
+    return entry
+
+
+def record_task_outcome(tool: Any, task_id: Optional[str], task_status: Optional[str], task_result: Any) -> None:
+    """Attach a finished task's result to its memo entry, or drop the entry if it failed.
+
+    The task is looked up in this process's map and then in the local
+    database, so outcomes reach entries memoized by other processes or before
+    a restart; queries of tasks that were never memoized cost no storage round trip.
+    """
+    if not task_id or task_status not in TERMINAL_STATUSES or memo_disabled():
+        return
+    key = _memo_key_of(str(task_id))
+    if key is None:
+        return
+    try:
+        entry = read_json(tool, key, _directory())
+        if entry:
+            _apply_outcome(tool, key, entry, task_status, task_result)
+    except Exception as exc:
+        logger.debug("Memo update skipped for task %s: %s", task_id, exc)
@@ -0,0 +1,179 @@
+# author: sawyer-shi
+
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Generator, Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.deadline import current_deadline
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BUDGET_ENV = "KLING_MEMORY_BUDGET"
+MEMORY_WAIT_ENV = "KLING_MEMORY_WAIT"
+SPOOL_DIR_ENV = "KLING_SPOOL_DIR"
+# The manifest caps the plugin at 256 MiB; the interpreter, SDK and copies made while sending take the rest.
+DEFAULT_BUDGET = 96 * 1024 * 1024
+DEFAULT_WAIT_SECONDS = 10.0
+# Reserved for downloads whose server sends no Content-Length.
+UNKNOWN_SIZE_ESTIMATE = 16 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Same chunk size the SDK uses when it splits a blob message itself.
+BLOB_CHUNK_SIZE = 8192
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(float(os.environ.get(name, default)), 0.0)
+    except ValueError:
+        return default
+
+
+class MemoryBudget:
+    """Process-wide count of bytes held by in-flight uploads and downloads.
+
+    A reservation waits up to ``KLING_MEMORY_WAIT`` seconds for room; callers
+    that get none spool to disk (downloads). A reservation larger than the
+    whole budget never waits. Request bodies are already built when they are
+    sent, so waiting would save nothing: they are counted with ``wait=False``,
+    which never blocks and lets downloads see the pressure.
+    """
+
+    def __init__(self) -> None:
+        self.used = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(_env_number(MEMORY_BUDGET_ENV, DEFAULT_BUDGET))
+
+    def acquire(self, size: int, label: str, wait: bool = True) -> bool:
+        limit = self.limit
+        if limit <= 0:
+            return True
+        if not wait:
+            with self._condition:
+                if self.used + size > limit:
+                    REGISTRY.count_event("memory_over_budget", label)
+                self.used += size
+                self._publish()
+            return True
+        if size > limit:
+            REGISTRY.count_event("memory_over_budget", label)
+            return False
+        wait = _env_number(MEMORY_WAIT_ENV, DEFAULT_WAIT_SECONDS)
+        invocation = current_deadline()
+        if invocation is not None:
+            wait = min(wait, invocation.remaining())
+        deadline = time.monotonic() + wait
+        with self._condition:
+            if self.used + size > limit:
+                REGISTRY.count_event("memory_wait", label)
+            while self.used + size > limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    REGISTRY.count_event("memory_over_budget", label)
+                    return False
+                self._condition.wait(remaining)
+            self.used += size
+            self._publish()
+        return True
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self.used = max(self.used - size, 0)
+            self._publish()
+            self._condition.notify_all()
+
+    def _publish(self) -> None:
+        REGISTRY.set_gauge("kling_memory_reserved_bytes", self.used, "Bytes reserved by in-flight transfers.")
+
+    @contextmanager
+    def reserve(self, size: int, label: str, wait: bool = True) -> Iterator[bool]:
+        """Hold ``size`` bytes of the budget; yields whether the reservation was granted."""
+        granted = self.acquire(size, label, wait)
+        try:
+            yield granted
+        finally:
+            if granted and self.limit > 0:
+                self.release(size)
+
+
+BUDGET = MemoryBudget()
+
+
+def _blob_chunks(spool: Any, size: int, meta: dict[str, Any]) -> Iterator[ToolInvokeMessage]:
+    """Blob chunk messages read from ``spool``, as the SDK would send for an in-memory blob."""
+    blob_id = uuid.uuid4().hex
+    spool.seek(0)
+    sequence = 0
+    while True:
+        chunk = spool.read(BLOB_CHUNK_SIZE)
+        yield ToolInvokeMessage(
+            type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+            message=ToolInvokeMessage.BlobChunkMessage(
+                id=blob_id, sequence=sequence, total_length=size, blob=chunk, end=not chunk
+            ),
+            meta=meta,
+        )
+        if not chunk:
+            return
+        sequence += 1
+
+
+def deliver_download(
+    tool: Any, url: str, endpoint: str, meta: dict[str, Any], timeout: float = 120
+) -> Generator[ToolInvokeMessage, None, int]:
+    """Download ``url`` and yield it as a blob within the memory budget; returns the HTTP status.
+
+    The file is held in memory when the budget has room for it; otherwise it
+    is spooled to a temporary file (``KLING_SPOOL_DIR``) and sent from there
+    in chunks, so it is never in memory as a whole.
+    """
+    from tools.http_client import open_media
+
+    with open_media(url, endpoint, DOWNLOAD_CHUNK_SIZE, timeout) as (response, chunks):
+        if response.status_code != 200:
+            return response.status_code
+        try:
+            expected = int(response.headers.get("Content-Length") or 0)
+        except ValueError:
+            expected = 0
+        reserved = expected or UNKNOWN_SIZE_ESTIMATE
+        with BUDGET.reserve(reserved, endpoint) as granted:
+            buffer: Optional[io.BytesIO] = io.BytesIO() if granted else None
+            spool = None
+            size = 0
+            try:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if buffer is not None and size > reserved:
+                        # Larger than announced: move what is buffered to disk instead of overrunning.
+                        spool = tempfile.TemporaryFile(dir=os.environ.get(SPOOL_DIR_ENV) or None)
+                        spool.write(buffer.getbuffer())
+                        buffer = None
+                    if buffer is not None:
+                        buffer.write(chunk)
+                    else:
+                        if spool is None:
+                            spool = tempfile.TemporaryFile(dir=os.environ.get(SPOOL_DIR_ENV) or None)
+                        spool.write(chunk)
+                if buffer is not None:
+                    yield tool.create_blob_message(blob=buffer.getvalue(), meta=meta)
+                else:
+                    REGISTRY.count_event("memory_spooled", endpoint)
+                    logger.info("Spooled %d byte download from %s to disk", size, endpoint)
+                    yield from _blob_chunks(spool, size, meta)
+            finally:
+                if spool is not None:
+                    spool.close()
+    return 200
@@ -0,0 +1,159 @@
+# author: sawyer-shi
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = tuple[str, str]
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process metrics for the Kling request path, rendered as Prometheus text."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latency: dict[LabelKey, _Histogram] = {}
+        self._responses: dict[tuple[str, str, str], int] = {}
+        self._retries: dict[LabelKey, int] = {}
+        self._bytes_sent: dict[LabelKey, int] = {}
+        self._bytes_received: dict[LabelKey, int] = {}
+        self._gauges: dict[str, tuple[str, dict[tuple[tuple[str, str], ...], float]]] = {}
+        self._events: dict[LabelKey, int] = {}
+
+    def observe_latency(self, endpoint: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._latency.get((endpoint, phase))
+            if histogram is None:
+                histogram = self._latency[(endpoint, phase)] = _Histogram()
+            histogram.observe(seconds)
+
+    def count_response(self, endpoint: str, phase: str, status: str) -> None:
+        key = (endpoint, phase, status)
+        with self._lock:
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def count_retry(self, endpoint: str, phase: str) -> None:
+        with self._lock:
+            self._retries[(endpoint, phase)] = self._retries.get((endpoint, phase), 0) + 1
+
+    def add_bytes(self, endpoint: str, phase: str, sent: int = 0, received: int = 0) -> None:
+        with self._lock:
+            if sent:
+                self._bytes_sent[(endpoint, phase)] = self._bytes_sent.get((endpoint, phase), 0) + sent
+            if received:
+                self._bytes_received[(endpoint, phase)] = (
+                    self._bytes_received.get((endpoint, phase), 0) + received
+                )
+
+    def count_event(self, event: str, endpoint: str) -> None:
+        with self._lock:
+            self._events[(event, endpoint)] = self._events.get((event, endpoint), 0) + 1
+
+    def set_gauge(
+        self, name: str, value: float, help_text: str = "", labels: Optional[dict[str, str]] = None
+    ) -> None:
+        """Set gauge ``name``; each distinct ``labels`` set is one series of it."""
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._gauges[name][1] if name in self._gauges else {}
+            series[key] = value
+            self._gauges[name] = (help_text, series)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency.clear()
+            self._responses.clear()
+            self._retries.clear()
+            self._bytes_sent.clear()
+            self._bytes_received.clear()
+            self._gauges.clear()
+            self._events.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            latency = {key: (list(h.counts), h.total, h.count) for key, h in self._latency.items()}
+            responses = dict(self._responses)
+            retries = dict(self._retries)
+            bytes_sent = dict(self._bytes_sent)
+            bytes_received = dict(self._bytes_received)
+            gauges = {name: (help_text, dict(series)) for name, (help_text, series) in self._gauges.items()}
+            events = dict(self._events)
+
+        lines = [
+            "# HELP kling_request_duration_seconds Latency of Kling API, auth and download phases.",
+            "# TYPE kling_request_duration_seconds histogram",
+        ]
+        for (endpoint, phase), (counts, total, count) in sorted(latency.items()):
+            labels = f'endpoint="{endpoint}",phase="{phase}"'
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'kling_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'kling_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"kling_request_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"kling_request_duration_seconds_count{{{labels}}} {count}")
+
+        lines += [
+            "# HELP kling_responses_total Responses by HTTP status code (or timeout/error).",
+            "# TYPE kling_responses_total counter",
+        ]
+        for (endpoint, phase, status), value in sorted(responses.items()):
+            lines.append(f'kling_responses_total{{endpoint="{endpoint}",phase="{phase}",status="{status}"}} {value}')
+
+        for name, help_text, values in (
+            ("kling_request_retries_total", "Retried requests.", retries),
+            ("kling_bytes_sent_total", "Request body bytes sent.", bytes_sent),
+            ("kling_bytes_received_total", "Response body bytes received.", bytes_received),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (endpoint, phase), value in sorted(values.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}",phase="{phase}"}} {value}')
+
+        lines += [
+            "# HELP kling_events_total Plugin-side events such as de-duplicated or cached requests.",
+            "# TYPE kling_events_total counter",
+        ]
+        for (event, endpoint), value in sorted(events.items()):
+            lines.append(f'kling_events_total{{event="{event}",endpoint="{endpoint}"}} {value}')
+
+        for name, (help_text, series) in sorted(gauges.items()):
+            lines += [f"# HELP {name} {help_text or name}", f"# TYPE {name} gauge"]
+            for labels, value in sorted(series.items()):
+                rendered = ",".join(f'{label}="{text}"' for label, text in labels)
+                lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def timed(endpoint: str, phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe_latency(endpoint, phase, time.perf_counter() - started)
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,200 @@
+# author: sawyer-shi
+
+import hashlib
+import hmac
+import logging
+import re
+import time
+from collections.abc import Generator, Iterator
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+
+from tools.http_client import iter_media, send_bytes
+
+logger = logging.getLogger(__name__)
+
+S3_SINK = "s3"
+DEFAULT_REGION = "us-east-1"
+# S3 requires parts of at least 5 MiB (except the last); one part is buffered at a time.
+PART_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_TIMEOUT = 300
+
+
+@dataclass(frozen=True)
+class S3Target:
+    endpoint: str
+    bucket: str
+    prefix: str
+    access_key: str
+    secret_key: str
+    region: str = DEFAULT_REGION
+
+
+def s3_target(credentials: dict[str, Any]) -> S3Target:
+    """Parse the ``s3_*`` credentials; ``s3_endpoint`` is ``https://host[:port]/bucket[/prefix]``.
+
+    Raises ``ValueError`` when object storage is not configured.
+    """
+    raw = str(credentials.get("s3_endpoint") or "").strip()
+    access_key = str(credentials.get("s3_access_key") or "").strip()
+    secret_key = str(credentials.get("s3_secret_key") or "").strip()
+    if not raw or not access_key or not secret_key:
+        raise ValueError("对象存储未配置 (需要 S3 Endpoint、S3 Access Key 与 S3 Secret Key)")
+    parts = urlsplit(raw)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if parts.scheme not in {"http", "https"} or not parts.netloc or not segments:
+        raise ValueError("S3 Endpoint 需要形如 https://host[:port]/bucket[/prefix]")
+    prefix = "/".join(segments[1:])
+    return S3Target(
+        endpoint=f"{parts.scheme}://{parts.netloc}",
+        bucket=segments[0],
+        prefix=f"{prefix}/" if prefix else "",
+        access_key=access_key,
+        secret_key=secret_key,
+        region=str(credentials.get("s3_region") or DEFAULT_REGION).strip(),
+    )
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _signed_headers(
+    target: S3Target, method: str, url: str, body: bytes, extra: Optional[dict[str, str]] = None
+) -> dict[str, str]:
+    """AWS Signature Version 4 headers for one request."""
+    parts = urlsplit(url)
+    amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    date = amz_date[:8]
+    payload_hash = hashlib.sha256(body).hexdigest()
+    headers = {"host": parts.netloc, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+    headers.update({key.lower(): value for key, value in (extra or {}).items()})
+
+    query = []
+    for item in filter(None, parts.query.split("&")):
+        key, _, value = item.partition("=")
+        query.append((quote(unquote(key), safe="-_.~"), quote(unquote(value), safe="-_.~")))
+    signed = ";".join(sorted(headers))
+    canonical = "\n".join(
+        [
+            method,
+            quote(unquote(parts.path), safe="/-_.~"),
+            "&".join(f"{key}={value}" for key, value in sorted(query)),
+            "".join(f"{key}:{headers[key].strip()}\n" for key in sorted(headers)),
+            signed,
+            payload_hash,
+        ]
+    )
+    scope = f"{date}/{target.region}/s3/aws4_request"
+    string_to_sign = "\n".join(
+        ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode("utf-8")).hexdigest()]
+    )
+    key = _hmac(("AWS4" + target.secret_key).encode("utf-8"), date)
+    for part in (target.region, "s3", "aws4_request"):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={target.access_key}/{scope}, SignedHeaders={signed}, Signature={signature}"
+    )
+    del headers["host"]
+    return headers
+
+
+def _call(
+    target: S3Target, method: str, key: str, query: str = "", body: bytes = b"", extra: Optional[dict[str, str]] = None
+) -> requests.Response:
+    url = f"{target.endpoint}/{quote(target.bucket)}/{quote(key, safe='/-_.~')}" + (f"?{query}" if query else "")
+    headers = _signed_headers(target, method, url, body, extra)
+    response = send_bytes(method, url, "s3", headers=headers, body=body or None, timeout=UPLOAD_TIMEOUT)
+    # CompleteMultipartUpload can fail with an <Error> document inside a 200 response.
+    if response.status_code >= 300 or (method == "POST" and b"<Error>" in response.content):
+        raise RuntimeError(f"S3 {method} {key} 失败 ({response.status_code}): {response.text[:200]}")
+    return response
+
+
+def _next_part(chunks: Iterator[bytes]) -> bytes:
+    """Join chunks until they reach ``PART_SIZE`` (or run out); empty once exhausted."""
+    pending: list[bytes] = []
+    size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= PART_SIZE:
+            break
+    return b"".join(pending)
+
+
+def upload_stream(target: S3Target, key: str, chunks: Iterable[bytes], content_type: str) -> dict[str, Any]:
+    """Upload ``chunks`` to ``key``; one PUT when the data fits a part, multipart otherwise."""
+    iterator = iter(chunks)
+    part = _next_part(iterator)
+    if len(part) < PART_SIZE:
+        response = _call(target, "PUT", key, body=part, extra={"content-type": content_type})
+        return {"bucket": target.bucket, "key": key, "size": len(part), "etag": (response.headers.get("ETag") or "").strip('"')}
+
+    created = _call(target, "POST", key, "uploads", extra={"content-type": content_type})
+    match = re.search(rb"<UploadId>([^<]+)</UploadId>", created.content)
+    if not match:
+        raise RuntimeError("S3 未返回 UploadId")
+    upload_id = quote(match.group(1).decode("utf-8"), safe="")
+    etags: list[str] = []
+    size = 0
+    try:
+        while part:
+            response = _call(target, "PUT", key, f"partNumber={len(etags) + 1}&uploadId={upload_id}", body=part)
+            etags.append(response.headers.get("ETag", ""))
+            size += len(part)
+            part = _next_part(iterator)
+        manifest = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        )
+        body = f"<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>".encode("utf-8")
+        completed = _call(target, "POST", key, f"uploadId={upload_id}", body=body)
+    except BaseException:
+        try:
+            _call(target, "DELETE", key, f"uploadId={upload_id}")
+        except Exception as exc:
+            logger.warning("Failed to abort multipart upload of %s: %s", key, exc)
+        raise
+    etag = re.search(rb"<ETag>([^<]+)</ETag>", completed.content)
+    return {
+        "bucket": target.bucket,
+        "key": key,
+        "size": size,
+        "parts": len(etags),
+        "etag": etag.group(1).decode("utf-8").strip('"') if etag else None,
+    }
+
+
+class ResultSink:
+    """Streams result files of one query straight to object storage."""
+
+    def __init__(self, tool: Any, target: S3Target) -> None:
+        self.tool = tool
+        self.target = target
+        self.objects: list[dict[str, Any]] = []
+
+    def upload(self, url: str, endpoint: str, filename: str, mime_type: str) -> Generator[Any, None, None]:
+        """Transfer one result file, yielding status messages; failures are reported, not raised."""
+        key = f"{self.target.prefix}{endpoint}/{filename}"
+        yield self.tool.create_text_message("☁️ 正在转存到对象存储...")
+        try:
+            uploaded = upload_stream(self.target, key, iter_media(url, endpoint, DOWNLOAD_CHUNK_SIZE), mime_type)
+        except Exception as exc:
+            logger.error("Upload of %s to object storage failed: %s", url, exc)
+            yield self.tool.create_text_message(f"❌ 转存失败: {exc}")
+            return
+        self.objects.append(uploaded)
+        yield self.tool.create_text_message(f"✅ 已转存: s3://{uploaded['bucket']}/{uploaded['key']}")
+
+
+def result_sink(tool: Any, tool_parameters: dict[str, Any]) -> Optional[ResultSink]:
+    """The sink selected by ``result_sink``, or ``None`` to return files as Dify blobs."""
+    if str(tool_parameters.get("result_sink") or "").strip().lower() != S3_SINK:
+        return None
+    return ResultSink(tool, s3_target(tool.runtime.credentials))
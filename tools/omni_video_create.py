@@ -9,18 +9,33 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from tools.deadline import deadline_invoke
+from tools.element_registry import resolve_element_list
+from tools.memo import load_memo, memo_key_for, save_memo
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.submission_queue import enqueue_create, queue_requested
+from tools.task_poller import track_task
+from tools.tracing import traced_invoke
 from tools.utils import (
+    build_api_url,
     build_watermark_info,
     get_api_token,
     parse_json_param,
     resolve_files_to_list,
     resolve_media_input,
 )
+from tools.validation import validate_tool_parameters
 
 logger = logging.getLogger(__name__)
 
 
 class OmniVideoCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling Omni-Video create task."""
         logger.info("Starting omni-video create task")
@@ -33,7 +48,14 @@ class OmniVideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        api_url = "https://api-beijing.klingai.com/v1/videos/omni-video"
+        errors = validate_tool_parameters("omni_video_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        api_url = build_api_url("v1/videos/omni-video")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -59,10 +81,13 @@ class OmniVideoCreateTool(Tool):
         if multi_prompt:
             payload["multi_prompt"] = multi_prompt
 
+        queued = queue_requested(tool_parameters)
+        # Queued jobs are sent later, after a signed file URL may have expired, so their media is always inlined.
+        policy = "inline" if queued else None
         image_list = tool_parameters.get("image_list")
         if image_list:
             if isinstance(image_list, list):
-                payload["image_list"] = resolve_files_to_list(image_list, "image_url")
+                payload["image_list"] = resolve_files_to_list(image_list, "image_url", policy=policy)
             else:
                 parsed = parse_json_param(image_list, "image_list")
                 if parsed:
@@ -70,7 +95,12 @@ class OmniVideoCreateTool(Tool):
 
         element_list = parse_json_param(tool_parameters.get("element_list"), "element_list")
         if element_list:
-            payload["element_list"] = element_list
+            try:
+                payload["element_list"] = resolve_element_list(self, element_list)
+            except ValueError as exc:
+                logger.warning(str(exc))
+                yield self.create_text_message(str(exc))
+                return
 
         video_list = parse_json_param(tool_parameters.get("video_list"), "video_list")
         if video_list:
@@ -104,6 +134,27 @@ class OmniVideoCreateTool(Tool):
         if external_task_id:
             payload["external_task_id"] = external_task_id
 
+        scope = self.runtime.credentials.get("access_key", "")
+        memo_key = memo_key_for(tool_parameters, "omni-video", payload, scope)
+        memoized = load_memo(self, memo_key, "omni-video")
+        if memoized:
+            yield self.create_text_message(f"♻️ 命中生成缓存，复用任务: {memoized['data'].get('task_id')}")
+            yield self.create_json_message(memoized)
+            return
+
+        if queued:
+            try:
+                job = enqueue_create(self, "omni-video", "v1/videos/omni-video", payload)
+            except Exception as exc:
+                msg = f"❌ 加入提交队列失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            yield self.create_text_message(f"📥 已加入提交队列，队列任务ID: {job['job_id']}")
+            yield self.create_text_message("💡 请使用提交队列查询工具获取可灵任务ID")
+            yield self.create_json_message(job)
+            return
+
         yield self.create_text_message("🚀 Omni-Video 任务启动中...")
         yield self.create_text_message(f"🤖 模型: {model_name}")
         if prompt:
@@ -114,7 +165,15 @@ class OmniVideoCreateTool(Tool):
 
         try:
             logger.info("Submitting omni-video payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response, shared = post_create(
+                api_url,
+                "omni-video",
+                headers=headers,
+                payload=payload,
+                scope=scope,
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -126,6 +185,9 @@ class OmniVideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        if shared:
+            yield self.create_text_message("♻️ 检测到相同的请求，已复用同一任务")
+
         if response.status_code != 200:
             logger.error("API status %s: %s", response.status_code, response.text[:300])
             yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
@@ -160,4 +222,6 @@ class OmniVideoCreateTool(Tool):
         if created_at:
             yield self.create_text_message(f"🕒 创建时间: {created_at}")
         yield self.create_text_message("💡 请使用 Omni-Video 查询工具获取结果")
+        save_memo(self, memo_key, resp_data)
+        track_task(self.runtime.credentials, "omni-video", "v1/videos/omni-video", resp_data, payload)
         yield self.create_json_message(resp_data)
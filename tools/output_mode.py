@@ -0,0 +1,62 @@
+# author: sawyer-shi
+
+import functools
+import os
+from collections.abc import Generator
+from typing import Any, Callable
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+OUTPUT_MODE_ENV = "KLING_OUTPUT_MODE"
+VERBOSE = "verbose"
+COMPACT = "compact"
+COMPACT_LOG = "compact_log"
+OUTPUT_MODES = (VERBOSE, COMPACT, COMPACT_LOG)
+
+
+def resolve_output_mode(tool_parameters: dict[str, Any]) -> str:
+    mode = str(tool_parameters.get("output_mode") or os.environ.get(OUTPUT_MODE_ENV) or VERBOSE)
+    mode = mode.strip().lower()
+    return mode if mode in OUTPUT_MODES else VERBOSE
+
+
+def compact_output(func: Callable[..., Generator]) -> Callable[..., Generator]:
+    """Collapse a tool's messages into one JSON message unless the output mode is verbose.
+
+    Status text is dropped (or kept under ``messages`` in ``compact_log``),
+    blobs still pass through, and the tool's JSON response becomes ``data``.
+    A text line starting with ``❌`` marks the call as failed.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, tool_parameters: dict[str, Any]) -> Generator:
+        mode = resolve_output_mode(tool_parameters)
+        if mode == VERBOSE:
+            yield from func(self, tool_parameters)
+            return
+
+        texts: list[str] = []
+        payloads: list[Any] = []
+        error = None
+        for message in func(self, tool_parameters):
+            if message.type == ToolInvokeMessage.MessageType.TEXT:
+                text = message.message.text
+                texts.append(text)
+                if error is None and text.startswith("❌"):
+                    error = text
+            elif message.type == ToolInvokeMessage.MessageType.JSON:
+                payloads.append(message.message.json_object)
+            else:
+                yield message
+
+        result: dict[str, Any] = {
+            "tool": type(self).__module__.rsplit(".", 1)[-1],
+            "success": error is None,
+            "error": error,
+            "data": payloads[0] if len(payloads) == 1 else (payloads or None),
+        }
+        if mode == COMPACT_LOG:
+            result["messages"] = texts
+        yield self.create_json_message(result)
+
+    return wrapper
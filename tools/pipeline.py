@@ -0,0 +1,468 @@
+# author: sawyer-shi
+
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+import requests
+
+from tools.deadline import deadline_scope
+from tools.http_client import get_json
+from tools.key_pool import account_scope, parse_key_pool, pin_task, sign_token
+from tools.local_db import SEAL_PREFIX, SealError, get_db
+from tools.metrics import REGISTRY
+from tools.singleflight import post_create
+from tools.task_poller import POLLER, TERMINAL_STATUSES, track_task
+from tools.utils import build_api_url
+
+logger = logging.getLogger(__name__)
+
+MAX_STAGES = 5
+# Budget for submitting one stage from the background worker; a stage left
+# "submitting" longer than this (its process died mid-request) is recovered.
+STAGE_SUBMIT_SECONDS = 90.0
+IDLE_EXIT_SECONDS = 30.0
+
+# Stage tool -> (endpoint, API path, kind of result it produces).
+STAGE_TOOLS: dict[str, tuple[str, str, str]] = {
+    "text_2_video": ("text2video", "v1/videos/text2video", "video"),
+    "image_2_video": ("image2video", "v1/videos/image2video", "video"),
+    "omni_video": ("omni-video", "v1/videos/omni-video", "video"),
+    "omni_image": ("omni-image", "v1/images/omni-image", "image"),
+    "image_generation": ("image-generations", "v1/images/generations", "image"),
+}
+# Field a stage receives its predecessor's result in, by (stage tool, result kind).
+DEFAULT_INPUTS: dict[tuple[str, str], str] = {
+    ("image_2_video", "image"): "image",
+    ("omni_video", "image"): "image_list",
+    ("omni_video", "video"): "video_list",
+    ("omni_image", "image"): "image_list",
+    ("image_generation", "image"): "image",
+}
+INPUT_FIELDS = {"image", "image_tail", "image_list", "video_list"}
+_KIND_LABELS = {"image": "图片", "video": "视频"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pipelines (
+    pipeline_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    credentials TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Pipelines touched by this process; the local database is the durable copy.
+_pipelines: dict[str, dict[str, Any]] = {}
+# Credentials per pipeline, kept out of the pipeline dict that query tools return.
+# Stored sealed (``LocalDb.seal``) and cleared once the pipeline has finished.
+_credentials: dict[str, dict[str, Any]] = {}
+_lock = threading.RLock()
+
+
+def _db() -> Any:
+    db = get_db()
+    db.ensure_schema("pipelines", _SCHEMA)
+    return db
+
+
+class _StageWorker:
+    """Background thread that finishes stages and submits the next ones.
+
+    Poller callbacks only hand work over, so the poller thread never sends a
+    create request; the thread exits once it has been idle for a while.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Callable[[], None]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, work: Callable[[], None]) -> None:
+        self._queue.put(work)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="kling-pipeline", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                work = self._queue.get(timeout=IDLE_EXIT_SECONDS)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                work()
+            except Exception:
+                logger.exception("Pipeline work failed")
+
+
+WORKER = _StageWorker()
+
+
+def parse_stages(value: Any) -> list[dict[str, Any]]:
+    """Validate a stage list: ``[{"tool": ..., "params": {...}, "input": ...}, ...]``.
+
+    ``params`` is the Kling request body of that stage; ``input`` names the
+    field that receives the previous stage's result URLs. Raises ``ValueError``.
+    """
+    if not isinstance(value, list) or not value:
+        raise ValueError("stages 需要为非空的 JSON 数组")
+    if len(value) > MAX_STAGES:
+        raise ValueError(f"流水线阶段不能超过 {MAX_STAGES} 个")
+
+    stages = []
+    previous_kind: Optional[str] = None
+    for index, item in enumerate(value, start=1):
+        if not isinstance(item, dict) or item.get("tool") not in STAGE_TOOLS:
+            raise ValueError(f"第 {index} 阶段的 tool 需要为 {', '.join(STAGE_TOOLS)} 之一")
+        params = item.get("params") or {}
+        if not isinstance(params, dict):
+            raise ValueError(f"第 {index} 阶段的 params 需要为 JSON 对象")
+        tool_name = item["tool"]
+        input_field = None
+        if previous_kind is not None:
+            input_field = item.get("input") or DEFAULT_INPUTS.get((tool_name, previous_kind))
+            if input_field not in INPUT_FIELDS:
+                raise ValueError(f"第 {index} 阶段 ({tool_name}) 无法接收上一阶段的{_KIND_LABELS[previous_kind]}结果")
+        elif not params.get("prompt") and not params.get("image"):
+            raise ValueError("第 1 阶段需要在 params 中提供 prompt 或 image")
+        endpoint, api_path, kind = STAGE_TOOLS[tool_name]
+        stages.append(
+            {
+                "index": index,
+                "tool": tool_name,
+                "endpoint": endpoint,
+                "api_path": api_path,
+                "params": params,
+                "input": input_field,
+                "status": "pending",
+                "task_id": None,
+                "result_urls": [],
+                "error": None,
+            }
+        )
+        previous_kind = kind
+    return stages
+
+
+def result_urls(task_result: Any) -> list[str]:
+    """URLs of the videos or images in a finished task's ``task_result``."""
+    task_result = task_result or {}
+    items = task_result.get("videos") or task_result.get("images") or task_result.get("series_images") or []
+    return [item["url"] for item in items if isinstance(item, dict) and item.get("url")]
+
+
+def build_stage_payload(stage: dict[str, Any], upstream: list[str]) -> dict[str, Any]:
+    """The stage's request body with the upstream result URLs placed in its input field."""
+    payload = copy.deepcopy(stage["params"])
+    if stage.get("external_task_id"):
+        payload["external_task_id"] = stage["external_task_id"]
+    field = stage["input"]
+    if not field or not upstream:
+        return payload
+    if field in {"image", "image_tail"}:
+        payload[field] = upstream[0]
+    elif field == "image_list":
+        key = "image" if stage["tool"] == "omni_image" else "image_url"
+        # Upstream results come first so prompts can refer to them as <<<image_1>>>.
+        payload["image_list"] = [{key: url} for url in upstream] + list(payload.get("image_list") or [])
+    elif field == "video_list":
+        payload["video_list"] = [{"video_url": upstream[0], "refer_type": "base"}] + list(
+            payload.get("video_list") or []
+        )
+    return payload
+
+
+def _read_credentials(stored: str) -> dict[str, Any]:
+    if stored.startswith(SEAL_PREFIX):
+        try:
+            return _db().unseal(stored)
+        except SealError as exc:
+            logger.error("Pipeline credentials cannot be unsealed: %s", exc)
+            return {}
+    # Plain JSON written by an older version; sealed again on the next save.
+    return json.loads(stored) if stored.startswith("{") else {}
+
+
+def _save(pipeline: dict[str, Any]) -> None:
+    """Write the pipeline; its credentials are stored sealed while it runs and dropped once it has finished."""
+    pipeline_id = pipeline["pipeline_id"]
+    with _lock:
+        _pipelines[pipeline_id] = pipeline
+        data = json.dumps(pipeline, ensure_ascii=False)
+        if pipeline["status"] != "running":
+            _credentials.pop(pipeline_id, None)
+        credentials = _credentials.get(pipeline_id)
+    try:
+        db = _db()
+        db.transaction(
+            [
+                (
+                    "INSERT OR REPLACE INTO pipelines (pipeline_id, data, credentials, updated_at) VALUES (?, ?, ?, ?)",
+                    (pipeline_id, data, db.seal(credentials) if credentials else "", time.time()),
+                )
+            ]
+        )
+    except Exception as exc:
+        logger.debug("Pipeline %s kept in memory only: %s", pipeline_id, exc)
+
+
+def _load(pipeline_id: str) -> Optional[dict[str, Any]]:
+    with _lock:
+        pipeline = _pipelines.get(pipeline_id)
+    if pipeline is not None:
+        return pipeline
+    try:
+        rows = _db().query("SELECT data, credentials FROM pipelines WHERE pipeline_id = ?", (pipeline_id,))
+    except Exception as exc:
+        logger.debug("Pipeline database unavailable: %s", exc)
+        return None
+    if not rows:
+        return None
+    credentials = _read_credentials(rows[0]["credentials"] or "")
+    with _lock:
+        if credentials:
+            _credentials.setdefault(pipeline_id, credentials)
+        return _pipelines.setdefault(pipeline_id, json.loads(rows[0]["data"]))
+
+
+def load_pipeline(tool: Any, pipeline_id: str) -> Optional[dict[str, Any]]:
+    """The pipeline ``pipeline_id`` if it belongs to the calling account."""
+    pipeline = _load(pipeline_id)
+    if not pipeline or pipeline.get("scope") != account_scope(tool.runtime.credentials):
+        return None
+    return pipeline
+
+
+def create_pipeline(tool: Any, stages: list[dict[str, Any]]) -> dict[str, Any]:
+    """Record a pipeline and submit its first stage."""
+    credentials = dict(tool.runtime.credentials or {})
+    pipeline = {
+        "pipeline_id": f"pl_{uuid.uuid4().hex[:16]}",
+        "scope": account_scope(credentials),
+        "created_at": time.time(),
+        "status": "running",
+        "stages": stages,
+    }
+    with _lock:
+        _credentials[pipeline["pipeline_id"]] = credentials
+    _save(pipeline)
+    submit_stage(pipeline["pipeline_id"], 0, [])
+    return _load(pipeline["pipeline_id"]) or pipeline
+
+
+def _mark_submitting(pipeline: dict[str, Any], position: int, now: float) -> Optional[bool]:
+    """Mark stage ``position`` submitting; ``None`` when it is not up for submission.
+
+    Returns whether an earlier attempt may already have reached Kling, i.e. the
+    stage was left "submitting" for longer than ``STAGE_SUBMIT_SECONDS``.
+    """
+    stage = pipeline["stages"][position]
+    stale = stage["status"] == "submitting" and now - stage.get("submitting_at", 0) > STAGE_SUBMIT_SECONDS
+    if pipeline["status"] != "running" or (stage["status"] != "pending" and not stale):
+        return None
+    stage["status"] = "submitting"
+    stage["submitting_at"] = now
+    stage["external_task_id"] = (
+        stage.get("external_task_id")
+        or stage["params"].get("external_task_id")
+        or f"{pipeline['pipeline_id']}_{stage['index']}"
+    )
+    return stale
+
+
+def _claim_stage(pipeline_id: str, position: int) -> Optional[tuple[dict[str, Any], bool]]:
+    """The pipeline with stage ``position`` claimed for submission, and whether it is a resumed attempt.
+
+    The check and the write share one database transaction, so two processes
+    (or a query and the worker) never both submit a stage.
+    """
+    now = time.time()
+    with _lock:
+        pipeline = _load(pipeline_id)
+        if pipeline is None:
+            return None
+        try:
+            with _db().immediate() as conn:
+                row = conn.execute("SELECT data FROM pipelines WHERE pipeline_id = ?", (pipeline_id,)).fetchone()
+                stored = json.loads(row["data"]) if row else pipeline
+                resumed = _mark_submitting(stored, position, now)
+                if resumed is not None:
+                    conn.execute(
+                        "UPDATE pipelines SET data = ?, updated_at = ? WHERE pipeline_id = ?",
+                        (json.dumps(stored, ensure_ascii=False), now, pipeline_id),
+                    )
+        except Exception as exc:
+            logger.debug("Pipeline %s stage claimed in memory only: %s", pipeline_id, exc)
+            stored = pipeline
+            resumed = _mark_submitting(stored, position, now)
+        _pipelines[pipeline_id] = stored
+    return None if resumed is None else (stored, resumed)
+
+
+def _find_submitted(stage: dict[str, Any], credentials: dict[str, Any]) -> Optional[dict[str, Any]]:
+    """The task an earlier attempt created for ``stage``, looked up by its ``external_task_id``.
+
+    Raises ``requests.exceptions.RequestException`` when Kling cannot be asked,
+    so a stage is never resubmitted without the check.
+    """
+    pairs = parse_key_pool(credentials)
+    for pair in pairs:
+        response = get_json(
+            build_api_url(f"{stage['api_path']}/{stage['external_task_id']}"),
+            stage["endpoint"],
+            headers={"Authorization": f"Bearer {sign_token(pair)}", "Content-Type": "application/json"},
+            timeout=30,
+        )
+        try:
+            resp_data = response.json() if response.status_code == 200 else {}
+        except ValueError:
+            resp_data = {}
+        task_id = (resp_data.get("data") or {}).get("task_id") if resp_data.get("code") == 0 else None
+        if task_id:
+            if len(pairs) > 1:
+                pin_task(str(task_id), pair.access_key)
+            return resp_data
+    return None
+
+
+def submit_stage(pipeline_id: str, position: int, upstream: list[str]) -> None:
+    """Submit stage ``position`` with the previous stage's result URLs as input.
+
+    Signs with the credentials stored for the pipeline, so it runs the same
+    from an invocation or from the background worker. A stage resumed after
+    a crash is first looked up by its ``external_task_id`` and only sent
+    again when Kling has no task for it.
+    """
+    claimed = _claim_stage(pipeline_id, position)
+    if claimed is None:
+        return
+    pipeline, resumed = claimed
+    stage = pipeline["stages"][position]
+    with _lock:
+        credentials = _credentials.get(pipeline_id) or {}
+
+    if resumed:
+        try:
+            existing = _find_submitted(stage, credentials)
+        except requests.exceptions.RequestException as exc:
+            # Left "submitting"; the next recovery tries again once the stage is stale.
+            logger.warning("Pipeline %s stage %d not resumed: %s", pipeline_id, stage["index"], exc)
+            return
+        if existing is not None:
+            REGISTRY.count_event("pipeline_stage_recovered", stage["endpoint"])
+            _record_submitted(pipeline_id, pipeline, position, existing, credentials)
+            return
+
+    payload = build_stage_payload(stage, upstream)
+    error = None
+    resp_data: dict[str, Any] = {}
+    try:
+        response, _ = post_create(
+            build_api_url(stage["api_path"]),
+            stage["endpoint"],
+            headers={"Content-Type": "application/json"},
+            payload=payload,
+            scope=str(credentials.get("access_key", "")),
+            timeout=60,
+            credentials=credentials,
+        )
+        if response.status_code != 200:
+            error = f"API 响应状态码: {response.status_code}"
+        else:
+            resp_data = response.json()
+            if resp_data.get("code") != 0:
+                error = f"创建失败: {resp_data.get('message', '未知错误')}"
+    except requests.exceptions.Timeout:
+        error = "请求超时"
+    except (requests.exceptions.RequestException, ValueError) as exc:
+        error = f"请求失败: {exc}"
+
+    if error is not None:
+        with _lock:
+            stage["status"] = "submit_failed"
+            stage["error"] = error
+            pipeline["status"] = "failed"
+        _save(pipeline)
+        logger.error("Pipeline %s stage %d failed to submit: %s", pipeline_id, stage["index"], error)
+        return
+    REGISTRY.count_event("pipeline_stage_submitted", stage["endpoint"])
+    _record_submitted(pipeline_id, pipeline, position, resp_data, credentials)
+
+
+def _record_submitted(
+    pipeline_id: str, pipeline: dict[str, Any], position: int, resp_data: dict[str, Any], credentials: dict[str, Any]
+) -> None:
+    stage = pipeline["stages"][position]
+    with _lock:
+        stage["status"] = "submitted"
+        stage["task_id"] = (resp_data.get("data") or {}).get("task_id")
+        stage["submitted_at"] = time.time()
+    _save(pipeline)
+    track_task(credentials, stage["endpoint"], stage["api_path"], resp_data)
+    POLLER.on_finish(
+        account_scope(credentials),
+        stage["endpoint"],
+        stage["task_id"],
+        lambda final: WORKER.put(lambda: finish_stage(pipeline_id, position, final)),
+    )
+
+
+def _submit_in_background(pipeline_id: str, position: int, upstream: list[str]) -> None:
+    with deadline_scope(STAGE_SUBMIT_SECONDS):
+        submit_stage(pipeline_id, position, upstream)
+
+
+def finish_stage(pipeline_id: str, position: int, resp_data: dict[str, Any]) -> None:
+    """Record a finished stage and queue the next one for the worker when it succeeded."""
+    pipeline = _load(pipeline_id)
+    if pipeline is None:
+        return
+    stage = pipeline["stages"][position]
+    data = resp_data.get("data") or {}
+    status = data.get("task_status")
+    with _lock:
+        if status not in TERMINAL_STATUSES or stage["status"] in TERMINAL_STATUSES:
+            return
+        stage["status"] = status
+        stage["result_urls"] = result_urls(data.get("task_result"))
+        stage["finished_at"] = time.time()
+        if status == "failed" or not stage["result_urls"]:
+            stage["error"] = data.get("task_status_msg") or ("任务无结果" if status == "succeed" else "任务失败")
+            pipeline["status"] = "failed"
+        elif position == len(pipeline["stages"]) - 1:
+            pipeline["status"] = "succeed"
+    _save(pipeline)
+    if pipeline["status"] == "running":
+        upstream = list(stage["result_urls"])
+        WORKER.put(lambda: _submit_in_background(pipeline_id, position + 1, upstream))
+
+
+def recover_stages(pipeline_id: str) -> None:
+    """Submit stages a crash or restart left behind.
+
+    That is a pending stage whose predecessor has succeeded (the worker died
+    before submitting it) and a stage left "submitting" for longer than
+    ``STAGE_SUBMIT_SECONDS``. ``submit_stage`` claims each one, so stages
+    already being handled elsewhere are skipped.
+    """
+    pipeline = _load(pipeline_id)
+    if pipeline is None or pipeline["status"] != "running":
+        return
+    now = time.time()
+    for position, stage in enumerate(list(pipeline["stages"])):
+        previous = pipeline["stages"][position - 1] if position else None
+        stalled = stage["status"] == "pending" and (previous is None or previous["status"] == "succeed")
+        stale = stage["status"] == "submitting" and now - stage.get("submitting_at", 0) > STAGE_SUBMIT_SECONDS
+        if stalled or stale:
+            logger.info("Recovering pipeline %s stage %d (%s)", pipeline_id, stage["index"], stage["status"])
+            submit_stage(pipeline_id, position, list(previous["result_urls"]) if previous else [])
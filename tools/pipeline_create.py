@@ -0,0 +1,64 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.deadline import deadline_invoke
+from tools.output_mode import compact_output
+from tools.pipeline import create_pipeline, parse_stages
+from tools.profiling import profiled_invoke
+from tools.tracing import traced_invoke
+from tools.utils import parse_json_param
+from tools.validation import validate_tool_parameters
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Chain generation stages, feeding each stage's result URLs into the next."""
+        logger.info("Starting pipeline create task")
+
+        errors = validate_tool_parameters("pipeline_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        try:
+            stages = parse_stages(parse_json_param(tool_parameters.get("stages"), "stages"))
+        except ValueError as exc:
+            msg = f"❌ {exc}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        yield self.create_text_message(
+            f"🔗 流水线启动中: {' → '.join(stage['tool'] for stage in stages)}"
+        )
+
+        try:
+            pipeline = create_pipeline(self, stages)
+        except Exception as exc:
+            msg = f"❌ 流水线创建失败: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return
+
+        first = pipeline["stages"][0]
+        if pipeline["status"] == "failed":
+            yield self.create_text_message(f"❌ 第 1 阶段提交失败: {first['error']}")
+        else:
+            yield self.create_text_message(f"✅ 第 1 阶段已提交，任务ID: {first['task_id']}")
+            yield self.create_text_message(f"📋 流水线ID: {pipeline['pipeline_id']}")
+            yield self.create_text_message("💡 每个阶段成功后会立即以结果链接提交下一阶段，请使用流水线查询工具查看进度")
+        yield self.create_json_message(pipeline)
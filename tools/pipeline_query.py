@@ -0,0 +1,106 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any, Optional
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.deadline import deadline_invoke
+from tools.http_client import get_json
+from tools.key_pool import get_task_api_token
+from tools.output_mode import compact_output
+from tools.pipeline import finish_stage, load_pipeline, recover_stages
+from tools.profiling import profiled_invoke
+from tools.task_poller import TERMINAL_STATUSES, cached_task, publish_task
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url
+
+logger = logging.getLogger(__name__)
+
+STATUS_ICONS = {
+    "pending": "⏸️",
+    "submitting": "🚀",
+    "submitted": "⏳",
+    "succeed": "✅",
+    "failed": "❌",
+    "submit_failed": "⚠️",
+}
+
+
+class PipelineQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Report a pipeline's stages, advancing it when the running stage has finished."""
+        logger.info("Starting pipeline query task")
+
+        pipeline_id = str(tool_parameters.get("pipeline_id") or "").strip()
+        if not pipeline_id:
+            msg = "❌ 请输入流水线ID"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        pipeline = load_pipeline(self, pipeline_id)
+        if pipeline is None:
+            msg = f"❌ 未找到流水线: {pipeline_id}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        yield self.create_text_message(f"🔍 正在查询流水线: {pipeline_id}")
+
+        # The poller normally advances the pipeline; this covers a disabled poller or a restarted worker.
+        for position, stage in enumerate(pipeline["stages"]):
+            if stage["status"] != "submitted" or not stage.get("task_id"):
+                continue
+            resp_data = cached_task(self.runtime.credentials, stage["endpoint"], stage["task_id"])
+            resp_data = resp_data or self._fetch(stage)
+            status = ((resp_data or {}).get("data") or {}).get("task_status")
+            if status in TERMINAL_STATUSES:
+                finish_stage(pipeline_id, position, resp_data)
+            elif status:
+                yield self.create_text_message(f"📊 第 {stage['index']} 阶段任务状态: {status}")
+        recover_stages(pipeline_id)
+        pipeline = load_pipeline(self, pipeline_id) or pipeline
+
+        for stage in pipeline["stages"]:
+            detail = stage.get("error") or ", ".join(stage.get("result_urls") or []) or stage.get("task_id") or ""
+            yield self.create_text_message(
+                f"{STATUS_ICONS.get(stage['status'], '•')} 阶段{stage['index']} {stage['tool']}: "
+                f"{stage['status']} {detail}".rstrip()
+            )
+
+        if pipeline["status"] == "succeed":
+            yield self.create_text_message("🎉 流水线已完成")
+        elif pipeline["status"] == "failed":
+            yield self.create_text_message("❌ 流水线已失败")
+        else:
+            yield self.create_text_message("⏳ 流水线运行中，请稍后再次查询")
+        result = dict(pipeline)
+        result["result_urls"] = pipeline["stages"][-1]["result_urls"] if pipeline["status"] == "succeed" else []
+        yield self.create_json_message(result)
+
+    def _fetch(self, stage: dict[str, Any]) -> Optional[dict[str, Any]]:
+        task_id = stage["task_id"]
+        try:
+            response = get_json(
+                build_api_url(f"{stage['api_path']}/{task_id}"),
+                stage["endpoint"],
+                headers={
+                    "Authorization": f"Bearer {get_task_api_token(self, task_id)}",
+                    "Content-Type": "application/json",
+                },
+                timeout=60,
+            )
+            resp_data = response.json() if response.status_code == 200 else None
+        except Exception as exc:
+            logger.warning("Query of pipeline stage task %s failed: %s", task_id, exc)
+            return None
+        if resp_data and resp_data.get("code") == 0:
+            publish_task(self.runtime.credentials, stage["endpoint"], stage["api_path"], task_id, resp_data)
+        return resp_data
@@ -0,0 +1,143 @@
+# author: sawyer-shi
+
+import functools
+import io
+import logging
+import os
+import threading
+import time
+from collections.abc import Generator
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "KLING_PROFILE"
+PROFILE_DIR_ENV = "KLING_PROFILE_DIR"
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+
+# cProfile and tracemalloc are process-wide, so only one invocation is profiled at a time.
+_profile_lock = threading.Lock()
+
+
+def _tool_name(tool: Any) -> str:
+    return type(tool).__module__.rsplit(".", 1)[-1]
+
+
+def profiling_requested(tool: Any, tool_parameters: dict[str, Any]) -> bool:
+    if str(tool_parameters.get("profile", "")).strip().lower() == "true":
+        return True
+    setting = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if not setting or setting in {"0", "false", "no"}:
+        return False
+    if setting in {"1", "true", "yes", "all"}:
+        return True
+    names = {name.strip() for name in setting.split(",")}
+    return _tool_name(tool) in names or type(tool).__name__.lower() in names
+
+
+def _summarize(
+    tool_name: str,
+    elapsed: float,
+    profiler: "cProfile.Profile",
+    peak: int,
+    snapshot: Optional["tracemalloc.Snapshot"],
+) -> str:
+    import pstats
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+    lines = [
+        f"tool: {tool_name}",
+        f"wall_time_s: {elapsed:.4f}",
+        f"peak_traced_memory_mib: {peak / (1024 * 1024):.2f}",
+        "",
+        f"top {TOP_ALLOCATIONS} allocation sites live at exit:",
+    ]
+    if snapshot is not None:
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            lines.append(f"  {stat.size / 1024:10.1f} KiB  {stat.count:8d} blocks  {stat.traceback}")
+    lines += ["", f"top {TOP_FUNCTIONS} functions by cumulative time:", stream.getvalue()]
+    return "\n".join(lines)
+
+
+def _save(tool: Any, tool_name: str, summary: str, profiler: "cProfile.Profile") -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    directory = os.environ.get(PROFILE_DIR_ENV)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{tool_name}_{stamp}_{os.getpid()}")
+        with open(f"{base}.txt", "w", encoding="utf-8") as handle:
+            handle.write(summary)
+        profiler.dump_stats(f"{base}.prof")
+        return f"{base}.txt"
+
+    key = f"profile_{tool_name}_{stamp}"
+    tool.session.storage.set(key, summary.encode("utf-8"))
+    return f"storage:{key}"
+
+
+def profiled_invoke(func: Callable[..., Generator]) -> Callable[..., Generator]:
+    """Run a tool's ``_invoke`` under cProfile and tracemalloc when profiling is requested.
+
+    Enabled per call with the ``profile`` parameter, or for every call (or a
+    comma-separated list of tools) through ``KLING_PROFILE``. Summaries go to
+    ``KLING_PROFILE_DIR`` when set, otherwise to plugin storage.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, tool_parameters: dict[str, Any]) -> Generator:
+        if not profiling_requested(self, tool_parameters) or not _profile_lock.acquire(blocking=False):
+            yield from func(self, tool_parameters)
+            return
+
+        # Imported here so regular calls never pay for the profiling modules.
+        import cProfile
+        import tracemalloc
+
+        tool_name = _tool_name(self)
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        generator = func(self, tool_parameters)
+        try:
+            while True:
+                profiler.enable()
+                try:
+                    message = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    profiler.disable()
+                yield message
+        finally:
+            generator.close()
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            if started_tracing:
+                tracemalloc.stop()
+            _profile_lock.release()
+
+        summary = _summarize(tool_name, elapsed, profiler, peak, snapshot)
+        try:
+            location = _save(self, tool_name, summary, profiler)
+        except Exception as exc:
+            logger.warning("Failed to save profile for %s: %s", tool_name, exc)
+            location = None
+        logger.info("Profile for %s saved to %s", tool_name, location)
+        yield self.create_text_message(
+            f"🧪 性能剖析: 耗时 {elapsed:.3f}s, 内存峰值 {peak / (1024 * 1024):.2f} MiB"
+            + (f", 摘要: {location}" if location else "")
+        )
+
+    return wrapper
@@ -0,0 +1,181 @@
+# author: sawyer-shi
+
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import requests
+
+from tools.deadline import DeadlineExceeded, step_timeout
+from tools.http_client import post_json
+from tools.key_pool import lease_key
+from tools.metrics import REGISTRY
+from tools.utils import canonical_payload_hash
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENV = "KLING_SINGLEFLIGHT"
+SINGLEFLIGHT_WINDOW_ENV = "KLING_SINGLEFLIGHT_WINDOW"
+DEFAULT_WINDOW_SECONDS = 0.0
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "finished_at")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    Callers arriving while the first call runs wait for it and get its result
+    (or its exception). Results accepted by ``reusable`` are also handed out
+    for ``window`` seconds after the call finished.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def _evict(self, now: float, window: float) -> None:
+        expired = [
+            key
+            for key, call in self._calls.items()
+            if call.finished_at is not None and now - call.finished_at > window
+        ]
+        for key in expired:
+            del self._calls[key]
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        window: float = 0.0,
+        reusable: Callable[[Any], bool] = lambda result: True,
+    ) -> tuple[Any, bool]:
+        """Run ``fn`` once per key; returns ``(result, shared)``."""
+        with self._lock:
+            self._evict(time.monotonic(), window)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(step_timeout(None, "singleflight")):
+                raise DeadlineExceeded("调用时间预算已用尽，等待相同请求的结果超时")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+            if call.error is not None or window <= 0 or not reusable(call.result):
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+        return call.result, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+
+CREATES = SingleFlight()
+
+
+def singleflight_enabled() -> bool:
+    return os.environ.get(SINGLEFLIGHT_ENV, "1").strip().lower() not in {"0", "false", "no"}
+
+
+def singleflight_window() -> float:
+    try:
+        return max(float(os.environ.get(SINGLEFLIGHT_WINDOW_ENV, DEFAULT_WINDOW_SECONDS)), 0.0)
+    except ValueError:
+        return DEFAULT_WINDOW_SECONDS
+
+
+def _business_code(response: requests.Response) -> Optional[int]:
+    try:
+        return int(response.json().get("code"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _task_accepted(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        return response.json().get("code") == 0
+    except ValueError:
+        return False
+
+
+def _submit(
+    credentials: Optional[dict[str, Any]],
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    payload: dict[str, Any],
+    timeout: float,
+) -> requests.Response:
+    if credentials is None:
+        return post_json(url, endpoint, headers=headers, payload=payload, timeout=timeout)
+
+    # Elements live on the primary account, so element creation and anything
+    # referencing elements stays on it; other creates are spread over the key pool.
+    pooled = endpoint != "custom-elements" and not payload.get("element_list")
+    with lease_key(credentials, pooled=pooled) as lease:
+        response = post_json(
+            url,
+            endpoint,
+            headers={**headers, "Authorization": f"Bearer {lease.token}"},
+            payload=payload,
+            timeout=timeout,
+        )
+        lease.release(response.status_code, _business_code(response) if response.status_code == 429 else None)
+        if _task_accepted(response):
+            lease.pin(response.json()["data"].get("task_id"), payload.get("external_task_id"))
+    return response
+
+
+def post_create(
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    payload: dict[str, Any],
+    scope: str = "",
+    timeout: float = 60,
+    credentials: Optional[dict[str, Any]] = None,
+) -> tuple[requests.Response, bool]:
+    """Submit a create request, sharing one upstream task between identical submissions.
+
+    Requests are keyed by the endpoint, ``scope`` (the account) and the
+    canonical payload hash. When ``credentials`` are given the request is sent
+    with a key leased from their pool and the task is pinned to that key.
+    Returns the response and whether it was shared with another caller rather
+    than sent for this one.
+    """
+    submit = functools.partial(_submit, credentials, url, endpoint, headers, payload, timeout)
+    if not singleflight_enabled():
+        return submit(), False
+
+    key = canonical_payload_hash(endpoint, payload, scope)
+    response, shared = CREATES.do(key, submit, window=singleflight_window(), reusable=_task_accepted)
+    if shared:
+        logger.info("Reusing in-flight %s task for identical request %s", endpoint, key[:12])
+        REGISTRY.count_event("singleflight_shared", endpoint)
+    return response, shared
@@ -0,0 +1,290 @@
+# author: sawyer-shi
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+import requests
+
+from tools.http_client import get_json
+from tools.local_store import read_json, write_json
+from tools.singleflight import post_create
+from tools.task_poller import track_task
+from tools.utils import build_api_url
+from tools.validation import MODEL_CAPABILITIES
+
+logger = logging.getLogger(__name__)
+
+STORYBOARD_DIR_ENV = "KLING_STORYBOARD_DIR"
+ENDPOINT = "text2video"
+API_PATH = "v1/videos/text2video"
+DEFAULT_SHOT_SECONDS = 5
+MAX_SHOTS = 50
+# Submissions of one segment, counting the first; Storyboard Query retries until this many.
+MAX_SUBMIT_ATTEMPTS = 3
+# Request parameters shared by every segment of a job, kept so retries send the same request.
+SEGMENT_OPTIONS = ("negative_prompt", "mode", "aspect_ratio", "sound")
+
+# Durations of models missing from the text2video capability table.
+DEFAULT_DURATIONS = [5, 10]
+
+# Jobs created in this process; storage is the durable copy when the runtime has it.
+_jobs: dict[str, dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def _directory() -> Optional[str]:
+    return os.environ.get(STORYBOARD_DIR_ENV) or None
+
+
+def _scope_hash(tool: Any) -> str:
+    access_key = str((tool.runtime.credentials or {}).get("access_key", ""))
+    return hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_shots(value: Any, default_seconds: int = DEFAULT_SHOT_SECONDS) -> list[dict[str, Any]]:
+    """Normalize a shot list: a JSON array of prompts or ``{"prompt", "duration"}`` objects.
+
+    Plain text is read as one shot per non-empty line. Raises ``ValueError``.
+    """
+    if isinstance(value, str) and not value.strip().startswith("["):
+        value = [line.strip() for line in value.splitlines() if line.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError("shots 需要为非空的 JSON 数组或每行一个镜头的文本")
+    if len(value) > MAX_SHOTS:
+        raise ValueError(f"镜头数量不能超过 {MAX_SHOTS} 个")
+
+    shots = []
+    for index, item in enumerate(value, start=1):
+        shot = {"prompt": item} if isinstance(item, str) else item
+        if not isinstance(shot, dict) or not str(shot.get("prompt") or "").strip():
+            raise ValueError(f"第 {index} 个镜头缺少 prompt")
+        try:
+            seconds = float(shot.get("duration") or default_seconds)
+        except (TypeError, ValueError):
+            raise ValueError(f"第 {index} 个镜头的 duration 无效")
+        if seconds <= 0:
+            raise ValueError(f"第 {index} 个镜头的 duration 需要大于 0")
+        entry = {"prompt": str(shot["prompt"]).strip(), "duration": seconds}
+        if shot.get("negative_prompt"):
+            entry["negative_prompt"] = str(shot["negative_prompt"])
+        shots.append(entry)
+    return shots
+
+
+def model_durations(model_name: str) -> list[int]:
+    """Durations text2video accepts for ``model_name``, from the validation capability table."""
+    limits = MODEL_CAPABILITIES["text_2_video_create"].get(model_name) or {}
+    return sorted(int(duration) for duration in limits.get("durations") or ()) or DEFAULT_DURATIONS
+
+
+def _fit(seconds: float, durations: list[int]) -> int:
+    """The shortest allowed duration that covers ``seconds``, else the longest one."""
+    for duration in durations:
+        if duration >= seconds - 1e-9:
+            return duration
+    return durations[-1]
+
+
+def _split(seconds: float, durations: list[int]) -> list[int]:
+    """Allowed durations covering ``seconds``: full-length parts, then the remainder rounded up."""
+    longest = durations[-1]
+    parts = []
+    while seconds > longest + 1e-9:
+        parts.append(longest)
+        seconds -= longest
+    parts.append(_fit(seconds, durations))
+    return parts
+
+
+def _part_prompt(prompt: str, part: int, parts: int) -> str:
+    """``prompt`` with the position of the part, so the parts of a long shot are not generated alike."""
+    if parts == 1:
+        return prompt
+    if part == 1:
+        return f"{prompt} (part 1 of {parts} of one continuous shot: the opening of the action)"
+    return (
+        f"{prompt} (part {part} of {parts} of one continuous shot: "
+        f"continue from where part {part - 1} ends, do not repeat it)"
+    )
+
+
+def plan_segments(shots: list[dict[str, Any]], model_name: str) -> list[dict[str, Any]]:
+    """Split shots into segments the model can generate as independent tasks.
+
+    A shot longer than the model's maximum becomes full-length parts plus a
+    remainder rounded up to an accepted duration; each part's prompt says
+    which part of the shot it continues.
+    """
+    durations = model_durations(model_name)
+    segments = []
+    for shot_index, shot in enumerate(shots, start=1):
+        lengths = _split(shot["duration"], durations)
+        for part, duration in enumerate(lengths, start=1):
+            segment = {
+                "index": len(segments) + 1,
+                "shot": shot_index,
+                "part": part,
+                "parts": len(lengths),
+                "prompt": _part_prompt(shot["prompt"], part, len(lengths)),
+                "duration": duration,
+            }
+            if shot.get("negative_prompt"):
+                segment["negative_prompt"] = shot["negative_prompt"]
+            segments.append(segment)
+    return segments
+
+
+def segment_options(tool_parameters: dict[str, Any]) -> dict[str, Any]:
+    """The request parameters of ``tool_parameters`` that apply to every segment."""
+    return {name: tool_parameters[name] for name in SEGMENT_OPTIONS if tool_parameters.get(name)}
+
+
+def segment_payload(job_id: str, segment: dict[str, Any], options: dict[str, Any], model_name: str) -> dict[str, Any]:
+    """The text-to-video create request of one segment."""
+    payload: dict[str, Any] = {
+        "model_name": model_name,
+        "prompt": segment["prompt"],
+        "duration": str(segment["duration"]),
+    }
+    negative_prompt = segment.get("negative_prompt") or options.get("negative_prompt")
+    if negative_prompt:
+        payload["negative_prompt"] = negative_prompt
+    for name in ("mode", "aspect_ratio", "sound"):
+        if options.get(name):
+            payload[name] = options[name]
+    # Parts of one long shot share most of a prompt; the id also lets a retry find an earlier submission.
+    payload["external_task_id"] = f"{job_id}_{segment['index']}"
+    return payload
+
+
+def submit_segment(
+    tool: Any, segment: dict[str, Any], payload: dict[str, Any], api_token: str
+) -> tuple[Optional[dict[str, Any]], Optional[str]]:
+    """Submit one segment; returns the response data or an error message."""
+    headers = {"Authorization": f"Bearer {api_token}", "Content-Type": "application/json"}
+    try:
+        logger.info("Submitting storyboard segment #%d: %s", segment["index"], json.dumps(payload, ensure_ascii=False))
+        response, _ = post_create(
+            build_api_url(API_PATH),
+            ENDPOINT,
+            headers=headers,
+            payload=payload,
+            scope=tool.runtime.credentials.get("access_key", ""),
+            timeout=60,
+            credentials=tool.runtime.credentials,
+        )
+    except requests.exceptions.Timeout:
+        return None, "请求超时"
+    except requests.exceptions.RequestException as exc:
+        return None, f"请求失败: {exc}"
+
+    if response.status_code != 200:
+        logger.error("API status %s for segment #%d: %s", response.status_code, segment["index"], response.text[:300])
+        return None, f"API 响应状态码: {response.status_code}"
+    try:
+        resp_data = response.json()
+    except json.JSONDecodeError:
+        return None, "API 响应解析失败（非JSON）"
+    if resp_data.get("code") != 0:
+        return None, f"创建失败: {resp_data.get('message', '未知错误')}"
+
+    track_task(tool.runtime.credentials, ENDPOINT, API_PATH, resp_data, payload)
+    return resp_data.get("data", {}), None
+
+
+def retry_segment(tool: Any, job: dict[str, Any], segment: dict[str, Any], api_token: str) -> dict[str, Any]:
+    """Resubmit a segment whose submission failed, unless Kling already has its ``external_task_id``.
+
+    Returns the updated segment; ``attempts`` counts the submissions made.
+    """
+    payload = segment_payload(job["job_id"], segment, job.get("options") or {}, job["model_name"])
+    current = dict(segment)
+    try:
+        response = get_json(
+            build_api_url(f"{API_PATH}/{payload['external_task_id']}"),
+            ENDPOINT,
+            headers={"Authorization": f"Bearer {api_token}", "Content-Type": "application/json"},
+            timeout=30,
+        )
+        found = response.json() if response.status_code == 200 else {}
+    except (requests.exceptions.RequestException, ValueError) as exc:
+        # Without the check a retry could create the segment twice; try again on the next query.
+        current["error"] = f"请求失败: {exc}"
+        return current
+    data = (found.get("data") or {}) if found.get("code") == 0 else {}
+    if not data.get("task_id"):
+        data, error = submit_segment(tool, segment, payload, api_token)
+        current["attempts"] = int(segment.get("attempts") or 1) + 1
+        if error is not None:
+            current["error"] = error
+            return current
+    current["task_id"] = data.get("task_id")
+    current["task_status"] = data.get("task_status") or "submitted"
+    current["error"] = None
+    return current
+
+
+def segment_failed(segment: dict[str, Any]) -> bool:
+    """Whether the segment failed for good: its task failed or its submissions ran out."""
+    if segment.get("task_status") == "failed":
+        return True
+    return not segment.get("task_id") and int(segment.get("attempts") or 1) >= MAX_SUBMIT_ATTEMPTS
+
+
+def new_job_id() -> str:
+    return f"sb_{uuid.uuid4().hex[:16]}"
+
+
+def create_job(
+    tool: Any, job_id: str, model_name: str, segments: list[dict[str, Any]], options: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """Record a storyboard job (segments carry their ``task_id`` or ``error``)."""
+    job = {
+        "job_id": job_id,
+        "model_name": model_name,
+        "created_at": time.time(),
+        "scope": _scope_hash(tool),
+        "options": options or {},
+        "segments": segments,
+    }
+    save_job(tool, job)
+    return job
+
+
+def save_job(tool: Any, job: dict[str, Any]) -> None:
+    with _lock:
+        _jobs[job["job_id"]] = job
+    try:
+        write_json(tool, f"storyboard_{job['job_id']}", job, _directory())
+    except Exception as exc:
+        logger.warning("Storyboard job %s kept in memory only: %s", job["job_id"], exc)
+
+
+def load_job(tool: Any, job_id: str) -> Optional[dict[str, Any]]:
+    """The job ``job_id`` if it belongs to the calling account."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        try:
+            job = read_json(tool, f"storyboard_{job_id}", _directory())
+        except Exception as exc:
+            logger.debug("Storyboard storage unavailable: %s", exc)
+            job = None
+    if not job or job.get("scope") != _scope_hash(tool):
+        return None
+    return job
+
+
+def overall_status(segments: list[dict[str, Any]]) -> str:
+    """``failed`` if any segment failed for good, ``succeed`` once all did, else ``processing``."""
+    if any(segment_failed(segment) for segment in segments):
+        return "failed"
+    if segments and all(segment.get("task_status") == "succeed" for segment in segments):
+        return "succeed"
+    return "processing"
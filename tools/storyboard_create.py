@@ -0,0 +1,125 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.concurrency import DEFAULT_CONCURRENCY, clamp_concurrency, map_bounded
+from tools.deadline import deadline_invoke
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.storyboard import (
+    MAX_SUBMIT_ATTEMPTS,
+    create_job,
+    new_job_id,
+    parse_shots,
+    plan_segments,
+    segment_options,
+    segment_payload,
+    submit_segment,
+)
+from tools.tracing import traced_invoke
+from tools.utils import get_api_token, parse_json_param
+from tools.validation import validate_tool_parameters
+
+logger = logging.getLogger(__name__)
+
+
+class StoryboardCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Split a shot list into text-to-video segments and submit them concurrently."""
+        logger.info("Starting storyboard create task")
+
+        try:
+            api_token = get_api_token(self.runtime)
+        except Exception as exc:
+            msg = f"❌ 凭证获取失败: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return
+
+        errors = validate_tool_parameters("storyboard_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        raw_shots = tool_parameters.get("shots")
+        try:
+            if isinstance(raw_shots, str) and raw_shots.strip().startswith("["):
+                raw_shots = parse_json_param(raw_shots, "shots")
+            shots = parse_shots(raw_shots)
+        except ValueError as exc:
+            msg = f"❌ {exc}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        model_name = tool_parameters.get("model_name", "kling-v1")
+        segments = plan_segments(shots, model_name)
+        concurrency = clamp_concurrency(tool_parameters.get("max_concurrency", DEFAULT_CONCURRENCY))
+        options = segment_options(tool_parameters)
+        job_id = new_job_id()
+
+        yield self.create_text_message(
+            f"🎬 分镜任务启动中: {len(shots)} 个镜头，拆分为 {len(segments)} 段，并发 {concurrency}"
+        )
+        yield self.create_text_message(f"🤖 模型: {model_name}")
+        requested = sum(shot["duration"] for shot in shots)
+        planned = sum(segment["duration"] for segment in segments)
+        yield self.create_text_message(f"⏱️ 计划总时长 {planned}s（请求 {requested:g}s）")
+
+        def submit_one(segment: dict[str, Any]) -> dict[str, Any]:
+            payload = segment_payload(job_id, segment, options, model_name)
+            data, error = submit_segment(self, segment, payload, api_token)
+            outcome = dict(segment)
+            outcome["attempts"] = 1
+            outcome["task_id"] = (data or {}).get("task_id")
+            outcome["task_status"] = (data or {}).get("task_status") if error is None else "submit_failed"
+            outcome["error"] = error
+            return outcome
+
+        outcomes = map_bounded(submit_one, segments, concurrency)
+
+        for outcome in outcomes:
+            label = f"#{outcome['index']} 镜头{outcome['shot']}"
+            if outcome["parts"] > 1:
+                label += f" ({outcome['part']}/{outcome['parts']})"
+            if outcome["error"] is None:
+                yield self.create_text_message(f"{label} ✅ {outcome['duration']}s 任务ID {outcome['task_id']}")
+            else:
+                yield self.create_text_message(f"{label} ⚠️ {outcome['error']}")
+
+        submitted = [outcome for outcome in outcomes if outcome["error"] is None]
+        if not submitted:
+            yield self.create_text_message("❌ 分镜任务全部提交失败")
+            yield self.create_json_message({"total": len(outcomes), "submitted": 0, "segments": outcomes})
+            return
+
+        job = create_job(self, job_id, model_name, outcomes, options)
+        yield self.create_text_message(
+            f"✅ 分镜任务已提交: 成功 {len(submitted)} 段，失败 {len(outcomes) - len(submitted)} 段"
+        )
+        if len(submitted) < len(outcomes):
+            yield self.create_text_message(f"🔁 提交失败的分段会在查询时自动重试（每段最多 {MAX_SUBMIT_ATTEMPTS} 次）")
+        yield self.create_text_message(f"📋 分镜任务ID: {job['job_id']}")
+        yield self.create_text_message("💡 请使用分镜查询工具按顺序获取各段结果")
+        yield self.create_json_message(
+            {
+                "job_id": job["job_id"],
+                "total": len(outcomes),
+                "submitted": len(submitted),
+                "failed": len(outcomes) - len(submitted),
+                "requested_duration": requested,
+                "total_duration": planned,
+                "segments": outcomes,
+            }
+        )
@@ -0,0 +1,149 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any, Optional
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.concurrency import DEFAULT_CONCURRENCY, map_bounded
+from tools.deadline import deadline_invoke
+from tools.http_client import get_json
+from tools.key_pool import get_task_api_token
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.storyboard import (
+    API_PATH,
+    ENDPOINT,
+    load_job,
+    overall_status,
+    retry_segment,
+    save_job,
+    segment_failed,
+)
+from tools.task_poller import cached_task, publish_task
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, get_api_token
+
+logger = logging.getLogger(__name__)
+
+STATUS_ICONS = {"submitted": "📤", "processing": "⏳", "succeed": "✅", "failed": "❌", "submit_failed": "⚠️"}
+
+
+class StoryboardQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Report every segment of a storyboard job in shot order."""
+        logger.info("Starting storyboard query task")
+
+        job_id = str(tool_parameters.get("job_id") or "").strip()
+        if not job_id:
+            msg = "❌ 请输入分镜任务ID"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        job = load_job(self, job_id)
+        if job is None:
+            msg = f"❌ 未找到分镜任务: {job_id}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        yield self.create_text_message(f"🔍 正在查询分镜任务: {job_id}")
+
+        retry = [segment for segment in job["segments"] if not segment.get("task_id") and not segment_failed(segment)]
+        if retry:
+            try:
+                api_token = get_api_token(self.runtime)
+            except Exception as exc:
+                msg = f"❌ 凭证获取失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            yield self.create_text_message(f"🔁 正在重新提交 {len(retry)} 个提交失败的分段")
+            retried = {
+                segment["index"]: segment
+                for segment in map_bounded(
+                    lambda segment: retry_segment(self, job, segment, api_token), retry, DEFAULT_CONCURRENCY
+                )
+            }
+            job = dict(job, segments=[retried.get(segment["index"], segment) for segment in job["segments"]])
+            save_job(self, job)
+
+        segments = map_bounded(self._refresh, job["segments"], DEFAULT_CONCURRENCY)
+        status = overall_status(segments)
+        finished = sum(1 for segment in segments if segment["task_status"] == "succeed" or segment_failed(segment))
+
+        for segment in segments:
+            label = f"#{segment['index']} 镜头{segment['shot']}"
+            if segment["parts"] > 1:
+                label += f" ({segment['part']}/{segment['parts']})"
+            detail = segment.get("video_url") or segment.get("error") or segment.get("task_id") or ""
+            yield self.create_text_message(
+                f"{STATUS_ICONS.get(segment['task_status'], '•')} {label}: {segment['task_status']} {detail}".rstrip()
+            )
+
+        videos = [segment["video_url"] for segment in segments if segment.get("video_url")]
+        if status == "succeed":
+            yield self.create_text_message(f"🎉 全部 {len(segments)} 段已完成，按镜头顺序返回视频链接")
+        elif status == "failed":
+            yield self.create_text_message(f"❌ 部分分段失败 ({finished}/{len(segments)} 已结束)")
+        else:
+            yield self.create_text_message(f"⏳ 生成中: {finished}/{len(segments)} 段已结束，请稍后再次查询")
+        yield self.create_json_message(
+            {
+                "job_id": job_id,
+                "status": status,
+                "finished": finished,
+                "total": len(segments),
+                "videos": videos if status == "succeed" else [],
+                "segments": segments,
+            }
+        )
+
+    def _refresh(self, segment: dict[str, Any]) -> dict[str, Any]:
+        """The segment with its current task status and, once finished, its video URL."""
+        current = dict(segment)
+        task_id = segment.get("task_id")
+        if not task_id:
+            current["task_status"] = "submit_failed"
+            return current
+
+        resp_data = cached_task(self.runtime.credentials, ENDPOINT, task_id) or self._fetch(task_id)
+        if resp_data is None or resp_data.get("code") != 0:
+            current["task_status"] = "submitted"
+            current["error"] = (resp_data or {}).get("message") or "查询失败"
+            return current
+
+        data = resp_data.get("data") or {}
+        current["task_status"] = data.get("task_status") or "submitted"
+        current["error"] = data.get("task_status_msg") or None
+        videos = (data.get("task_result") or {}).get("videos") or []
+        if videos:
+            current["video_url"] = videos[0].get("url")
+            current["video_duration"] = videos[0].get("duration")
+        return current
+
+    def _fetch(self, task_id: str) -> Optional[dict[str, Any]]:
+        try:
+            response = get_json(
+                build_api_url(f"{API_PATH}/{task_id}"),
+                ENDPOINT,
+                headers={
+                    "Authorization": f"Bearer {get_task_api_token(self, task_id)}",
+                    "Content-Type": "application/json",
+                },
+                timeout=60,
+            )
+            resp_data = response.json() if response.status_code == 200 else None
+        except Exception as exc:
+            logger.warning("Query of storyboard segment task %s failed: %s", task_id, exc)
+            return None
+        if resp_data and resp_data.get("code") == 0:
+            publish_task(self.runtime.credentials, ENDPOINT, API_PATH, task_id, resp_data)
+        return resp_data
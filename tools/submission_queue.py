@@ -0,0 +1,477 @@
+# author: sawyer-shi
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+import requests
+
+from tools.deadline import deadline_scope
+from tools.local_db import SEAL_PREFIX, LocalDb, SealError, db_path, get_db
+from tools.metrics import REGISTRY
+from tools.singleflight import post_create
+from tools.task_poller import track_task
+from tools.utils import MEDIA_PAYLOAD_KEYS, build_api_url, parse_bool
+
+logger = logging.getLogger(__name__)
+
+QUEUE_RATE_ENV = "KLING_QUEUE_RATE"
+QUEUE_WORKERS_ENV = "KLING_QUEUE_WORKERS"
+DEFAULT_RATE = 2.0
+DEFAULT_WORKERS = 2
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 300.0
+# A job left "submitting" this long (its process died mid-request) is picked up again.
+SUBMIT_LEASE_SECONDS = 120.0
+# A submission is cut off this long before its lease runs out, so no other worker re-claims it mid-request.
+LEASE_MARGIN_SECONDS = 20.0
+IDLE_EXIT_SECONDS = 30.0
+RETENTION_SECONDS = 7 * 86400
+MIN_BLOB_LENGTH = 256
+
+QUEUED = "queued"
+SUBMITTING = "submitting"
+SUBMITTED = "submitted"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    api_path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    credentials TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    task_id TEXT,
+    response TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (scope, status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS job_blobs (job_id TEXT NOT NULL, digest TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS job_blobs_job ON job_blobs (job_id);
+"""
+
+
+def queue_requested(tool_parameters: dict[str, Any]) -> bool:
+    return bool(parse_bool(tool_parameters.get("queue_submission"), False))
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _store_blobs(value: Any, key: Optional[str], blobs: dict[str, str]) -> Any:
+    """Replace inline media with ``{"$blob": digest}`` references collected in ``blobs``."""
+    if isinstance(value, dict):
+        return {k: _store_blobs(v, k, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_store_blobs(item, key, blobs) for item in value]
+    if isinstance(value, str) and key in MEDIA_PAYLOAD_KEYS and len(value) > MIN_BLOB_LENGTH:
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        blobs[digest] = value
+        return {"$blob": digest}
+    return value
+
+
+def _load_blobs(value: Any, blobs: dict[str, str]) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"$blob"}:
+            return blobs[value["$blob"]]
+        return {k: _load_blobs(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_load_blobs(item, blobs) for item in value]
+    return value
+
+
+class SubmissionQueue:
+    """Create requests persisted in SQLite (WAL) until Kling accepts or rejects them.
+
+    Each job carries the credentials it was enqueued with, sealed with the
+    database's key (``LocalDb.seal``) and cleared once the job is submitted or
+    has failed, so workers sign their own tokens and never hold the enqueuing
+    tool. Inline media is
+    stored once per content digest and shared between jobs. Jobs are claimed
+    with a lease, so a job whose process died mid-submit is retried once the
+    lease runs out.
+    """
+
+    def __init__(self, db: LocalDb) -> None:
+        self.db = db
+        self.path = db.path
+        db.ensure_schema("jobs", _SCHEMA)
+        db.add_column("jobs", "credentials", "TEXT")
+        self._seal_stored_credentials()
+
+    def _seal_stored_credentials(self) -> None:
+        """Seal credentials an older version stored as plain JSON; drop those of finished jobs."""
+        rows = self._fetch(
+            "SELECT job_id, credentials FROM jobs WHERE credentials IS NOT NULL AND credentials NOT LIKE ?",
+            (SEAL_PREFIX + "%",),
+        )
+        statements = [
+            (
+                "UPDATE jobs SET credentials = ? WHERE job_id = ?",
+                (self.db.seal(json.loads(row["credentials"])), row["job_id"]),
+            )
+            for row in rows
+        ]
+        statements.append(
+            (
+                "UPDATE jobs SET credentials = NULL WHERE status IN (?, ?) AND credentials IS NOT NULL",
+                (SUBMITTED, FAILED),
+            )
+        )
+        self._transaction(statements)
+
+    def _transaction(self, statements: list[tuple[str, tuple[Any, ...]]]) -> None:
+        self.db.transaction(statements)
+
+    def _fetch(self, sql: str, params: tuple[Any, ...]) -> list[sqlite3.Row]:
+        return self.db.query(sql, params)
+
+    def enqueue(
+        self, scope: str, endpoint: str, api_path: str, payload: dict[str, Any], credentials: dict[str, Any]
+    ) -> dict[str, Any]:
+        blobs: dict[str, str] = {}
+        stored = _store_blobs(payload, None, blobs)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        statements = [
+            ("INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)", (digest, data))
+            for digest, data in blobs.items()
+        ]
+        statements += [("INSERT INTO job_blobs (job_id, digest) VALUES (?, ?)", (job_id, digest)) for digest in blobs]
+        statements.append(
+            (
+                "INSERT INTO jobs (job_id, scope, endpoint, api_path, payload, credentials, status, created_at,"
+                " updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    scope,
+                    endpoint,
+                    api_path,
+                    json.dumps(stored, ensure_ascii=False),
+                    self.db.seal(credentials),
+                    QUEUED,
+                    now,
+                    now,
+                ),
+            )
+        )
+        self._transaction(statements)
+        REGISTRY.count_event("queue_enqueued", endpoint)
+        return self.get(job_id) or {}
+
+    def claim(self, scope: str) -> Optional[dict[str, Any]]:
+        """Take the oldest due job of ``scope``, with its media and credentials restored, or ``None``."""
+        while True:
+            now = time.time()
+            with self.db.immediate() as conn:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE scope = ? AND status IN (?, ?) AND next_attempt_at <= ?"
+                    " AND credentials IS NOT NULL ORDER BY created_at LIMIT 1",
+                    (scope, QUEUED, SUBMITTING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, next_attempt_at = ?, updated_at = ?"
+                    " WHERE job_id = ?",
+                    (SUBMITTING, now + SUBMIT_LEASE_SECONDS, now, row["job_id"]),
+                )
+                blobs = {
+                    blob["digest"]: blob["data"]
+                    for blob in conn.execute(
+                        "SELECT blobs.digest, blobs.data FROM job_blobs JOIN blobs USING (digest) WHERE job_id = ?",
+                        (row["job_id"],),
+                    )
+                }
+            job = dict(row)
+            try:
+                job["credentials"] = self.db.unseal(job["credentials"])
+            except SealError as exc:
+                # Sealed under a key this process does not have (KLING_STATE_KEY changed).
+                logger.error("Queued job %s has unreadable credentials: %s", job["job_id"], exc)
+                self.mark_failed(job["job_id"], "存储的凭据无法解密，请重新提交")
+                continue
+            job["attempts"] += 1
+            job["payload"] = _load_blobs(json.loads(job["payload"]), blobs)
+            return job
+
+    def adopt(self, scope: str, credentials: dict[str, Any]) -> None:
+        """Attach ``credentials`` to jobs of ``scope`` enqueued before jobs carried their own."""
+        self._transaction(
+            [
+                (
+                    "UPDATE jobs SET credentials = ? WHERE scope = ? AND credentials IS NULL AND status IN (?, ?)",
+                    (self.db.seal(credentials), scope, QUEUED, SUBMITTING),
+                )
+            ]
+        )
+
+    def _finish(self, job_id: str, assignments: str, params: tuple[Any, ...]) -> None:
+        self._transaction(
+            [
+                (
+                    f"UPDATE jobs SET {assignments}, credentials = NULL, updated_at = ? WHERE job_id = ?",
+                    (*params, time.time(), job_id),
+                ),
+                ("DELETE FROM job_blobs WHERE job_id = ?", (job_id,)),
+                ("DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM job_blobs)", ()),
+            ]
+        )
+
+    def mark_submitted(self, job_id: str, task_id: Optional[str], response: dict[str, Any]) -> None:
+        self._finish(
+            job_id,
+            "status = ?, task_id = ?, response = ?, error = NULL",
+            (SUBMITTED, task_id, json.dumps(response, ensure_ascii=False)),
+        )
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "status = ?, error = ?", (FAILED, error))
+
+    def retry_later(self, job_id: str, delay: float, error: str) -> None:
+        self._transaction(
+            [
+                (
+                    "UPDATE jobs SET status = ?, next_attempt_at = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                    (QUEUED, time.time() + delay, error, time.time(), job_id),
+                )
+            ]
+        )
+
+    def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        rows = self._fetch("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        return _public(rows[0]) if rows else None
+
+    def scope_of(self, job_id: str) -> Optional[str]:
+        rows = self._fetch("SELECT scope FROM jobs WHERE job_id = ?", (job_id,))
+        return rows[0]["scope"] if rows else None
+
+    def list_jobs(self, scope: str, limit: int = 20) -> list[dict[str, Any]]:
+        rows = self._fetch("SELECT * FROM jobs WHERE scope = ? ORDER BY created_at DESC LIMIT ?", (scope, limit))
+        return [_public(row) for row in rows]
+
+    def counts(self, scope: str) -> dict[str, int]:
+        rows = self._fetch("SELECT status, COUNT(*) AS n FROM jobs WHERE scope = ? GROUP BY status", (scope,))
+        return {row["status"]: row["n"] for row in rows}
+
+    def pending(self, scope: str) -> int:
+        """Jobs of ``scope`` a worker can still submit."""
+        rows = self._fetch(
+            "SELECT COUNT(*) FROM jobs WHERE scope = ? AND status IN (?, ?) AND credentials IS NOT NULL",
+            (scope, QUEUED, SUBMITTING),
+        )
+        return rows[0][0]
+
+    def pending_scopes(self) -> list[str]:
+        """Accounts with jobs a worker can still submit, e.g. left by an earlier run."""
+        rows = self._fetch(
+            "SELECT DISTINCT scope FROM jobs WHERE status IN (?, ?) AND credentials IS NOT NULL", (QUEUED, SUBMITTING)
+        )
+        return [row["scope"] for row in rows]
+
+    def purge(self, older_than: float = RETENTION_SECONDS) -> None:
+        """Drop finished jobs older than ``older_than`` seconds."""
+        self._transaction(
+            [
+                (
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                    (SUBMITTED, FAILED, time.time() - older_than),
+                )
+            ]
+        )
+
+
+def _public(row: sqlite3.Row) -> dict[str, Any]:
+    job = {key: row[key] for key in ("job_id", "endpoint", "status", "attempts", "task_id", "error")}
+    job["created_at"] = row["created_at"]
+    job["updated_at"] = row["updated_at"]
+    if row["response"]:
+        job["response"] = json.loads(row["response"])
+    return job
+
+
+class _RateLimiter:
+    """Token bucket spacing out submissions of one account."""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _Drain:
+    """Worker threads submitting one account's queued jobs; they exit once the queue is idle."""
+
+    def __init__(self, queue: SubmissionQueue, scope: str) -> None:
+        self.queue = queue
+        self.scope = scope
+        self.wakeup = threading.Event()
+        self.limiter = _RateLimiter(_env_float(QUEUE_RATE_ENV, DEFAULT_RATE))
+        self.threads: list[threading.Thread] = []
+
+    def alive(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def start(self) -> None:
+        workers = max(int(_env_float(QUEUE_WORKERS_ENV, DEFAULT_WORKERS)), 1)
+        self.threads = [
+            threading.Thread(target=self._run, name=f"kling-queue-{index}", daemon=True) for index in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self) -> None:
+        idle_since = time.monotonic()
+        while True:
+            # Pace before claiming so a job is only marked submitting while its request is sent.
+            self.limiter.wait()
+            job = self.queue.claim(self.scope)
+            if job is None:
+                if time.monotonic() - idle_since > IDLE_EXIT_SECONDS and not self.queue.pending(self.scope):
+                    return
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                continue
+            idle_since = time.monotonic()
+            try:
+                self._submit(job)
+            except Exception as exc:
+                logger.exception("Queued job %s crashed", job["job_id"])
+                REGISTRY.count_retry(job["endpoint"], "create")
+                self.queue.retry_later(job["job_id"], _backoff(job["attempts"]), str(exc))
+
+    def _submit(self, job: dict[str, Any]) -> None:
+        job_id, endpoint = job["job_id"], job["endpoint"]
+        error: Optional[str] = None
+        try:
+            with deadline_scope(SUBMIT_LEASE_SECONDS - LEASE_MARGIN_SECONDS):
+                response, _ = post_create(
+                    build_api_url(job["api_path"]),
+                    endpoint,
+                    headers={"Content-Type": "application/json"},
+                    payload=job["payload"],
+                    scope=self.scope,
+                    timeout=60,
+                    credentials=job["credentials"],
+                )
+        except requests.exceptions.RequestException as exc:
+            response, error = None, f"请求失败: {exc}"
+
+        if response is not None:
+            try:
+                resp_data = response.json()
+            except ValueError:
+                resp_data = {}
+            if response.status_code == 200 and resp_data.get("code") == 0:
+                self.queue.mark_submitted(job_id, (resp_data.get("data") or {}).get("task_id"), resp_data)
+                track_task(job["credentials"], endpoint, job["api_path"], resp_data, job["payload"])
+                REGISTRY.count_event("queue_submitted", endpoint)
+                return
+            if response.status_code != 429 and response.status_code < 500:
+                self.queue.mark_failed(
+                    job_id, f"创建失败 ({response.status_code}): {resp_data.get('message') or response.text[:200]}"
+                )
+                REGISTRY.count_event("queue_failed", endpoint)
+                return
+            error = f"API 响应状态码: {response.status_code}"
+
+        if job["attempts"] >= MAX_ATTEMPTS:
+            self.queue.mark_failed(job_id, f"{error}（已重试 {job['attempts']} 次）")
+            REGISTRY.count_event("queue_failed", endpoint)
+        else:
+            REGISTRY.count_retry(endpoint, "create")
+            self.queue.retry_later(job_id, _backoff(job["attempts"]), error or "")
+
+
+def _backoff(attempts: int) -> float:
+    return min(2.0 ** attempts, MAX_BACKOFF_SECONDS)
+
+
+_queues: dict[str, SubmissionQueue] = {}
+_drains: dict[str, _Drain] = {}
+_registry_lock = threading.Lock()
+
+
+def get_queue() -> SubmissionQueue:
+    path = db_path()
+    with _registry_lock:
+        queue = _queues.get(path)
+        if queue is None:
+            queue = _queues[path] = SubmissionQueue(get_db())
+            queue.purge()
+        return queue
+
+
+def _scope(tool: Any) -> str:
+    return str(tool.runtime.credentials.get("access_key", ""))
+
+
+def _start_drain(queue: SubmissionQueue, scope: str) -> None:
+    with _registry_lock:
+        drain = _drains.get(f"{queue.path}:{scope}")
+        if drain is not None and drain.alive():
+            drain.wakeup.set()
+            return
+        if not queue.pending(scope):
+            return
+        drain = _drains[f"{queue.path}:{scope}"] = _Drain(queue, scope)
+        drain.start()
+
+
+def ensure_workers(tool: Any) -> None:
+    """Start (or wake) the workers draining this account's jobs.
+
+    Jobs left by an older version without credentials get this tool's.
+    """
+    queue, scope = get_queue(), _scope(tool)
+    queue.adopt(scope, tool.runtime.credentials)
+    _start_drain(queue, scope)
+
+
+def resume_pending() -> None:
+    """Start workers for every account with jobs left by an earlier run; called at plugin start."""
+    try:
+        queue = get_queue()
+        scopes = queue.pending_scopes()
+    except Exception as exc:
+        logger.warning("Submission queue not resumed: %s", exc)
+        return
+    for scope in scopes:
+        _start_drain(queue, scope)
+    if scopes:
+        logger.info("Resumed queued submissions for %d account(s)", len(scopes))
+
+
+def enqueue_create(tool: Any, endpoint: str, api_path: str, payload: dict[str, Any]) -> dict[str, Any]:
+    """Persist a create request and make sure a worker will submit it."""
+    job = get_queue().enqueue(_scope(tool), endpoint, api_path, payload, tool.runtime.credentials)
+    ensure_workers(tool)
+    return job
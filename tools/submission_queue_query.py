@@ -0,0 +1,70 @@
+# author: sawyer-shi
+
+import logging
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.deadline import deadline_invoke
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.submission_queue import ensure_workers, get_queue
+from tools.tracing import traced_invoke
+from tools.utils import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+STATUS_ICONS = {"queued": "⏳", "submitting": "🚀", "submitted": "✅", "failed": "❌"}
+
+
+class SubmissionQueueQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Report queued create requests and the Kling task IDs of submitted ones."""
+        logger.info("Starting submission queue query")
+
+        try:
+            queue = get_queue()
+            # Workers only run while the process holds this account's credentials; resume them.
+            ensure_workers(self)
+        except Exception as exc:
+            msg = f"❌ 提交队列不可用: {exc}"
+            logger.error(msg)
+            yield self.create_text_message(msg)
+            return
+
+        scope = str(self.runtime.credentials.get("access_key", ""))
+        raw_ids = str(tool_parameters.get("job_ids") or "").replace("\n", ",").split(",")
+        job_ids = [job_id.strip() for job_id in raw_ids if job_id.strip()]
+
+        if job_ids:
+            jobs = []
+            for job_id in job_ids:
+                job = queue.get(job_id)
+                if job is None or queue.scope_of(job_id) != scope:
+                    yield self.create_text_message(f"⚠️ 未找到队列任务: {job_id}")
+                    continue
+                jobs.append(job)
+        else:
+            jobs = queue.list_jobs(scope)
+
+        counts = queue.counts(scope)
+        yield self.create_text_message(
+            "📊 队列状态: "
+            + ", ".join(f"{status} {counts.get(status, 0)}" for status in STATUS_ICONS)
+        )
+        for job in jobs:
+            parts = [STATUS_ICONS.get(job["status"], "•"), job["job_id"], f"[{job['endpoint']}]", job["status"]]
+            detail = job.get("task_id") or job.get("error")
+            if detail:
+                parts.append(str(detail))
+            parts.append(f"({format_timestamp(job['created_at'] * 1000)})")
+            yield self.create_text_message(" ".join(parts))
+        if any(job["status"] == "submitted" for job in jobs):
+            yield self.create_text_message("💡 请使用对应的查询工具和任务ID获取生成结果")
+        yield self.create_json_message({"counts": counts, "jobs": jobs})
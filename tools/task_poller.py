@@ -0,0 +1,291 @@
+# author: sawyer-shi
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from tools.concurrency import map_bounded
+from tools.http_client import get_json
+from tools.key_pool import KeyPair, account_scope, sign_token, task_key_pair
+from tools.metrics import REGISTRY
+from tools.utils import build_api_url
+
+logger = logging.getLogger(__name__)
+
+TASK_POLLER_ENV = "KLING_TASK_POLLER"
+POLL_INTERVAL_ENV = "KLING_POLL_INTERVAL"
+DEFAULT_POLL_INTERVAL = 5.0
+MAX_POLL_INTERVAL = 60.0
+POLL_BACKOFF = 1.5
+POLL_CONCURRENCY = 4
+# Tasks still unfinished after this long are dropped; their query tools fall back to live GETs.
+MAX_TRACK_SECONDS = 2 * 3600.0
+MAX_CACHED_TASKS = 10000
+IDLE_EXIT_SECONDS = 30.0
+# Tokens expire 30 minutes after signing; the poller signs a fresh one well before that.
+TOKEN_REFRESH_SECONDS = 20 * 60.0
+
+TERMINAL_STATUSES = {"succeed", "failed"}
+
+
+def poller_enabled() -> bool:
+    return os.environ.get(TASK_POLLER_ENV, "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _initial_interval() -> float:
+    try:
+        return min(max(float(os.environ.get(POLL_INTERVAL_ENV, DEFAULT_POLL_INTERVAL)), 0.1), MAX_POLL_INTERVAL)
+    except ValueError:
+        return DEFAULT_POLL_INTERVAL
+
+
+def _task_key(scope: str, endpoint: str, task_id: str) -> str:
+    return f"{scope}:{endpoint}:{task_id}"
+
+
+@dataclass
+class _Pending:
+    pair: KeyPair
+    scope: str
+    endpoint: str
+    query_path: str
+    task_id: str
+    tracked_at: float
+    next_poll_at: float
+    interval: float
+    status: Optional[str] = None
+    token: Optional[str] = None
+    signed_at: float = 0.0
+
+    def auth_token(self) -> str:
+        """The query token, re-signed locally once it gets old; never touches plugin storage."""
+        now = time.monotonic()
+        if self.token is None or now - self.signed_at > TOKEN_REFRESH_SECONDS:
+            self.token = sign_token(self.pair)
+            self.signed_at = now
+        return self.token
+
+
+class TaskCache:
+    """Latest query response per task, shared by the poller and the query tools.
+
+    Entries and external-id aliases are keyed by account scope, so a task id
+    (or an external id another account happens to reuse) only ever resolves
+    to responses fetched with the same account's keys.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict[str, Any]]" = OrderedDict()
+        self._aliases: dict[str, str] = {}
+
+    def alias(self, scope: str, endpoint: str, external_task_id: str, task_id: str) -> None:
+        with self._lock:
+            self._aliases[_task_key(scope, endpoint, external_task_id)] = _task_key(scope, endpoint, task_id)
+
+    def _key(self, scope: str, endpoint: str, task_id: str) -> str:
+        key = _task_key(scope, endpoint, task_id)
+        return self._aliases.get(key, key)
+
+    def publish(self, scope: str, endpoint: str, task_id: str, resp_data: dict[str, Any]) -> None:
+        status = (resp_data.get("data") or {}).get("task_status")
+        with self._lock:
+            key = self._key(scope, endpoint, task_id)
+            self._entries[key] = {"status": status, "response": copy.deepcopy(resp_data), "at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > MAX_CACHED_TASKS:
+                self._entries.popitem(last=False)
+
+    def get(self, scope: str, endpoint: str, task_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(self._key(scope, endpoint, task_id))
+            return copy.deepcopy(entry) if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+
+
+class TaskPoller:
+    """One background loop polling every tracked task on a shared schedule.
+
+    Each tick polls all due tasks as a batch (bounded concurrency). A task's
+    interval grows by ``POLL_BACKOFF`` while its status stays the same and
+    resets when it changes; finished tasks leave the schedule.
+
+    Entries hold only the key pair that created the task and a token signed
+    from it, never the invoking tool, so polls do not depend on a session
+    that may have ended.
+    """
+
+    def __init__(self, cache: TaskCache) -> None:
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pending: dict[str, _Pending] = {}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: dict[str, list[Callable[[dict[str, Any]], None]]] = {}
+
+    def track(self, pair: KeyPair, scope: str, endpoint: str, query_path: str, task_id: str) -> None:
+        now = time.monotonic()
+        interval = _initial_interval()
+        with self._lock:
+            key = _task_key(scope, endpoint, task_id)
+            if key not in self._pending:
+                self._pending[key] = _Pending(pair, scope, endpoint, query_path, task_id, now, now + interval, interval)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="kling-task-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def on_finish(
+        self, scope: str, endpoint: str, task_id: str, callback: Callable[[dict[str, Any]], None]
+    ) -> None:
+        """Call ``callback`` with the final query response once the task finishes."""
+        entry = self.cache.get(scope, endpoint, task_id)
+        if entry is None or entry["status"] not in TERMINAL_STATUSES:
+            with self._lock:
+                self._listeners.setdefault(_task_key(scope, endpoint, task_id), []).append(callback)
+            return
+        callback(entry["response"])
+
+    def notify(self, scope: str, endpoint: str, task_id: str, resp_data: dict[str, Any]) -> None:
+        with self._lock:
+            listeners = self._listeners.pop(_task_key(scope, endpoint, task_id), [])
+        for callback in listeners:
+            try:
+                callback(resp_data)
+            except Exception as exc:
+                logger.error("Finish callback for %s task %s failed: %s", endpoint, task_id, exc)
+
+    def tracking(self, scope: str, endpoint: str, task_id: str) -> bool:
+        with self._lock:
+            return _task_key(scope, endpoint, task_id) in self._pending
+
+    def _run(self) -> None:
+        idle_since = time.monotonic()
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                for key in [key for key, item in self._pending.items() if now - item.tracked_at > MAX_TRACK_SECONDS]:
+                    del self._pending[key]
+                REGISTRY.set_gauge("kling_poller_pending_tasks", len(self._pending), "Tasks tracked by the poller.")
+                if not self._pending:
+                    if now - idle_since > IDLE_EXIT_SECONDS:
+                        self._thread = None
+                        return
+                    due, upcoming = [], now + 1.0
+                else:
+                    idle_since = now
+                    due = [item for item in self._pending.values() if item.next_poll_at <= now]
+                    upcoming = min(item.next_poll_at for item in self._pending.values())
+            if due:
+                map_bounded(self._poll, due, POLL_CONCURRENCY)
+                continue
+            self._wakeup.wait(min(max(upcoming - now, 0.0), 1.0))
+            self._wakeup.clear()
+
+    def _poll(self, item: _Pending) -> None:
+        try:
+            response = get_json(
+                build_api_url(f"{item.query_path}/{item.task_id}"),
+                item.endpoint,
+                headers={
+                    "Authorization": f"Bearer {item.auth_token()}",
+                    "Content-Type": "application/json",
+                },
+                timeout=60,
+                phase="poll",
+            )
+            resp_data = response.json() if response.status_code == 200 else None
+        except Exception as exc:
+            logger.debug("Poll of %s task %s failed: %s", item.endpoint, item.task_id, exc)
+            resp_data = None
+
+        data = (resp_data or {}).get("data") or {}
+        status = data.get("task_status") if resp_data and resp_data.get("code") == 0 else None
+        if status:
+            self.cache.publish(item.scope, item.endpoint, item.task_id, resp_data)
+        with self._lock:
+            if status in TERMINAL_STATUSES:
+                self._pending.pop(_task_key(item.scope, item.endpoint, item.task_id), None)
+            else:
+                changed = status is not None and status != item.status
+                item.status = status or item.status
+                item.interval = _initial_interval() if changed else min(item.interval * POLL_BACKOFF, MAX_POLL_INTERVAL)
+                item.next_poll_at = time.monotonic() + item.interval
+        if status in TERMINAL_STATUSES:
+            REGISTRY.count_event("poller_finished", item.endpoint)
+            self.notify(item.scope, item.endpoint, item.task_id, resp_data)
+
+
+TASK_CACHE = TaskCache()
+POLLER = TaskPoller(TASK_CACHE)
+
+
+def track_task(
+    credentials: dict[str, Any],
+    endpoint: str,
+    query_path: str,
+    resp_data: dict[str, Any],
+    payload: Optional[dict[str, Any]] = None,
+) -> None:
+    """Hand an accepted or unfinished task to the background poller (``KLING_TASK_POLLER=1``).
+
+    Tasks created with a ``callback_url`` are left to the callback and never polled.
+    """
+    data = resp_data.get("data") or {}
+    task_id = data.get("task_id")
+    payload = payload or {}
+    if not task_id or not poller_enabled() or data.get("task_status") in TERMINAL_STATUSES:
+        return
+    if payload.get("callback_url"):
+        return
+    scope = account_scope(credentials)
+    if payload.get("external_task_id"):
+        TASK_CACHE.alias(scope, endpoint, str(payload["external_task_id"]), str(task_id))
+    try:
+        pair = task_key_pair(credentials, str(task_id))
+    except ValueError:
+        return
+    POLLER.track(pair, scope, endpoint, query_path, str(task_id))
+
+
+def publish_task(credentials: dict[str, Any], endpoint: str, query_path: str, task_id: str, resp_data: dict[str, Any]) -> None:
+    """Record a query tool's own response and keep polling the task if it is unfinished."""
+    if resp_data.get("code") != 0:
+        return
+    scope = account_scope(credentials)
+    resolved = (resp_data.get("data") or {}).get("task_id")
+    if resolved and str(resolved) != task_id:
+        # Queried by external_task_id: keep one entry under the Kling task id.
+        TASK_CACHE.alias(scope, endpoint, task_id, str(resolved))
+    TASK_CACHE.publish(scope, endpoint, task_id, resp_data)
+    if (resp_data.get("data") or {}).get("task_status") in TERMINAL_STATUSES:
+        POLLER.notify(scope, endpoint, str(resolved or task_id), resp_data)
+    track_task(credentials, endpoint, query_path, resp_data)
+
+
+def cached_task(credentials: dict[str, Any], endpoint: str, task_id: str) -> Optional[dict[str, Any]]:
+    """The cached response for ``task_id`` when it can stand in for a live query.
+
+    Only responses fetched for the same account are served. Finished tasks are
+    always served; unfinished ones only while the poller keeps them fresh.
+    """
+    scope = account_scope(credentials)
+    entry = TASK_CACHE.get(scope, endpoint, task_id)
+    if entry is None:
+        return None
+    resolved = (entry["response"].get("data") or {}).get("task_id") or task_id
+    if entry["status"] not in TERMINAL_STATUSES and not (
+        poller_enabled() and POLLER.tracking(scope, endpoint, resolved)
+    ):
+        return None
+    REGISTRY.count_event("task_cache_hit", endpoint)
+    return entry["response"]
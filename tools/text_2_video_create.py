@@ -9,12 +9,30 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import build_watermark_info, get_api_token, parse_json_param
+from tools.deadline import deadline_invoke
+from tools.memo import load_memo, memo_key_for, save_memo
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.singleflight import post_create
+from tools.submission_queue import enqueue_create, queue_requested
+from tools.task_poller import track_task
+from tools.tracing import traced_invoke
+from tools.utils import (
+    build_api_url,
+    build_watermark_info,
+    get_api_token,
+    parse_json_param,
+)
+from tools.validation import validate_tool_parameters
 
 logger = logging.getLogger(__name__)
 
 
 class Text2VideoCreateTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling text-to-video create task."""
         logger.info("Starting text-to-video create task")
@@ -27,6 +45,13 @@ class Text2VideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        errors = validate_tool_parameters("text_2_video_create", tool_parameters)
+        if errors:
+            msg = f"❌ 参数校验失败: {'; '.join(errors)}"
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
         prompt = (tool_parameters.get("prompt") or "").strip()
         if not prompt:
             msg = "❌ 请输入提示词"
@@ -34,7 +59,7 @@ class Text2VideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
-        api_url = "https://api-beijing.klingai.com/v1/videos/text2video"
+        api_url = build_api_url("v1/videos/text2video")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -98,6 +123,27 @@ class Text2VideoCreateTool(Tool):
         if external_task_id:
             payload["external_task_id"] = external_task_id
 
+        scope = self.runtime.credentials.get("access_key", "")
+        memo_key = memo_key_for(tool_parameters, "text2video", payload, scope)
+        memoized = load_memo(self, memo_key, "text2video")
+        if memoized:
+            yield self.create_text_message(f"♻️ 命中生成缓存，复用任务: {memoized['data'].get('task_id')}")
+            yield self.create_json_message(memoized)
+            return
+
+        if queue_requested(tool_parameters):
+            try:
+                job = enqueue_create(self, "text2video", "v1/videos/text2video", payload)
+            except Exception as exc:
+                msg = f"❌ 加入提交队列失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            yield self.create_text_message(f"📥 已加入提交队列，队列任务ID: {job['job_id']}")
+            yield self.create_text_message("💡 请使用提交队列查询工具获取可灵任务ID")
+            yield self.create_json_message(job)
+            return
+
         yield self.create_text_message("🚀 文生视频任务启动中...")
         yield self.create_text_message(f"🤖 模型: {model_name}")
         yield self.create_text_message(
@@ -107,7 +153,15 @@ class Text2VideoCreateTool(Tool):
 
         try:
             logger.info("Submitting text2video payload: %s", json.dumps(payload, ensure_ascii=False))
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response, shared = post_create(
+                api_url,
+                "text2video",
+                headers=headers,
+                payload=payload,
+                scope=scope,
+                timeout=60,
+                credentials=self.runtime.credentials,
+            )
         except requests.exceptions.Timeout:
             msg = "❌ 请求超时，请稍后重试"
             logger.error(msg)
@@ -119,6 +173,9 @@ class Text2VideoCreateTool(Tool):
             yield self.create_text_message(msg)
             return
 
+        if shared:
+            yield self.create_text_message("♻️ 检测到相同的请求，已复用同一任务")
+
         if response.status_code != 200:
             logger.error("API status %s: %s", response.status_code, response.text[:300])
             yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
@@ -150,4 +207,6 @@ class Text2VideoCreateTool(Tool):
         if task_status:
             yield self.create_text_message(f"📊 状态: {task_status}")
         yield self.create_text_message("💡 请使用文生视频查询工具获取结果")
+        save_memo(self, memo_key, resp_data)
+        track_task(self.runtime.credentials, "text2video", "v1/videos/text2video", resp_data, payload)
         yield self.create_json_message(resp_data)
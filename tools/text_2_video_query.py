@@ -9,35 +9,56 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
-from tools.utils import format_timestamp, get_api_token, resolve_task_id
+from tools.deadline import deadline_invoke
+from tools.http_client import get_json
+from tools.key_pool import get_task_api_token
+from tools.memo import record_task_outcome
+from tools.memory_budget import deliver_download
+from tools.object_sink import result_sink
+from tools.output_mode import compact_output
+from tools.profiling import profiled_invoke
+from tools.task_poller import cached_task, publish_task
+from tools.tracing import traced_invoke
+from tools.utils import build_api_url, format_timestamp, resolve_task_id
 
 logger = logging.getLogger(__name__)
 
 
 class Text2VideoQueryTool(Tool):
+    @compact_output
+    @profiled_invoke
+    @traced_invoke
+    @deadline_invoke
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         """Kling text-to-video single task query."""
         logger.info("Starting text-to-video query task")
 
         try:
-            api_token = get_api_token(self.runtime)
+            task_id = resolve_task_id(tool_parameters)
+        except ValueError as exc:
+            msg = str(exc)
+            logger.warning(msg)
+            yield self.create_text_message(msg)
+            return
+
+        try:
+            api_token = get_task_api_token(self, task_id)
         except Exception as exc:
             msg = f"❌ 凭证获取失败: {exc}"
             logger.error(msg)
             yield self.create_text_message(msg)
             return
 
+        download_video = tool_parameters.get("download_video", "false") == "true"
         try:
-            task_id = resolve_task_id(tool_parameters)
+            sink = result_sink(self, tool_parameters)
         except ValueError as exc:
-            msg = str(exc)
+            msg = f"❌ {exc}"
             logger.warning(msg)
             yield self.create_text_message(msg)
             return
 
-        download_video = tool_parameters.get("download_video", "false") == "true"
-
-        api_url = f"https://api-beijing.klingai.com/v1/videos/text2video/{task_id}"
+        api_url = build_api_url(f"v1/videos/text2video/{task_id}")
         headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json",
@@ -47,40 +68,47 @@ class Text2VideoQueryTool(Tool):
         yield self.create_text_message(f"📋 任务ID: {task_id}")
         if download_video:
             yield self.create_text_message("⬇️ 下载选项已开启")
-
-        try:
-            response = requests.get(api_url, headers=headers, timeout=60)
-        except requests.exceptions.Timeout:
-            msg = "❌ 请求超时，请稍后重试"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-        except requests.exceptions.RequestException as exc:
-            msg = f"❌ 请求失败: {exc}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            return
-
-        if response.status_code != 200:
-            logger.error("API status %s: %s", response.status_code, response.text[:300])
-            yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
-            if response.text:
-                yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
-            return
-
-        try:
-            resp_data = response.json()
-        except json.JSONDecodeError as exc:
-            logger.error("Failed to parse JSON: %s", exc)
-            yield self.create_text_message("❌ API 响应解析失败（非JSON）")
-            return
-
-        if resp_data.get("code") != 0:
-            msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
-            logger.error(msg)
-            yield self.create_text_message(msg)
-            yield self.create_json_message(resp_data)
-            return
+        if sink is not None:
+            yield self.create_text_message("☁️ 结果将直接转存到对象存储")
+
+        resp_data = cached_task(self.runtime.credentials, "text2video", task_id)
+        if resp_data is not None:
+            yield self.create_text_message("⚡ 命中本地任务缓存（后台轮询）")
+        else:
+            try:
+                response = get_json(api_url, "text2video", headers=headers, timeout=60)
+            except requests.exceptions.Timeout:
+                msg = "❌ 请求超时，请稍后重试"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+            except requests.exceptions.RequestException as exc:
+                msg = f"❌ 请求失败: {exc}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+
+            if response.status_code != 200:
+                logger.error("API status %s: %s", response.status_code, response.text[:300])
+                yield self.create_text_message(f"❌ API 响应状态码: {response.status_code}")
+                if response.text:
+                    yield self.create_text_message(f"🔧 响应内容: {response.text[:500]}")
+                return
+
+            try:
+                resp_data = response.json()
+            except json.JSONDecodeError as exc:
+                logger.error("Failed to parse JSON: %s", exc)
+                yield self.create_text_message("❌ API 响应解析失败（非JSON）")
+                return
+
+            if resp_data.get("code") != 0:
+                msg = f"❌ 查询失败: {resp_data.get('message', '未知错误')}"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                yield self.create_json_message(resp_data)
+                return
+            publish_task(self.runtime.credentials, "text2video", "v1/videos/text2video", task_id, resp_data)
 
         data = resp_data.get("data", {})
         task_status = data.get("task_status")
@@ -88,6 +116,7 @@ class Text2VideoQueryTool(Tool):
         created_at = format_timestamp(data.get("created_at"))
         updated_at = format_timestamp(data.get("updated_at"))
         task_result = data.get("task_result", {})
+        record_task_outcome(self, task_id, task_status, task_result)
         videos = task_result.get("videos", []) if isinstance(task_result, dict) else []
 
         yield self.create_text_message("✅ 查询成功")
@@ -106,22 +135,25 @@ class Text2VideoQueryTool(Tool):
                 yield self.create_text_message(f"#{idx} 时长: {duration}s")
                 if url:
                     yield self.create_text_message(f"链接: {url}")
-                    if download_video:
+                    if sink is not None:
+                        yield from sink.upload(url, "text2video", f"{task_id}_{idx}.mp4", "video/mp4")
+                    elif download_video:
                         yield self.create_text_message("⬇️ 正在下载视频文件...")
                         try:
-                            video_response = requests.get(url, timeout=120)
-                            if video_response.status_code == 200:
-                                yield self.create_blob_message(
-                                    blob=video_response.content,
-                                    meta={
-                                        "mime_type": "video/mp4",
-                                        "filename": f"{task_id}_{idx}.mp4",
-                                    },
-                                )
+                            status = yield from deliver_download(
+                                self,
+                                url,
+                                "text2video",
+                                meta={
+                                    "mime_type": "video/mp4",
+                                    "filename": f"{task_id}_{idx}.mp4",
+                                },
+                            )
+                            if status == 200:
                                 yield self.create_text_message("✅ 视频下载完成")
                             else:
                                 yield self.create_text_message(
-                                    f"❌ 视频下载失败，状态码: {video_response.status_code}"
+                                    f"❌ 视频下载失败，状态码: {status}"
                                 )
                         except requests.exceptions.RequestException as exc:
                             yield self.create_text_message(f"❌ 视频下载失败: {exc}")
@@ -129,4 +161,6 @@ class Text2VideoQueryTool(Tool):
                     yield self.create_text_message(f"水印链接: {watermark_url}")
             yield self.create_text_message("⚠️ 生成的视频将于30天后清理，请及时转存")
 
+        if sink is not None:
+            resp_data["objects"] = sink.objects
         yield self.create_json_message(resp_data)
@@ -0,0 +1,124 @@
+# author: sawyer-shi
+
+import functools
+import importlib
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+TRACER_NAME = "kling_aigc"
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def set_status(self, status: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_otel: Optional[dict[str, Any]] = None
+
+
+def _load_otel() -> dict[str, Any]:
+    """Import OpenTelemetry once; an empty dict means tracing is disabled."""
+    global _otel
+    if _otel is None:
+        try:
+            trace = importlib.import_module("opentelemetry.trace")
+            propagate = importlib.import_module("opentelemetry.propagate")
+        except ImportError:
+            _otel = {}
+        else:
+            _otel = {
+                "trace": trace,
+                "propagate": propagate,
+                "tracer": trace.get_tracer(TRACER_NAME),
+            }
+    return _otel
+
+
+def _set_attributes(target: Any, attributes: dict[str, Any]) -> None:
+    for key, value in attributes.items():
+        if value is not None:
+            target.set_attribute(key, value)
+
+
+def _record_error(target: Any, exc: BaseException) -> None:
+    otel = _load_otel()
+    target.record_exception(exc)
+    if otel:
+        target.set_status(otel["trace"].Status(otel["trace"].StatusCode.ERROR, str(exc)))
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Open a child span of the current trace, or a no-op span without OpenTelemetry."""
+    otel = _load_otel()
+    if not otel:
+        yield _NOOP_SPAN
+        return
+    with otel["tracer"].start_as_current_span(name, record_exception=False) as current:
+        _set_attributes(current, attributes)
+        try:
+            yield current
+        except BaseException as exc:
+            _record_error(current, exc)
+            raise
+
+
+def inject_headers(headers: Optional[dict[str, str]]) -> dict[str, str]:
+    """Return a copy of headers carrying the current trace context, if any."""
+    carrier = dict(headers or {})
+    otel = _load_otel()
+    if otel:
+        otel["propagate"].inject(carrier)
+    return carrier
+
+
+def traced_invoke(func: Callable[..., Generator]) -> Callable[..., Generator]:
+    """Run a tool's ``_invoke`` generator inside a root span.
+
+    The span is only made current while the generator body runs, so the
+    context never leaks into the caller between yielded messages.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, tool_parameters: dict[str, Any]) -> Generator:
+        otel = _load_otel()
+        if not otel:
+            yield from func(self, tool_parameters)
+            return
+
+        root = otel["tracer"].start_span(f"{type(self).__name__}._invoke")
+        root.set_attribute("kling.tool", type(self).__name__)
+        generator = func(self, tool_parameters)
+        messages = 0
+        try:
+            while True:
+                with otel["trace"].use_span(
+                    root, end_on_exit=False, record_exception=False, set_status_on_exception=False
+                ):
+                    try:
+                        message = next(generator)
+                    except StopIteration:
+                        break
+                messages += 1
+                yield message
+        except BaseException as exc:
+            if not isinstance(exc, GeneratorExit):
+                _record_error(root, exc)
+            raise
+        finally:
+            generator.close()
+            root.set_attribute("kling.messages", messages)
+            root.end()
+
+    return wrapper
@@ -1,20 +1,43 @@
 # author: sawyer-shi
 
 import base64
+import functools
+import hashlib
+import ipaddress
 import json
 import logging
+import os
+import socket
 from datetime import datetime
 from typing import Any, Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
-from provider.kling_aigc import KlingAigcProvider
+from provider.kling_aigc import API_BASE_URL, KlingAigcProvider
+from tools.concurrency import DEFAULT_CONCURRENCY, clamp_concurrency, map_bounded
+from tools.metrics import REGISTRY, timed
+from tools.tracing import span
 
 logger = logging.getLogger(__name__)
 
+MEDIA_POLICY_ENV = "KLING_MEDIA_POLICY"
+# Files smaller than this are inlined under the "auto" policy; the saving is not worth a remote fetch.
+DEFAULT_URL_MIN_BYTES = 256 * 1024
+MEDIA_POLICIES = {"auto", "url", "inline"}
+MEDIA_CONCURRENCY_ENV = "KLING_MEDIA_CONCURRENCY"
+# Query parameters of signed URLs (Dify file links, presigned object storage) that change on every request.
+SIGNATURE_PARAMS = frozenset({"sign", "signature", "timestamp", "nonce", "expires", "token"})
+SIGNATURE_PARAM_PREFIXES = ("x-amz-", "x-goog-", "x-oss-")
+
+
+def build_api_url(path: str) -> str:
+    return f"{API_BASE_URL}/{path.lstrip('/')}"
+
 
 def get_api_token(runtime) -> str:
     credentials = runtime.credentials
-    return KlingAigcProvider.get_api_token(credentials)
+    with span("kling.auth.token_sign"), timed("auth", "token_sign"):
+        return KlingAigcProvider.get_api_token(credentials)
 
 
 def parse_json_param(value: Any, name: str) -> Optional[Any]:
@@ -33,10 +56,84 @@ def parse_json_param(value: Any, name: str) -> Optional[Any]:
     raise ValueError(f"{name} 参数类型不支持")
 
 
-def resolve_media_input(value: Any) -> Optional[str]:
+def resolve_media_input(value: Any, field: str = "image", policy: Optional[str] = None) -> Optional[str]:
+    """A Kling media field value: the file's URL when ``field``'s policy allows it, else base64.
+
+    ``policy`` overrides the configured policy, e.g. ``"inline"`` for payloads
+    sent later, after a signed file URL may have expired.
+    """
     if value is None:
         return None
+    with span("kling.media.resolve", **{"kling.media.type": type(value).__name__, "kling.media.field": field}) as current:
+        media = _encode_media(value, field, policy)
+        current.set_attribute("kling.media.length", len(media) if media else 0)
+        return media
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_media_policies(raw: str) -> dict[str, tuple[str, int]]:
+    policies = {"*": ("auto", DEFAULT_URL_MIN_BYTES)}
+    for item in raw.split(","):
+        field, _, rule = item.partition("=")
+        policy, _, min_bytes = rule.strip().lower().partition(":")
+        if not field.strip() or policy not in MEDIA_POLICIES:
+            if item.strip():
+                logger.warning("Ignoring invalid %s entry: %s", MEDIA_POLICY_ENV, item.strip())
+            continue
+        try:
+            threshold = int(min_bytes) if min_bytes else DEFAULT_URL_MIN_BYTES
+        except ValueError:
+            threshold = DEFAULT_URL_MIN_BYTES
+        policies[field.strip()] = (policy, max(threshold, 0))
+    return policies
+
+
+def media_policy(field: str) -> tuple[str, int]:
+    """``(policy, min_bytes)`` for ``field`` from ``KLING_MEDIA_POLICY`` (``field=policy[:min_bytes]``, ``*`` for all)."""
+    policies = _parse_media_policies(os.environ.get(MEDIA_POLICY_ENV, ""))
+    return policies.get(field) or policies["*"]
+
+
+@functools.lru_cache(maxsize=256)
+def _public_host(host: str) -> bool:
+    """Whether ``host`` resolves only to public addresses (Kling cannot fetch from private networks)."""
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        if "." not in host or host.endswith((".local", ".internal", ".localhost")):
+            return False
+        try:
+            addresses = [ipaddress.ip_address(info[4][0]) for info in socket.getaddrinfo(host, None)]
+        except (OSError, ValueError):
+            return False
+    return bool(addresses) and all(address.is_global for address in addresses)
+
+
+def _hosted_url(value: Any, field: str, override: Optional[str] = None) -> Optional[str]:
+    """The file's own URL when ``field``'s policy lets Kling fetch it instead of inlining the bytes."""
+    url = getattr(value, "url", None)
+    if not isinstance(url, str) or urlsplit(url).scheme not in {"http", "https"}:
+        return None
+    policy, min_bytes = media_policy(field)
+    policy = override or policy
+    if policy == "inline":
+        return None
+    if policy == "auto":
+        size = getattr(value, "size", None)
+        if isinstance(size, int) and size < min_bytes:
+            return None
+        if not _public_host(urlsplit(url).hostname or ""):
+            return None
+    return url
+
+
+def _encode_media(value: Any, field: str = "image", policy: Optional[str] = None) -> Optional[str]:
     if hasattr(value, "blob"):
+        url = _hosted_url(value, field, policy)
+        if url:
+            REGISTRY.count_event("media_url_passthrough", field)
+            return url
+        REGISTRY.count_event("media_inlined", field)
         return base64.b64encode(value.blob).decode("utf-8")
     if hasattr(value, "read") and callable(getattr(value, "read")):
         data = value.read()
@@ -57,13 +154,19 @@ def resolve_media_input(value: Any) -> Optional[str]:
 
 
 def resolve_files_to_list(
-    files: Iterable[Any], field_name: str = "image_url"
+    files: Iterable[Any], field_name: str = "image_url", field: str = "image_list", policy: Optional[str] = None
 ) -> list[dict[str, str]]:
-    result: list[dict[str, str]] = []
-    for item in files:
-        media = resolve_media_input(item)
-        if media:
-            result.append({field_name: media})
+    """Resolve every file concurrently (``KLING_MEDIA_CONCURRENCY``), keeping input order.
+
+    Loading a Dify file's ``blob`` is a download, so resolving several at once
+    overlaps those round trips. The first failure is raised.
+    """
+    items = list(files)
+    concurrency = clamp_concurrency(os.environ.get(MEDIA_CONCURRENCY_ENV, DEFAULT_CONCURRENCY))
+    with span("kling.media.resolve_list", **{"kling.media.field": field_name}) as current:
+        resolved = map_bounded(lambda item: resolve_media_input(item, field, policy), items, concurrency)
+        result = [{field_name: media} for media in resolved if media]
+        current.set_attribute("kling.media.count", len(result))
     return result
 
 
@@ -108,6 +211,55 @@ def resolve_task_id(tool_parameters: dict[str, Any]) -> str:
     raise ValueError("❌ 请输入 task_id 或 external_task_id")
 
 
+MEDIA_PAYLOAD_KEYS = frozenset(
+    {"image", "image_tail", "image_url", "static_mask", "mask", "frontal_image", "video_url"}
+)
+# Request fields that never change the generated result and are left out of payload hashes.
+UNHASHED_PAYLOAD_KEYS = frozenset({"callback_url"})
+
+
+def strip_signature(url: str) -> str:
+    """``url`` without signature query parameters, so two links to the same file compare equal."""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in SIGNATURE_PARAMS and not name.lower().startswith(SIGNATURE_PARAM_PREFIXES)
+    ]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _normalize_for_hash(value: Any, key: Optional[str] = None) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: _normalize_for_hash(v, k)
+            for k, v in sorted(value.items())
+            if k not in UNHASHED_PAYLOAD_KEYS
+        }
+    if isinstance(value, list):
+        return [_normalize_for_hash(item, key) for item in value]
+    if isinstance(value, str) and key in MEDIA_PAYLOAD_KEYS and value.startswith(("http://", "https://")):
+        return strip_signature(value)
+    if isinstance(value, str) and key in MEDIA_PAYLOAD_KEYS and len(value) > 256:
+        return "sha256:" + hashlib.sha256(value.encode("utf-8")).hexdigest()
+    return value
+
+
+def canonical_payload_hash(endpoint: str, payload: dict[str, Any], scope: str = "") -> str:
+    """Stable digest of a create request.
+
+    Inline media is reduced to content digests and media URLs lose their
+    signature parameters, so re-signed links to the same file share a key.
+    """
+    normalized = _normalize_for_hash(payload)
+    text = json.dumps(
+        [endpoint, scope, normalized], sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 def handle_credential_error(err: Exception) -> str:
     if isinstance(err, ToolProviderCredentialValidationError):
         return f"❌ 凭证错误: {err}"
@@ -0,0 +1,218 @@
+# author: sawyer-shi
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+VALIDATION_ENV = "KLING_LOCAL_VALIDATION"
+
+_LEGACY_DURATIONS = ("5", "10")
+_O1_DURATIONS = tuple(str(value) for value in range(3, 11))
+_V3_DURATIONS = tuple(str(value) for value in range(3, 16))
+
+_LEGACY_VIDEO = {"durations": _LEGACY_DURATIONS, "multi_shot": False}
+_V3_VIDEO = {"durations": _V3_DURATIONS, "multi_shot": True}
+
+# Per-tool, per-model limits that the YAML schemas cannot express.
+MODEL_CAPABILITIES: dict[str, dict[str, dict[str, Any]]] = {
+    "text_2_video_create": {
+        "kling-v1": _LEGACY_VIDEO,
+        "kling-v1-6": _LEGACY_VIDEO,
+        "kling-v2-master": _LEGACY_VIDEO,
+        "kling-v2-1-master": _LEGACY_VIDEO,
+        "kling-v2-5-turbo": _LEGACY_VIDEO,
+        "kling-v2-6": _LEGACY_VIDEO,
+        "kling-v3": _V3_VIDEO,
+    },
+    "image_2_video_create": {
+        "kling-v1": _LEGACY_VIDEO,
+        "kling-v1-5": _LEGACY_VIDEO,
+        "kling-v1-6": _LEGACY_VIDEO,
+        "kling-v2-master": _LEGACY_VIDEO,
+        "kling-v2-1": _LEGACY_VIDEO,
+        "kling-v2-1-master": _LEGACY_VIDEO,
+        "kling-v2-5-turbo": _LEGACY_VIDEO,
+        "kling-v2-6": _LEGACY_VIDEO,
+        "kling-v3": _V3_VIDEO,
+    },
+    "omni_video_create": {
+        "kling-video-o1": {"durations": _O1_DURATIONS, "multi_shot": False, "max_images": 7},
+        "kling-v3-omni": {"durations": _V3_DURATIONS, "multi_shot": True, "max_images": 7},
+    },
+    "omni_image_create": {
+        "kling-image-o1": {"max_images": 10},
+        "kling-v3-omni": {"max_images": 10},
+    },
+}
+
+NUMBER_RANGES: dict[str, tuple[float, float]] = {
+    "cfg_scale": (0.0, 1.0),
+    "n": (1, 9),
+    "series_amount": (2, 9),
+}
+
+LIST_LIMITS: dict[str, dict[str, tuple[int, int]]] = {
+    "element_create": {"element_refer_images": (1, 3)},
+}
+
+Check = Callable[[dict[str, Any]], Optional[str]]
+
+_compiled: dict[str, list[Check]] = {}
+_compile_lock = threading.Lock()
+
+
+def _is_blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _select_check(name: str, options: frozenset[str]) -> Check:
+    def check(params: dict[str, Any]) -> Optional[str]:
+        value = params.get(name)
+        if _is_blank(value) or str(value) in options:
+            return None
+        return f"{name}={value} 不是有效选项 (可选: {', '.join(sorted(options))})"
+
+    return check
+
+
+def _number_check(name: str, low: Optional[float], high: Optional[float]) -> Check:
+    def check(params: dict[str, Any]) -> Optional[str]:
+        value = params.get(name)
+        if _is_blank(value):
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return f"{name} 需要为数字"
+        if (low is not None and number < low) or (high is not None and number > high):
+            return f"{name}={value} 超出范围 [{low}, {high}]"
+        return None
+
+    return check
+
+
+def _json_check(name: str) -> Check:
+    def check(params: dict[str, Any]) -> Optional[str]:
+        value = params.get(name)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError as exc:
+            return f"{name} 参数需要有效的 JSON 字符串 ({exc.msg}, 第 {exc.pos} 个字符)"
+        if not isinstance(parsed, (list, dict)):
+            return f"{name} 参数需要 JSON 数组或对象"
+        return None
+
+    return check
+
+
+def _list_length(value: Any) -> Optional[int]:
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, str) and value.strip():
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            return None
+        return len(parsed) if isinstance(parsed, list) else None
+    return None
+
+
+def _list_limit_check(name: str, low: int, high: int) -> Check:
+    def check(params: dict[str, Any]) -> Optional[str]:
+        length = _list_length(params.get(name))
+        if not length or low <= length <= high:
+            return None
+        return f"{name} 数量为 {length}，需要在 {low}-{high} 之间"
+
+    return check
+
+
+def _model_check(tool_name: str, default_model: Optional[str]) -> Check:
+    capabilities = MODEL_CAPABILITIES[tool_name]
+
+    def check(params: dict[str, Any]) -> Optional[str]:
+        model = params.get("model_name") or default_model
+        limits = capabilities.get(str(model))
+        if not limits:
+            return None
+        errors = []
+        duration = params.get("duration")
+        durations = limits.get("durations")
+        if durations and not _is_blank(duration) and str(duration) not in durations:
+            errors.append(f"模型 {model} 不支持 duration={duration} (可选: {', '.join(durations)})")
+        if limits.get("multi_shot") is False and str(params.get("multi_shot")).lower() == "true":
+            errors.append(f"模型 {model} 不支持 multi_shot")
+        max_images = limits.get("max_images")
+        length = _list_length(params.get("image_list"))
+        if max_images and length is not None and length > max_images:
+            errors.append(f"模型 {model} 的 image_list 最多 {max_images} 张，当前 {length} 张")
+        return "; ".join(errors) or None
+
+    return check
+
+
+def _load_schema(tool_name: str) -> dict[str, Any]:
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(os.path.join(TOOLS_DIR, f"{tool_name}.yaml"), encoding="utf-8") as handle:
+        return yaml.load(handle, Loader=loader) or {}
+
+
+def compile_validators(tool_name: str) -> list[Check]:
+    """Build the checks for one tool from its YAML schema and the capability table."""
+    checks: list[Check] = []
+    default_model = None
+    for param in _load_schema(tool_name).get("parameters") or []:
+        name = param.get("name")
+        param_type = param.get("type")
+        options = frozenset(str(option["value"]) for option in param.get("options") or [])
+        if name == "model_name":
+            default_model = param.get("default")
+        if options:
+            checks.append(_select_check(name, options))
+        elif param_type == "number":
+            low, high = NUMBER_RANGES.get(name, (param.get("min"), param.get("max")))
+            checks.append(_number_check(name, low, high))
+        description = (param.get("human_description") or {}).get("en_US", "")
+        if param_type in {"string", "files"} and "JSON string" in description:
+            checks.append(_json_check(name))
+
+    for name, (low, high) in LIST_LIMITS.get(tool_name, {}).items():
+        checks.append(_list_limit_check(name, low, high))
+    if tool_name in MODEL_CAPABILITIES:
+        checks.append(_model_check(tool_name, default_model))
+    return checks
+
+
+def _validators(tool_name: str) -> list[Check]:
+    checks = _compiled.get(tool_name)
+    if checks is None:
+        with _compile_lock:
+            checks = _compiled.get(tool_name)
+            if checks is None:
+                checks = _compiled[tool_name] = compile_validators(tool_name)
+    return checks
+
+
+def validate_tool_parameters(tool_name: str, tool_parameters: dict[str, Any]) -> list[str]:
+    """Return every local validation error for a call, before any upload happens.
+
+    Validators are compiled once per tool on first use. Set
+    ``KLING_LOCAL_VALIDATION=0`` to skip local checks entirely.
+    """
+    if os.environ.get(VALIDATION_ENV, "1").strip().lower() in {"0", "false", "no"}:
+        return []
+    try:
+        checks = _validators(tool_name)
+    except (OSError, yaml.YAMLError) as exc:
+        logger.warning("Skipping local validation for %s: %s", tool_name, exc)
+        return []
+    return [error for error in (check(tool_parameters) for check in checks) if error]
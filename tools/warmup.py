@@ -0,0 +1,188 @@
+# author: sawyer-shi
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENV = "KLING_WARMUP"
+WARM_CONNECTIONS_ENV = "KLING_WARM_CONNECTIONS"
+WARM_HOSTS_ENV = "KLING_WARM_HOSTS"
+DNS_TTL_ENV = "KLING_DNS_TTL"
+REFRESH_ENV = "KLING_WARM_REFRESH"
+DEFAULT_WARM_CONNECTIONS = 2
+DEFAULT_DNS_TTL = 300.0
+# Below the 60s keep-alive timeout common on load balancers and CDNs.
+DEFAULT_REFRESH_SECONDS = 45.0
+# Connections are only kept warm while the plugin saw traffic within this window.
+IDLE_STOP_SECONDS = 1800.0
+WARM_TIMEOUT = 10
+
+
+def warmup_enabled() -> bool:
+    return os.environ.get(WARMUP_ENV, "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_float(name: str, default: float, minimum: float) -> float:
+    try:
+        return max(float(os.environ.get(name, default)), minimum)
+    except ValueError:
+        return default
+
+
+def _origin(url: str) -> Optional[str]:
+    parts = urlsplit(url)
+    if parts.scheme not in {"http", "https"} or not parts.hostname:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class DnsCache:
+    """TTL cache in front of ``socket.getaddrinfo`` for the hosts being kept warm."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[Any, ...], tuple[float, Any]] = {}
+        self._hosts: set[str] = set()
+        self._resolve = None
+
+    def add_host(self, host: str) -> None:
+        with self._lock:
+            self._hosts.add(host.lower())
+
+    def install(self) -> None:
+        """Wrap ``socket.getaddrinfo`` (after gevent's patch, so lookups stay cooperative)."""
+        with self._lock:
+            if self._resolve is not None:
+                return
+            self._resolve = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def getaddrinfo(self, host: Any, port: Any, *args: Any, **kwargs: Any) -> Any:
+        resolve = self._resolve
+        name = host.decode("ascii") if isinstance(host, bytes) else host
+        if not isinstance(name, str) or name.lower() not in self._hosts:
+            return resolve(host, port, *args, **kwargs)
+        key = (name.lower(), port, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            REGISTRY.count_event("dns_cache_hit", name)
+            return entry[1]
+        result = resolve(host, port, *args, **kwargs)
+        with self._lock:
+            self._entries[key] = (now + _env_float(DNS_TTL_ENV, DEFAULT_DNS_TTL, 1.0), result)
+        return result
+
+
+class Warmer:
+    """Opens pooled keep-alive connections to known origins and refreshes idle ones.
+
+    Origins are the Kling API, ``KLING_WARM_HOSTS`` and every host a tool has
+    talked to since (result CDNs). A connection is re-opened when its origin
+    has been idle for ``KLING_WARM_REFRESH`` seconds, before servers drop it.
+    """
+
+    def __init__(self, dns: DnsCache) -> None:
+        self.dns = dns
+        self._lock = threading.Lock()
+        self._last_used: dict[str, float] = {}
+        self._last_activity = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._started = False
+
+    def note(self, url: str) -> None:
+        if not self._started:
+            return
+        origin = _origin(url)
+        if origin is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._last_activity = now
+            if origin not in self._last_used:
+                self.dns.add_host(urlsplit(origin).hostname or "")
+            self._last_used[origin] = now
+        # The loop stops after a long idle spell; new traffic brings it back.
+        self._ensure_thread()
+
+    def start(self, origins: list[str]) -> None:
+        self.dns.install()
+        with self._lock:
+            for origin in filter(None, map(_origin, origins)):
+                self.dns.add_host(urlsplit(origin).hostname or "")
+                # Zero makes the loop warm them right away.
+                self._last_used.setdefault(origin, 0.0)
+            self._last_activity = time.monotonic()
+            self._started = True
+        self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="kling-warmup", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            refresh = _env_float(REFRESH_ENV, DEFAULT_REFRESH_SECONDS, 1.0)
+            now = time.monotonic()
+            with self._lock:
+                if now - self._last_activity > IDLE_STOP_SECONDS:
+                    return
+                stale = [origin for origin, used in self._last_used.items() if now - used >= refresh]
+            for origin in stale:
+                self.warm(origin)
+            time.sleep(refresh / 3)
+
+    def warm(self, origin: str) -> None:
+        """Open ``KLING_WARM_CONNECTIONS`` connections to ``origin`` in parallel."""
+        from tools.concurrency import map_bounded
+        from tools.http_client import send_bytes
+
+        count = int(_env_float(WARM_CONNECTIONS_ENV, DEFAULT_WARM_CONNECTIONS, 1.0))
+        started = time.perf_counter()
+
+        def open_one(_: int) -> bool:
+            try:
+                send_bytes("HEAD", f"{origin}/", "warmup", headers={}, timeout=WARM_TIMEOUT, phase="warmup")
+                return True
+            except Exception as exc:
+                logger.debug("Warm-up request to %s failed: %s", origin, exc)
+                return False
+
+        opened = sum(map_bounded(open_one, range(count), count))
+        with self._lock:
+            self._last_used[origin] = time.monotonic()
+        REGISTRY.count_event("connections_warmed", urlsplit(origin).hostname or origin)
+        logger.debug(
+            "Warmed %d/%d connections to %s in %.1f ms", opened, count, origin, (time.perf_counter() - started) * 1000
+        )
+
+
+DNS_CACHE = DnsCache()
+WARMER = Warmer(DNS_CACHE)
+
+
+def note_origin(url: str) -> None:
+    """Record traffic to ``url``'s origin so its connections are kept warm."""
+    WARMER.note(url)
+
+
+def schedule_warmup() -> None:
+    """Start warming the Kling API and ``KLING_WARM_HOSTS`` in the background when enabled."""
+    if not warmup_enabled():
+        return
+    from provider.kling_aigc import API_BASE_URL
+
+    extra = [host.strip() for host in os.environ.get(WARM_HOSTS_ENV, "").split(",") if host.strip()]
+    WARMER.start([API_BASE_URL] + [host if "://" in host else f"https://{host}" for host in extra])